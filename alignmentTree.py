@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: alignmentTree.py
+#   Executable: python alignmentTree.py -i ORFS.aln -m upgma > ORFS.nwk
+#               python alignmentTree.py -i ORF1A.aln -m nj -d > ORF1A.nwk
+#
+#   Required module: numpy, clustalReader
+#   Purpose: identity distance matrix and UPGMA / neighbor-joining trees for the Clustal
+#            alignments of the project, replacing Biopython's DistanceCalculator('identity') and
+#            DistanceTreeConstructor in the notebook. The alignment is encoded as a 2-D uint8
+#            array and pairwise identities are computed in column blocks with one matrix
+#            product per residue symbol.
+#   Condition(s): Distances follow DistanceCalculator('identity'): 1 - identical columns /
+#                 alignment length, gap against gap counting as identical. Trees are written
+#                 in Newick format.
+#
+#################################################################################################
+
+import sys
+
+import numpy as np
+
+from clustalReader import readClustal
+
+
+def encodeAlignment(rows):
+    '''Return the aligned rows as a 2-D uint8 array (one row per sequence)'''
+    if not rows:
+        return np.zeros((0, 0), dtype=np.uint8)
+    return np.frombuffer(''.join(rows).upper().encode('ascii'), dtype=np.uint8).reshape(len(rows), -1)
+
+
+def identityDistances(alignment, blockSize=4096, ignoreGaps=False):
+    '''
+    Return the n x n identity distance matrix of an encoded alignment. Identical column counts
+    are accumulated over blocks of blockSize columns: for every symbol present in a block the
+    one-hot rows are multiplied with their transpose, so the work runs in BLAS instead of a
+    Python loop over pairs and columns. With ignoreGaps, gap against gap columns are not
+    counted as identical.
+    '''
+    count, length = alignment.shape
+    matches = np.zeros((count, count), dtype=np.float64)
+    gap = ord('-')
+    for blockStart in range(0, length, blockSize):
+        block = alignment[:, blockStart:blockStart + blockSize]
+        for symbol in np.unique(block):
+            if ignoreGaps and symbol == gap:
+                continue
+            oneHot = (block == symbol).astype(np.float32)
+            matches += oneHot @ oneHot.T
+    distances = 1 - matches / max(length, 1)
+    np.fill_diagonal(distances, 0)
+    return distances
+
+
+class TreeNode():
+    '''
+    Node of a phylogenetic tree. Leaves have a name, internal nodes have children.
+    Branch lengths are the length of the branch above the node.
+    '''
+
+    def __init__(self, name='', children=None, branchLength=0.0):
+        '''contructor: saves name, children and branch length'''
+        self.name = name
+        self.children = children or []
+        self.branchLength = branchLength
+
+    def isLeaf(self):
+        return not self.children
+
+    def leaves(self):
+        '''Return the leaf names under the node, left to right'''
+        if self.isLeaf():
+            return [self.name]
+        return [leaf for child in self.children for leaf in child.leaves()]
+
+    def toNewick(self, root=True):
+        '''Return the tree in Newick format, names with special characters are quoted'''
+        if self.isLeaf():
+            text = self.name
+            if any(char in text for char in " (),:;'[]"):
+                text = "'{}'".format(text.replace("'", "''"))
+        else:
+            text = '({})'.format(','.join(child.toNewick(False) for child in self.children))
+        if not root:
+            text += ':{:.6f}'.format(max(self.branchLength, 0.0))
+        return text + (';' if root else '')
+
+
+def upgma(distances, names):
+    '''
+    Build a UPGMA tree with the nearest-neighbor chain algorithm. Average linkage is reducible,
+    so merging reciprocal nearest neighbours as the chain finds them gives the same tree as
+    always merging the globally closest pair, in O(n^2) time; every chain step is one
+    vectorized minimum over a row of the distance matrix.
+    '''
+    count = len(names)
+    if count == 0:
+        return TreeNode()
+    distances = np.array(distances, dtype=np.float64)
+    np.fill_diagonal(distances, np.inf)
+    nodes = [TreeNode(name) for name in names]
+    heights = np.zeros(count)
+    sizes = np.ones(count)
+    active = np.ones(count, dtype=bool)
+    chain = []
+    for remaining in range(count, 1, -1):
+        if not chain:
+            chain.append(int(np.flatnonzero(active)[0]))
+        while True:
+            current = chain[-1]
+            nearest = int(np.argmin(distances[current]))
+            # prefer the previous chain element on ties, so the chain cannot cycle
+            if len(chain) > 1 and distances[current, chain[-2]] <= distances[current, nearest]:
+                nearest = chain[-2]
+            if len(chain) > 1 and nearest == chain[-2]:
+                break
+            chain.append(nearest)
+        second, first = chain.pop(), chain.pop()
+        height = distances[first, second] / 2
+        nodes[first].branchLength = height - heights[first]
+        nodes[second].branchLength = height - heights[second]
+        nodes[first] = TreeNode(children=[nodes[first], nodes[second]])
+        # size weighted average distance to the merged cluster
+        merged = (distances[first] * sizes[first] + distances[second] * sizes[second]) / (sizes[first] + sizes[second])
+        active[second] = False
+        merged[~active] = np.inf
+        merged[first] = np.inf
+        distances[first, :] = merged
+        distances[:, first] = merged
+        distances[second, :] = np.inf
+        distances[:, second] = np.inf
+        heights[first] = height
+        sizes[first] += sizes[second]
+        nodes[second] = None
+    root = nodes[int(np.flatnonzero(active)[0])]
+    root.branchLength = 0.0
+    return root
+
+
+def neighborJoining(distances, names):
+    '''
+    Build a neighbor-joining tree. The Q matrix of every step is computed with array operations
+    over the active rows, which are kept contiguous by moving the last active row into the slot
+    of a joined one.
+    '''
+    count = len(names)
+    if count == 0:
+        return TreeNode()
+    distances = np.array(distances, dtype=np.float64)
+    nodes = [TreeNode(name) for name in names]
+    size = count
+    while size > 2:
+        current = distances[:size, :size]
+        totals = current.sum(axis=1)
+        q = (size - 2) * current - totals[:, None] - totals[None, :]
+        np.fill_diagonal(q, np.inf)
+        first, second = divmod(int(np.argmin(q)), size)
+        if first > second:
+            first, second = second, first
+        pair = current[first, second]
+        # branch lengths from the joined pair to the new node
+        firstLength = pair / 2 + (totals[first] - totals[second]) / (2 * (size - 2))
+        nodes[first].branchLength = firstLength
+        nodes[second].branchLength = pair - firstLength
+        joined = TreeNode(children=[nodes[first], nodes[second]])
+        newRow = (current[first] + current[second] - pair) / 2
+        newRow[first] = 0
+        distances[first, :size] = newRow
+        distances[:size, first] = newRow
+        nodes[first] = joined
+        # keep the active rows contiguous
+        last = size - 1
+        if second != last:
+            distances[second, :size] = distances[last, :size]
+            distances[:size, second] = distances[:size, last]
+            distances[second, second] = 0
+            nodes[second] = nodes[last]
+        size -= 1
+    if size == 1:
+        return nodes[0]
+    nodes[1].branchLength = distances[0, 1]
+    nodes[0].branchLength = 0.0
+    # root at the last join: the first node becomes the parent of the second
+    if nodes[0].isLeaf():
+        return TreeNode(children=[nodes[0], nodes[1]])
+    nodes[0].children.append(nodes[1])
+    return nodes[0]
+
+
+def formatDistances(distances, names):
+    '''Return the distance matrix as a lower triangular table like Biopython prints it'''
+    lines = []
+    for row, name in enumerate(names):
+        lines.append('\t'.join([name] + ['{:.6f}'.format(value) for value in distances[row, :row + 1]]))
+    lines.append('\t' + '\t'.join(names))
+    return '\n'.join(lines)
+
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='alignmentTree.py - identity distances and UPGMA/NJ trees of an alignment',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] >output'
+            )
+        self.parser.add_argument('-i', '--input', action='store', required=True,
+                                 help='Clustal alignment file')
+        self.parser.add_argument('-m', '--method', action='store', choices=['upgma', 'nj'], default='upgma',
+                                 help='tree construction method')
+        self.parser.add_argument('-d', '--distances', action='store_true', default=False,
+                                 help='print the distance matrix in stderr')
+        self.parser.add_argument('-g', '--ignoreGaps', action='store_true', default=False,
+                                 help='do not count gap against gap columns as identical')
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+
+def main(inCL=None):
+    '''
+    Read an alignment, compute its distance matrix and write the tree in Newick format
+    '''
+    myCommandLine = CommandLine(inCL)
+    args = myCommandLine.args
+    names, rows = readClustal(args.input)
+    distances = identityDistances(encodeAlignment(rows), ignoreGaps=args.ignoreGaps)
+    if args.distances:
+        sys.stderr.write('Distance Matrix\n===================\n' + formatDistances(distances, names) + '\n')
+    builder = upgma if args.method == 'upgma' else neighborJoining
+    sys.stdout.write(builder(distances, names).toNewick() + '\n')
+
+if __name__ == "__main__":
+    main()
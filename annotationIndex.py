@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: annotationIndex.py
+#   Required module: None
+#   Purpose: interval index of named features (genes, ORFs) keyed by accession. Features are
+#            kept in sorted arrays of start positions read as an implicit interval tree (every
+#            node stores the furthest end of its subtree), so overlap, best match and nearest
+#            feature lookups cost O(log n) plus the features reported, even when a long
+#            feature such as ORF1ab spans most of the others.
+#   Condition(s): Coordinates follow the ORF headers of fastaFinder.py (bedtools style:
+#                 0-based start, exclusive end). GFF features are converted on load.
+#
+#################################################################################################
+
+from bisect import bisect_left, bisect_right
+
+
+def parseRegion(region):
+    '''
+    Split a region such as NC_045512.2:266-13483 into (accession, start, end).
+    Return None when the string is not a region.
+    '''
+    accession, _, interval = region.rpartition(':')
+    start, _, end = interval.partition('-')
+    if not accession or not start.isdigit() or not end.isdigit():
+        return None
+    return accession, int(start), int(end)
+
+
+def treeEnds(ends):
+    '''
+    Return (subtree ends, root level) of the implicit interval tree over features sorted by
+    start. Index i is a node of level k when its k lowest bits are set, its children are
+    i - 2^(k-1) and i + 2^(k-1), and subtree ends[i] is the furthest end of its subtree.
+    Nodes past the last index stand for the largest subtree end of the features they cover.
+    '''
+    count = len(ends)
+    subtreeEnds = list(ends)
+    if count == 0:
+        return subtreeEnds, -1
+    lastIndex = count - 1 & ~1
+    last = subtreeEnds[lastIndex]
+    level = 1
+    while 1 << level <= count:
+        half = 1 << (level - 1)
+        for index in range((half << 1) - 1, count, half << 2):
+            right = subtreeEnds[index + half] if index + half < count else last
+            subtreeEnds[index] = max(ends[index], subtreeEnds[index - half], right)
+        # the last node of this level on the path to the last index
+        lastIndex = lastIndex - half if lastIndex >> level & 1 else lastIndex + half
+        if lastIndex < count and subtreeEnds[lastIndex] > last:
+            last = subtreeEnds[lastIndex]
+        level += 1
+    return subtreeEnds, level - 1
+
+
+class AnnotationIndex:
+    '''
+    Store named features by accession and answer interval queries on them. Duplicate
+    names are kept as separate features instead of overwriting each other.
+
+    instantiation:
+    thisIndex = AnnotationIndex()
+    thisIndex.addFeature('NC_045512.2', 21562, 25384, 'SARSCoV2 S')
+    usage:
+    thisIndex.bestMatch('NC_045512.2', 21561, 25384)
+    thisIndex.overlaps('NC_045512.2', 21000, 22000)
+    thisIndex.nearest('NC_045512.2', 25390)
+    '''
+    def __init__(self):
+        '''contructor: creates the per accession feature lists'''
+        self.features = {} # accession -> list of (start, end, name)
+        self.sortedFeatures = {} # accession -> (starts, ends, names, subtree ends, root level, furthest end index)
+
+    def addFeature(self, accession, start, end, name):
+        '''Add a feature, the accession index is rebuilt on the next query'''
+        self.features.setdefault(accession, []).append((start, end, name))
+        self.sortedFeatures.pop(accession, None)
+
+    def addRegions(self, namedRegions):
+        '''Add features from (name, accession:start-end) pairs'''
+        for name, region in namedRegions:
+            parsed = parseRegion(region)
+            if parsed is not None:
+                self.addFeature(parsed[0], parsed[1], parsed[2], name)
+        return self
+
+    def loadFile(self, fname):
+        '''
+        Load features from a BED file (chrom, start, end, name) or a GFF3/GTF file. GFF
+        coordinates are 1-based inclusive and are converted to 0-based starts. GFF feature
+        names come from the Name, gene, product or ID attributes.
+        '''
+        isGFF = fname.endswith(('.gff', '.gff3', '.gtf'))
+        with open(fname) as fileH:
+            for line in fileH:
+                if not line.strip() or line.startswith(('#', 'track', 'browser')):
+                    continue
+                columns = line.rstrip('\n').split('\t')
+                if isGFF or (len(columns) >= 9 and columns[3].isdigit() and columns[4].isdigit()):
+                    if len(columns) < 9:
+                        continue
+                    attributes = {}
+                    for field in columns[8].strip().strip(';').split(';'):
+                        field = field.strip()
+                        key, separator, value = field.partition('=')
+                        if not separator:
+                            key, _, value = field.partition(' ')
+                        attributes[key.strip()] = value.strip().strip('"')
+                    name = next((attributes[key] for key in ('Name', 'gene', 'gene_name', 'product', 'ID', 'gene_id')
+                                 if attributes.get(key)), columns[2])
+                    self.addFeature(columns[0], int(columns[3]) - 1, int(columns[4]), name)
+                else:
+                    columns = line.split()
+                    if len(columns) < 3:
+                        continue
+                    name = columns[3] if len(columns) > 3 else '{}:{}-{}'.format(*columns[:3])
+                    self.addFeature(columns[0], int(columns[1]), int(columns[2]), name)
+        return self
+
+    def getSorted(self, accession):
+        '''Return the sorted arrays of an accession, building them on first use'''
+        if accession not in self.sortedFeatures:
+            features = sorted(self.features.get(accession, []))
+            starts = [feature[0] for feature in features]
+            ends = [feature[1] for feature in features]
+            names = [feature[2] for feature in features]
+            subtreeEnds, rootLevel = treeEnds(ends)
+            # index of the feature with the largest end among the first i + 1 features
+            furthest = []
+            for index, end in enumerate(ends):
+                furthest.append(index if not furthest or end > ends[furthest[-1]] else furthest[-1])
+            self.sortedFeatures[accession] = (starts, ends, names, subtreeEnds, rootLevel, furthest)
+        return self.sortedFeatures[accession]
+
+    def overlaps(self, accession, start, end):
+        '''
+        Return the (start, end, name) features overlapping start-end, sorted by start. The
+        implicit tree is walked in order and subtrees whose furthest end is not past the
+        query start, or whose nodes start at or after the query end, are skipped.
+        '''
+        starts, ends, names, subtreeEnds, rootLevel, furthest = self.getSorted(accession)
+        count = len(starts)
+        found = []
+        # (level, node, left subtree done) entries, the root covers every index
+        stack = [(rootLevel, (1 << rootLevel) - 1, False)] if count else []
+        while stack:
+            level, node, leftDone = stack.pop()
+            if level <= 2:
+                # small subtrees are scanned, they hold the indexes node - 2^level + 1 to node + 2^level - 1
+                first = node >> level << level
+                for index in range(first, min(first + (1 << (level + 1)) - 1, count)):
+                    if starts[index] >= end:
+                        break
+                    if ends[index] > start:
+                        found.append((starts[index], ends[index], names[index]))
+            elif not leftDone:
+                stack.append((level, node, True))
+                left = node - (1 << (level - 1))
+                # left children past the last index have no features but may have right ones
+                if left >= count or subtreeEnds[left] > start:
+                    stack.append((level - 1, left, False))
+            elif node < count and starts[node] < end:
+                if ends[node] > start:
+                    found.append((starts[node], ends[node], names[node]))
+                stack.append((level - 1, node + (1 << (level - 1)), False))
+        return found
+
+    def bestMatch(self, accession, start, end, minOverlap=0.9):
+        '''
+        Return the name of the feature sharing the largest fraction of both intervals with
+        start-end, or None when no feature covers at least minOverlap of both. Coordinates
+        that are a few bases off still match their feature.
+        '''
+        best, bestScore = None, 0.0
+        queryLength = max(end - start, 1)
+        for featureStart, featureEnd, name in self.overlaps(accession, start, end):
+            shared = min(end, featureEnd) - max(start, featureStart)
+            # reciprocal overlap: the fraction of the longer of the two intervals
+            score = shared / max(queryLength, featureEnd - featureStart)
+            if score > bestScore:
+                best, bestScore = name, score
+        return best if bestScore >= minOverlap else None
+
+    def nearest(self, accession, position):
+        '''Return the (start, end, name) feature closest to a position, or None'''
+        starts, ends, names, subtreeEnds, rootLevel, furthest = self.getSorted(accession)
+        if not starts:
+            return None
+        candidates = self.overlaps(accession, position, position + 1)
+        if candidates:
+            return candidates[0]
+        # closest feature starting after the position and furthest reaching one before it
+        index = bisect_right(starts, position)
+        after = index if index < len(starts) else None
+        before = furthest[index - 1] if index > 0 else None
+        if after is None or (before is not None and position - ends[before] + 1 <= starts[after] - position):
+            best = before
+        else:
+            best = after
+        return starts[best], ends[best], names[best]
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: benchmarkPipeline.py
+#   Executable: python benchmarkPipeline.py > benchmarks.json
+#               python benchmarkPipeline.py -s full -d benchmarkData -o benchmarks-$(git rev-parse --short HEAD).json
+#               python benchmarkPipeline.py -c benchmarks-old.json > benchmarks.json
+#               git worktree add ../baseline ff61cf9
+#               python benchmarkPipeline.py -T ../baseline -o benchmarks-baseline.json
+#
+#   Required module: numpy, syntheticGenomes, findORFs, sequenceAnalysis, fastaFinder,
+#                    filterORFs, seqTranslator, dotPlot
+#   Purpose: throughput and peak memory benchmarks of every pipeline stage on seeded synthetic
+#            genomes and cohorts: ORFfinder.findORF, FastAreader.readFasta,
+#            getFasta.fromBedtoFasta, nameFinder.findName, translateSeq.translator and the
+#            notebook dot plot (dotPlot.filterDotPlot). Results are written as JSON, one entry
+#            per stage and input, so runs of different commits can be compared with -c.
+#   Condition(s): Times are the best and median of -r repeats. Peak memory is measured in one
+#                 extra run with tracemalloc (Python and NumPy allocations, memory maps are not
+#                 counted). Stages reading stdin are given the input file as stdin and their
+#                 stdout goes to /dev/null. Dot plot bases are the cells of the compared matrix.
+#                 -T measures the stages of another checkout (e.g. the baseline commit) with the
+#                 same inputs, which are always prepared with the findORFs.py and fastaFinder.py
+#                 command lines of this directory. Older stage APIs are called through small
+#                 shims, and stages whose module is missing or cannot be imported are skipped.
+#
+#################################################################################################
+
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import syntheticGenomes
+
+# directory of this script, whose command lines prepare the inputs of every checkout
+here = os.path.dirname(os.path.abspath(__file__))
+
+# input sizes of each scale: genome lengths, cohort sizes (records of cohortLength bases)
+# and dot plot protein lengths (spike, ORF1ab)
+scales = {
+    'quick': {'lengths': [29903], 'records': [1, 100], 'cohortLength': 29903, 'proteins': [1273]},
+    'full': {'lengths': [29903, 1000000, 5000000], 'records': [1, 1000, 100000], 'cohortLength': 29903,
+             'proteins': [1273, 7096]},
+}
+
+
+@contextlib.contextmanager
+def redirected(inputName):
+    '''Run a stage that reads stdin and writes stdout on a file, discarding its output'''
+    stdin, stdout = sys.stdin, sys.stdout
+    with open(inputName) as inFile, open(os.devnull, 'w') as outFile:
+        sys.stdin, sys.stdout = inFile, outFile
+        try:
+            yield outFile
+        finally:
+            sys.stdin, sys.stdout = stdin, stdout
+
+
+def measure(function, repeats=3, memory=True):
+    '''
+    Run function repeats times and return (times, peak traced bytes). The peak is measured
+    in one extra run, so tracemalloc does not slow down the timed runs.
+    '''
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return times, peak
+
+
+class BenchmarkData():
+    '''
+    Seeded benchmark inputs written once in a directory and reused while their seed and
+    size match: genome and cohort fasta files, the findORFs bed file of each genome, an
+    annotation naming its ORFs and the ORF fasta written by fastaFinder.
+    '''
+
+    def __init__(self, directory, seed=0):
+        '''contructor: saves the data directory and the seed'''
+        self.directory = directory
+        self.seed = seed
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def cohortFile(self, records, length):
+        '''Return a fasta file of records mutated copies of a genome of the given length'''
+        fname = self.path('cohort-{}x{}-seed{}.fa'.format(records, length, self.seed))
+        if not os.path.exists(fname):
+            with open(fname + '.tmp', 'w') as outFile:
+                syntheticGenomes.writeFasta(syntheticGenomes.cohort(records, length, self.seed), outFile)
+            os.replace(fname + '.tmp', fname)
+        return fname
+
+    def genomeFiles(self, length, minGene=100):
+        '''
+        Return (genome, bed, annotation, ORF fasta) files of one genome. The bed file is the
+        findORFs.py output, the annotation names every ORF so findName matches all of them.
+        The scripts of this directory are run as commands, so every checkout measured with
+        -T gets the same files.
+        '''
+        genome = self.cohortFile(1, length)
+        prefix = genome[:-len('.fa')]
+        bed, annotation, orfFasta = prefix + '.bed', prefix + '.names.bed', prefix + '.orfs.fa'
+        if not os.path.exists(orfFasta):
+            with open(genome) as inFile, open(bed, 'w') as bedFile:
+                subprocess.run([sys.executable, os.path.join(here, 'findORFs.py'), '--noCache', '-mG', str(minGene)],
+                               stdin=inFile, stdout=bedFile, check=True)
+            with open(bed) as bedFile, open(annotation, 'w') as annotationFile:
+                for index, line in enumerate(bedFile):
+                    ID, start, stop = line.split()[:3]
+                    annotationFile.write('{}\t{}\t{}\tsynthetic_ORF{}\n'.format(ID, start, stop, index + 1))
+            subprocess.run([sys.executable, os.path.join(here, 'fastaFinder.py'), '-r', genome, '-b', bed,
+                            '-o', orfFasta + '.tmp'], check=True)
+            os.replace(orfFasta + '.tmp', orfFasta)
+        return genome, bed, annotation, orfFasta
+
+
+def fastaSize(fname):
+    '''Return (records, bases) of a fasta file'''
+    records = bases = 0
+    with open(fname) as fileH:
+        for line in fileH:
+            if line.startswith('>'):
+                records += 1
+            else:
+                bases += len(line.strip())
+    return records, bases
+
+
+def useTree(tree):
+    '''
+    Put the checkout whose stages are measured first on the module path. Modules it does not
+    have (the baseline findORFs.py imports an external sequenceAnalysis) come from here.
+    '''
+    tree = os.path.abspath(tree or here)
+    if tree != here:
+        sys.path.insert(0, tree)
+    return tree
+
+
+def stageModule(name, tree=here, log=sys.stderr):
+    '''Return a stage module of a checkout, or None when it does not have or cannot import it'''
+    import importlib
+    if not os.path.exists(os.path.join(tree, name + '.py')):
+        log.write('skipping the stages of {}: not in {}\n'.format(name, tree))
+        return None
+    try:
+        return importlib.import_module(name)
+    except Exception as error:
+        log.write('skipping the stages of {}: {}\n'.format(name, error))
+        return None
+
+
+def readerClass(tree):
+    '''
+    Return the FastAreader of a checkout: the shared sequenceAnalysis one, or the copy the
+    scripts carried before it existed
+    '''
+    name = 'sequenceAnalysis' if os.path.exists(os.path.join(tree, 'sequenceAnalysis.py')) else 'filterORFs'
+    module = stageModule(name, tree)
+    return module.FastAreader if module is not None else None
+
+
+@contextlib.contextmanager
+def workingDirectory(directory):
+    '''Run a block in another working directory'''
+    previous = os.getcwd()
+    os.chdir(directory)
+    try:
+        yield directory
+    finally:
+        os.chdir(previous)
+
+
+def bedToFasta(fastaFinder, genome, bed):
+    '''
+    Run getFasta.fromBedtoFasta of a checkout on a genome and bed file. The original
+    getFasta reads sars2.bed and SARSCov2.fa of the working directory and prints the
+    sequences, so it is run in a directory linking them to the inputs.
+    '''
+    try:
+        finder = fastaFinder.getFasta(genome, bed)
+    except TypeError:
+        finder = None
+    if finder is not None:
+        with open(os.devnull, 'w') as outFile:
+            finder.fromBedtoFasta(outFile)
+        return
+    with tempfile.TemporaryDirectory(prefix='fastaFinder') as directory, workingDirectory(directory):
+        os.symlink(os.path.abspath(bed), 'sars2.bed')
+        os.symlink(os.path.abspath(genome), 'SARSCov2.fa')
+        with redirected(os.devnull):
+            fastaFinder.getFasta().fromBedtoFasta()
+
+
+def annotatedNameFinder(filterORFs, annotation):
+    '''
+    Return a nameFinder of a checkout naming the ORFs of an annotation file. The original
+    nameFinder takes no annotation, its name to region dictionary is replaced instead.
+    '''
+    try:
+        return filterORFs.nameFinder(annotation)
+    except TypeError:
+        finder = filterORFs.nameFinder()
+        with open(annotation) as fileH:
+            finder.context = {columns[3]: '{}:{}-{}'.format(*columns[:3])
+                              for columns in (line.rstrip('\n').split('\t') for line in fileH)}
+        return finder
+
+
+def benchmarks(data, scale, tree=here):
+    '''
+    Yield (stage, input, records, bases, function) for every stage and input size of a
+    scale, calling the stages of the checkout in tree. Inputs are prepared before their
+    function is yielded, so their writing is not timed.
+    '''
+    findORFs = stageModule('findORFs', tree)
+    fastaFinder = stageModule('fastaFinder', tree)
+    filterORFs = stageModule('filterORFs', tree)
+    seqTranslator = stageModule('seqTranslator', tree)
+    dotPlot = stageModule('dotPlot', tree)
+    FastAreader = readerClass(tree)
+
+    for length in scale['lengths']:
+        genome, bed, annotation, orfFasta = data.genomeFiles(length)
+        with open(genome) as fileH:
+            sequence = ''.join(line.strip() for line in fileH if not line.startswith('>'))
+        orfRecords, orfBases = fastaSize(orfFasta)
+
+        if findORFs is not None:
+            def findORF(sequence=sequence):
+                myFinder = findORFs.ORFfinder(sequence)
+                myFinder.findORF()
+                myFinder.findReverseORF()
+            yield 'findORF', os.path.basename(genome), 1, length, findORF
+
+        if fastaFinder is not None:
+            def fromBedtoFasta(genome=genome, bed=bed):
+                bedToFasta(fastaFinder, genome, bed)
+            yield 'fromBedtoFasta', os.path.basename(bed), orfRecords, orfBases, fromBedtoFasta
+
+        if filterORFs is not None:
+            def findName(annotation=annotation, orfFasta=orfFasta):
+                with redirected(orfFasta):
+                    annotatedNameFinder(filterORFs, annotation).findName()
+            yield 'findName', os.path.basename(orfFasta), orfRecords, orfBases, findName
+
+        if seqTranslator is not None:
+            def translator(orfFasta=orfFasta):
+                with redirected(orfFasta):
+                    # the original translator takes the DNA sequence as a required argument
+                    seqTranslator.translateSeq.translator(None)
+            yield 'translator', os.path.basename(orfFasta), orfRecords, orfBases, translator
+
+    for records in scale['records']:
+        if FastAreader is None:
+            break
+        cohort = data.cohortFile(records, scale['cohortLength'])
+        records, bases = fastaSize(cohort)
+
+        def readFasta(cohort=cohort):
+            for header, sequence in FastAreader(cohort).readFasta():
+                pass
+        yield 'readFasta', os.path.basename(cohort), records, bases, readFasta
+
+    for length in scale['proteins']:
+        if dotPlot is None:
+            break
+        # two diverged copies of a random protein, as in the spike comparisons of the notebook
+        rng = np.random.default_rng(data.seed)
+        aminos = np.frombuffer(b'ACDEFGHIKLMNPQRSTVWY', dtype=np.uint8)
+        protein1 = rng.choice(aminos, size=length)
+        protein2 = protein1.copy()
+        changed = rng.random(length) < 0.2
+        protein2[changed] = rng.choice(aminos, size=int(changed.sum()))
+        protein1, protein2 = protein1.tobytes().decode('ascii'), protein2.tobytes().decode('ascii')
+
+        def filterDotPlot(protein1=protein1, protein2=protein2):
+            dotPlot.filterDotPlot(protein1, protein2, 5, 4)
+        yield 'dotPlot', 'protein{}x{}'.format(length, length), 2, length * length, filterDotPlot
+
+
+def gitCommit(tree=here):
+    '''Return the commit of a checkout, or an empty string outside a git checkout'''
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=tree).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def runBenchmarks(data, scale, repeats=3, memory=True, stages=None, log=sys.stderr, tree=here):
+    '''Run the benchmarks of a scale on the stages of a checkout and return the report as a dictionary'''
+    results = []
+    for stage, name, records, bases, function in benchmarks(data, scale, tree):
+        if stages and stage not in stages:
+            continue
+        times, peak = measure(function, repeats, memory)
+        best = min(times)
+        results.append({'stage': stage, 'input': name, 'records': records, 'bases': bases,
+                        'repeats': repeats, 'bestSeconds': best, 'medianSeconds': statistics.median(times),
+                        'basesPerSecond': bases / best if best else None,
+                        'recordsPerSecond': records / best if best else None,
+                        'peakTracedBytes': peak})
+        log.write('{:<16}{:<40}{:>12.4f} s {:>14.0f} bases/s\n'.format(stage, name, best, bases / best if best else 0))
+    return {'commit': gitCommit(tree), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'processor': platform.processor(), 'cpus': os.cpu_count(), 'seed': data.seed, 'results': results}
+
+
+def compareReports(old, new, outFile=sys.stderr):
+    '''Write the speedup of every benchmark present in both reports'''
+    previous = {(result['stage'], result['input']): result for result in old['results']}
+    outFile.write('{:<16}{:<40}{:>10}{:>10}\n'.format('stage', 'input', 'speedup', 'memory'))
+    for result in new['results']:
+        before = previous.get((result['stage'], result['input']))
+        if before is None:
+            continue
+        speedup = before['bestSeconds'] / result['bestSeconds'] if result['bestSeconds'] else float('inf')
+        memory = (result['peakTracedBytes'] / before['peakTracedBytes']
+                  if result['peakTracedBytes'] and before['peakTracedBytes'] else float('nan'))
+        outFile.write('{:<16}{:<40}{:>9.2f}x{:>9.2f}x\n'.format(result['stage'], result['input'], speedup, memory))
+
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='benchmarkPipeline.py - throughput and peak memory of every pipeline stage',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] >output'
+            )
+        self.parser.add_argument('-s', '--scale', action='store', choices=sorted(scales), default='quick',
+                                 help='input sizes to run')
+        self.parser.add_argument('-l', '--lengths', type=int, nargs='+', action='store',
+                                 help='genome lengths used instead of the scale ones')
+        self.parser.add_argument('-n', '--records', type=int, nargs='+', action='store',
+                                 help='cohort sizes used instead of the scale ones')
+        self.parser.add_argument('-t', '--stages', nargs='+', action='store',
+                                 choices=['findORF', 'readFasta', 'fromBedtoFasta', 'findName', 'translator', 'dotPlot'],
+                                 help='stages to run (default all)')
+        self.parser.add_argument('-r', '--repeats', type=int, default=3, action='store',
+                                 help='timed runs of every benchmark')
+        self.parser.add_argument('-m', '--noMemory', action='store_true', default=False,
+                                 help='skip the peak memory run')
+        self.parser.add_argument('-d', '--dataDir', action='store', default='',
+                                 help='directory keeping the generated inputs between runs (default a temporary one)')
+        self.parser.add_argument('-S', '--seed', type=int, default=0, action='store',
+                                 help='random seed of the synthetic inputs')
+        self.parser.add_argument('-o', '--output', action='store', default='',
+                                 help='JSON report file (default stdout)')
+        self.parser.add_argument('-c', '--compare', action='store', default='',
+                                 help='previous JSON report to compare with, speedups are written in stderr')
+        self.parser.add_argument('-T', '--tree', action='store', default='',
+                                 help='checkout whose stages are measured, e.g. a worktree of an older commit (default this one)')
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+
+def main(inCL=None):
+    '''
+    Run the benchmarks and write the JSON report
+    '''
+    myCommandLine = CommandLine(inCL)
+    args = myCommandLine.args
+    scale = dict(scales[args.scale])
+    if args.lengths:
+        scale['lengths'] = args.lengths
+    if args.records:
+        scale['records'] = args.records
+    tree = useTree(args.tree)
+    with contextlib.ExitStack() as stack:
+        directory = os.path.abspath(args.dataDir) if args.dataDir else stack.enter_context(tempfile.TemporaryDirectory(prefix='benchmarks'))
+        report = runBenchmarks(BenchmarkData(directory, args.seed), scale, args.repeats, not args.noMemory,
+                               args.stages, tree=tree)
+    report['scale'] = scale
+    if args.output:
+        with open(args.output, 'w') as outFile:
+            json.dump(report, outFile, indent=1)
+            outFile.write('\n')
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        sys.stdout.write('\n')
+    if args.compare:
+        with open(args.compare) as inFile:
+            compareReports(json.load(inFile), report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: bgzfReader.py
+#   Executable: python bgzfReader.py cohort.fa              (writes cohort.fa.gz and cohort.fa.gz.gzi)
+#               python bgzfReader.py -d cohort.fa.gz > cohort.fa
+#
+#   Required module: None
+#   Purpose: gzip and bgzip compressed FastA input. BGZF files (bgzip, samtools) are a series of
+#            gzip members of at most 64 kb, so their blocks are inflated in parallel by a pool
+#            of threads (zlib releases the GIL) and, with the .gzi index of the block offsets,
+#            any uncompressed byte range is read by inflating only the blocks holding it.
+#            Plain gzip files are read sequentially with the gzip module.
+#   Condition(s): The .gzi index has the bgzip format (little-endian uint64 count, then
+#                 compressed and uncompressed offsets of every block but the first) and is
+#                 built by scanning the block headers when it is missing or older than the file.
+#
+#################################################################################################
+
+import bisect
+import collections
+import concurrent.futures
+import io
+import os
+import struct
+import sys
+import zlib
+
+gzipMagic = b'\x1f\x8b'
+# gzip header of a BGZF block: deflate, FEXTRA, XLEN 6 and the 'BC' subfield holding BSIZE
+bgzfHeader = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+bgzfEOF = bgzfHeader + b'\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+blockSize = 0xff00 # uncompressed bytes per block written, as bgzip does
+defaultThreads = min(4, os.cpu_count() or 1)
+
+
+def compression(header):
+    '''Return 'bgzf', 'gzip' or '' for the first bytes of a file'''
+    if not header.startswith(gzipMagic):
+        return ''
+    # FEXTRA flag with a BC subfield right after XLEN
+    if len(header) >= 14 and header[3] & 4 and header[12:14] == b'BC':
+        return 'bgzf'
+    return 'gzip'
+
+
+def fileCompression(fname):
+    '''Return 'bgzf', 'gzip' or '' for a file'''
+    with open(fname, 'rb') as fileH:
+        return compression(fileH.read(18))
+
+
+def blockLength(header):
+    '''Return the compressed length of the BGZF block starting with header, from its BSIZE'''
+    if len(header) < 18 or not header.startswith(gzipMagic) or not header[3] & 4:
+        raise ValueError('Not a BGZF block')
+    extraLength = struct.unpack_from('<H', header, 10)[0]
+    extra = header[12:12 + extraLength]
+    position = 0
+    while position + 4 <= len(extra):
+        subfield, length = extra[position:position + 2], struct.unpack_from('<H', extra, position + 2)[0]
+        if subfield == b'BC' and length == 2:
+            return struct.unpack_from('<H', extra, position + 4)[0] + 1
+        position += 4 + length
+    raise ValueError('BGZF block without a BSIZE field')
+
+
+def readBlocks(fileH):
+    '''Yield the compressed BGZF blocks of a file object, which may be a pipe'''
+    while True:
+        header = fileH.read(18)
+        if not header:
+            return
+        extraLength = struct.unpack_from('<H', header, 10)[0] if len(header) >= 12 else 0
+        if extraLength > 6:
+            header += fileH.read(extraLength - 6)
+        rest = blockLength(header) - len(header)
+        block = header + fileH.read(rest)
+        if len(block) != rest + len(header):
+            raise ValueError('Truncated BGZF block')
+        yield block
+
+
+def inflateBlock(block):
+    '''Return the uncompressed bytes of one BGZF block, checking its CRC and size'''
+    extraLength = struct.unpack_from('<H', block, 10)[0]
+    data = zlib.decompress(block[12 + extraLength:-8], -15)
+    crc, size = struct.unpack_from('<II', block, len(block) - 8)
+    if size != len(data) or crc != zlib.crc32(data):
+        raise ValueError('Corrupted BGZF block')
+    return data
+
+
+def deflateBlock(data, level=6):
+    '''Return data as one BGZF block'''
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    header = bgzfHeader + struct.pack('<H', len(bgzfHeader) + 2 + len(deflated) + 8 - 1)
+    return header + deflated + struct.pack('<II', zlib.crc32(data), len(data))
+
+
+def orderedMap(function, items, threads=defaultThreads):
+    '''
+    Yield function(item) for an iterable of items, in order, computed by a pool of threads.
+    At most four items per thread are held at a time, so long inputs stream through.
+    '''
+    if threads <= 1:
+        for item in items:
+            yield function(item)
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        pending = collections.deque()
+        for item in items:
+            pending.append(pool.submit(function, item))
+            if len(pending) >= 4 * threads:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def inflateBlocks(blocks, threads=defaultThreads):
+    '''Yield the uncompressed bytes of an iterable of BGZF blocks, in order, inflated in parallel'''
+    return orderedMap(inflateBlock, blocks, threads)
+
+
+class BGZFstream(io.RawIOBase):
+    '''
+    Readable binary stream of the uncompressed content of a BGZF file object, inflated in
+    parallel. Wrap it in io.TextIOWrapper(io.BufferedReader(...)) to read lines.
+    '''
+
+    def __init__(self, fileH, threads=defaultThreads, closeFile=True):
+        '''contructor: starts inflating the blocks of fileH'''
+        super().__init__()
+        self.fileH = fileH
+        self.closeFile = closeFile
+        self.chunks = inflateBlocks(readBlocks(fileH), threads)
+        self.buffer = b''
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while self.position >= len(self.buffer):
+            self.buffer = next(self.chunks, None)
+            self.position = 0
+            if self.buffer is None:
+                self.buffer = b''
+                return 0
+        size = min(len(target), len(self.buffer) - self.position)
+        target[:size] = self.buffer[self.position:self.position + size]
+        self.position += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.chunks.close()
+            if self.closeFile:
+                self.fileH.close()
+        super().close()
+
+
+def openText(fname='', threads=defaultThreads):
+    '''
+    Return a text file object of a plain, gzip or BGZF file, or of stdin for an empty name.
+    Compression is recognized from the first bytes, not from the file extension.
+    '''
+    if fname == '':
+        binary = getattr(sys.stdin, 'buffer', None)
+        if binary is None or not hasattr(binary, 'peek'):
+            return sys.stdin
+        kind = compression(binary.peek(18)[:18])
+        if kind == 'bgzf':
+            return io.TextIOWrapper(io.BufferedReader(BGZFstream(binary, threads), buffer_size=blockSize))
+        if kind == 'gzip':
+            import gzip
+            return io.TextIOWrapper(gzip.GzipFile(fileobj=binary, mode='rb'))
+        return sys.stdin
+    kind = fileCompression(fname)
+    if kind == 'bgzf':
+        return io.TextIOWrapper(io.BufferedReader(BGZFstream(open(fname, 'rb'), threads), buffer_size=blockSize))
+    if kind == 'gzip':
+        import gzip
+        return gzip.open(fname, 'rt')
+    return open(fname)
+
+
+class BGZFreader:
+    '''
+    Random access to the uncompressed bytes of a BGZF file through its .gzi block index.
+
+    instantiation:
+    thisReader = BGZFreader('SARSCoV2.fa.gz')
+    usage:
+    data = thisReader[1000:2000]
+    '''
+
+    def __init__(self, fname, indexName=None, threads=defaultThreads, cachedBlocks=16):
+        '''contructor: saves the file names and loads or builds the block index'''
+        self.fname = fname
+        self.indexName = indexName if indexName is not None else fname + '.gzi'
+        self.threads = threads
+        self.cachedBlocks = cachedBlocks
+        self.cache = collections.OrderedDict() # block number -> uncompressed bytes
+        self.fileH = None
+        if self.isIndexCurrent():
+            self.loadIndex()
+        else:
+            self.buildIndex()
+            try:
+                self.saveIndex()
+            except OSError:
+                pass # read-only directory, the index is rebuilt next time
+
+    def isIndexCurrent(self):
+        '''Return True if an index file exists and is not older than the BGZF file'''
+        return os.path.exists(self.indexName) and os.path.getmtime(self.indexName) >= os.path.getmtime(self.fname)
+
+    def buildIndex(self):
+        '''Read the header and size field of every block to find the block offsets'''
+        self.compressedOffsets, self.uncompressedOffsets = [0], [0]
+        with open(self.fname, 'rb') as fileH:
+            compressed = uncompressed = 0
+            while True:
+                header = fileH.read(18)
+                if not header:
+                    break
+                extraLength = struct.unpack_from('<H', header, 10)[0] if len(header) >= 12 else 0
+                if extraLength > 6:
+                    header += fileH.read(extraLength - 6)
+                length = blockLength(header)
+                fileH.seek(compressed + length - 4)
+                size = struct.unpack('<I', fileH.read(4))[0]
+                compressed += length
+                uncompressed += size
+                self.compressedOffsets.append(compressed)
+                self.uncompressedOffsets.append(uncompressed)
+        # the last offsets are the end of the file and of the data
+        self.size = self.uncompressedOffsets[-1]
+
+    def saveIndex(self):
+        '''Write the index in bgzip .gzi format'''
+        with open(self.indexName, 'wb') as fileH:
+            entries = list(zip(self.compressedOffsets[1:-1], self.uncompressedOffsets[1:-1]))
+            fileH.write(struct.pack('<Q', len(entries)))
+            for compressed, uncompressed in entries:
+                fileH.write(struct.pack('<QQ', compressed, uncompressed))
+
+    def loadIndex(self):
+        '''Read a bgzip .gzi index, the block sizes of the last block are read from the file'''
+        with open(self.indexName, 'rb') as fileH:
+            count = struct.unpack('<Q', fileH.read(8))[0]
+            offsets = struct.unpack('<{}Q'.format(2 * count), fileH.read(16 * count))
+        self.compressedOffsets = [0] + list(offsets[0::2])
+        self.uncompressedOffsets = [0] + list(offsets[1::2])
+        fileSize = os.path.getsize(self.fname)
+        # walk the blocks after the last indexed one to find the end of the data
+        fileH = self.doOpen()
+        compressed, uncompressed = self.compressedOffsets[-1], self.uncompressedOffsets[-1]
+        while compressed < fileSize:
+            fileH.seek(compressed)
+            length = blockLength(fileH.read(18))
+            fileH.seek(compressed + length - 4)
+            uncompressed += struct.unpack('<I', fileH.read(4))[0]
+            compressed += length
+            if compressed < fileSize:
+                self.compressedOffsets.append(compressed)
+                self.uncompressedOffsets.append(uncompressed)
+        self.compressedOffsets.append(compressed)
+        self.uncompressedOffsets.append(uncompressed)
+        self.size = uncompressed
+
+    def doOpen(self):
+        '''Open the BGZF file on first use'''
+        if self.fileH is None:
+            self.fileH = open(self.fname, 'rb')
+        return self.fileH
+
+    def close(self):
+        if self.fileH is not None:
+            self.fileH.close()
+        self.fileH = None
+        self.cache.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def rawBlock(self, number):
+        '''Return the compressed bytes of a block'''
+        fileH = self.doOpen()
+        fileH.seek(self.compressedOffsets[number])
+        return fileH.read(self.compressedOffsets[number + 1] - self.compressedOffsets[number])
+
+    def blocks(self, first, last):
+        '''Return the uncompressed blocks first to last (inclusive), inflating missing ones in parallel'''
+        missing = [number for number in range(first, last + 1) if number not in self.cache]
+        inflated = dict(zip(missing, inflateBlocks([self.rawBlock(number) for number in missing],
+                                                   self.threads if len(missing) > 1 else 1)))
+        result = []
+        for number in range(first, last + 1):
+            data = inflated[number] if number in inflated else self.cache[number]
+            self.cache[number] = data
+            self.cache.move_to_end(number)
+            result.append(data)
+        while len(self.cache) > self.cachedBlocks:
+            self.cache.popitem(last=False)
+        return result
+
+    def read(self, start, end):
+        '''Return the uncompressed bytes between start and end (exclusive)'''
+        start, end = max(start, 0), min(end, self.size)
+        if start >= end:
+            return b''
+        first = bisect.bisect_right(self.uncompressedOffsets, start) - 1
+        last = bisect.bisect_right(self.uncompressedOffsets, end - 1) - 1
+        data = b''.join(self.blocks(first, last))
+        offset = self.uncompressedOffsets[first]
+        return data[start - offset:end - offset]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                raise ValueError('BGZFreader slices have no step')
+            start, end, _ = index.indices(self.size)
+            return self.read(start, end)
+        if index < 0:
+            index += self.size
+        return self.read(index, index + 1)[0]
+
+
+def compressFile(fname, outName=None, level=6, threads=defaultThreads):
+    '''Write fname in BGZF format with its .gzi index and return the compressed file name'''
+    import functools
+    outName = outName if outName is not None else fname + '.gz'
+    with open(fname, 'rb') as inFile, open(outName, 'wb') as outFile:
+        pieces = iter(lambda: inFile.read(blockSize), b'')
+        for block in orderedMap(functools.partial(deflateBlock, level=level), pieces, threads):
+            outFile.write(block)
+        outFile.write(bgzfEOF)
+    # building the reader writes the .gzi index
+    BGZFreader(outName, threads=threads).close()
+    return outName
+
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='bgzfReader.py - compresses a file in BGZF format with its .gzi index, or decompresses it',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] file >output'
+            )
+        self.parser.add_argument('fname', action='store', help='file to compress or decompress')
+        self.parser.add_argument('-o', '--output', action='store', default=None,
+                                 help='compressed file name (default <file>.gz)')
+        self.parser.add_argument('-d', '--decompress', action='store_true', default=False,
+                                 help='write the uncompressed content in stdout')
+        self.parser.add_argument('-l', '--level', type=int, choices=range(0, 10), default=6, action='store',
+                                 help='compression level')
+        self.parser.add_argument('-@', '--threads', type=int, default=defaultThreads, action='store',
+                                 help='number of compression or decompression threads')
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+
+def main(inCL=None):
+    '''
+    Compress a file in BGZF format, or decompress a gzip or BGZF file
+    '''
+    myCommandLine = CommandLine(inCL)
+    args = myCommandLine.args
+    if args.decompress:
+        with openText(args.fname, args.threads) as fileH:
+            for line in fileH:
+                sys.stdout.write(line)
+    else:
+        compressFile(args.fname, args.output, args.level, args.threads)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: clustalReader.py
+#   Executable: python clustalReader.py -i ORFS.aln
+#               python clustalReader.py -i ORFS.aln -c 100-200
+#
+#   Required module: numpy
+#   Purpose: streaming Clustal alignment reader. Blocks are read one at a time, and an alignment
+#            can be converted once into memory-mapped matrices: a row-major copy for reading
+#            whole sequences and a column-major copy for reading column slices (e.g. one spike
+#            region across every sequence) without loading the alignment.
+#   Condition(s): The converted alignment is stored next to the .aln file as <aln>.rows.npy,
+#                 <aln>.cols.npy and <aln>.names and is reused while newer than the .aln file.
+#
+#################################################################################################
+
+import os
+import sys
+
+import numpy as np
+
+
+def readBlocks(fname):
+    '''
+    Yield the blocks of a Clustal alignment one at a time as lists of (name, residues).
+    Header, blank and consensus lines are skipped.
+    '''
+    block = []
+    with open(fname) as fileH:
+        for line in fileH:
+            if line.startswith('CLUSTAL'):
+                continue
+            if not line.strip() or line[0].isspace():
+                # blank and consensus lines close the current block
+                if block:
+                    yield block
+                    block = []
+                continue
+            columns = line.split()
+            if len(columns) >= 2:
+                block.append((columns[0], columns[1]))
+    if block:
+        yield block
+
+
+def readClustal(fname):
+    '''
+    Read a Clustal alignment and return (names, rows) with the aligned rows as strings.
+    Names keep the order of the first block.
+    '''
+    order = []
+    pieces = {}
+    for block in readBlocks(fname):
+        for name, residues in block:
+            if name not in pieces:
+                order.append(name)
+                pieces[name] = []
+            pieces[name].append(residues)
+    return order, [''.join(pieces[name]) for name in order]
+
+
+class ClustalMatrix():
+    '''
+    Memory-mapped alignment converted from a Clustal file. rows is an (n, length) uint8
+    matrix in row-major order and columns is its (length, n) column-major copy, so both a
+    sequence and a column range are contiguous reads.
+
+    instantiation:
+    thisAlignment = ClustalMatrix('ORFS.aln')
+    usage:
+    thisAlignment.row('SARSCoV2_S'), thisAlignment.columnSlice(400, 520)
+    '''
+
+    def __init__(self, fname, prefix=None):
+        '''contructor: converts the alignment on first use and maps the matrices'''
+        self.fname = fname
+        self.prefix = prefix if prefix is not None else fname
+        self.rowsName = self.prefix + '.rows.npy'
+        self.columnsName = self.prefix + '.cols.npy'
+        self.namesName = self.prefix + '.names'
+        if not self.isConverted():
+            self.convert()
+        with open(self.namesName) as fileH:
+            self.names = [line.rstrip('\n') for line in fileH]
+        self.nameIndex = {name: index for index, name in enumerate(self.names)}
+        self.rows = np.load(self.rowsName, mmap_mode='r')
+        self.columns = np.load(self.columnsName, mmap_mode='r')
+
+    def isConverted(self):
+        '''Return True if the converted files exist and are newer than the alignment'''
+        source = os.path.getmtime(self.fname)
+        return all(os.path.exists(name) and os.path.getmtime(name) >= source
+                   for name in (self.rowsName, self.columnsName, self.namesName))
+
+    def convert(self):
+        '''
+        Convert the alignment with two streaming passes: the first finds the sequence names
+        and the alignment length, the second writes every block into both memory maps.
+        '''
+        names = []
+        length = 0
+        for block in readBlocks(self.fname):
+            if not names:
+                names = [name for name, residues in block]
+            length += len(block[0][1])
+        rows = np.lib.format.open_memmap(self.rowsName, mode='w+', dtype=np.uint8, shape=(len(names), length))
+        columns = np.lib.format.open_memmap(self.columnsName, mode='w+', dtype=np.uint8, shape=(length, len(names)))
+        nameIndex = {name: index for index, name in enumerate(names)}
+        offset = 0
+        for block in readBlocks(self.fname):
+            width = len(block[0][1])
+            values = np.full((len(names), width), ord('-'), dtype=np.uint8)
+            for name, residues in block:
+                values[nameIndex[name], :len(residues)] = np.frombuffer(residues.upper().encode('ascii'), dtype=np.uint8)
+            rows[:, offset:offset + width] = values
+            columns[offset:offset + width, :] = values.T
+            offset += width
+        rows.flush()
+        columns.flush()
+        del rows, columns
+        with open(self.namesName, 'w') as fileH:
+            for name in names:
+                fileH.write(name + '\n')
+
+    def __len__(self):
+        return self.rows.shape[1]
+
+    def row(self, name):
+        '''Return one aligned sequence, by name or index, as a string'''
+        index = self.nameIndex[name] if isinstance(name, str) else name
+        return self.rows[index].tobytes().decode('ascii')
+
+    def columnSlice(self, start, end):
+        '''Return the (length, n) uint8 columns start-end (0-based, exclusive) of every sequence'''
+        return self.columns[start:end]
+
+    def regionStrings(self, start, end):
+        '''Return {name: residues} for alignment columns start-end of every sequence'''
+        block = np.ascontiguousarray(self.columns[start:end].T)
+        return {name: block[index].tobytes().decode('ascii') for index, name in enumerate(self.names)}
+
+    def conservation(self, start=0, end=None):
+        '''
+        Return, for every column, the fraction of sequences sharing the most common residue.
+        Columns are read from the column-major copy in blocks of about 16M residues.
+        '''
+        end = len(self) if end is None else end
+        count = max(len(self.names), 1)
+        blockSize = max(1, 2 ** 24 // count)
+        values = []
+        for blockStart in range(start, end, blockSize):
+            block = np.asarray(self.columns[blockStart:min(blockStart + blockSize, end)])
+            best = np.zeros(len(block), dtype=np.int64)
+            for symbol in np.unique(block):
+                np.maximum(best, (block == symbol).sum(axis=1), out=best)
+            values.append(best / count)
+        return np.concatenate(values) if values else np.empty(0)
+
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='clustalReader.py - converts a Clustal alignment to memory-mapped matrices',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] >output'
+            )
+        self.parser.add_argument('-i', '--input', action='store', required=True,
+                                 help='Clustal alignment file')
+        self.parser.add_argument('-c', '--columns', action='store', default='',
+                                 help='print alignment columns start-end (0-based, exclusive) as fasta')
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+
+def main(inCL=None):
+    '''
+    Convert an alignment and print its size, or a column slice of every sequence as fasta
+    '''
+    myCommandLine = CommandLine(inCL)
+    alignment = ClustalMatrix(myCommandLine.args.input)
+    if myCommandLine.args.columns:
+        start, _, end = myCommandLine.args.columns.partition('-')
+        for name, residues in alignment.regionStrings(int(start), int(end)).items():
+            sys.stdout.write('>{}:{}-{}\n{}\n'.format(name, start, end, residues))
+    else:
+        sys.stdout.write('{}\t{} sequences\t{} columns\n'.format(myCommandLine.args.input, len(alignment.names), len(alignment)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: dotPlot.py
+#   Executable: python dotPlot.py
+#   Required module: numpy
+#   Purpose: dot plots of protein or nucleotide sequences used by proteinSeqAlignAnalysis.ipynb.
+#            The match matrix is built with NumPy broadcasting and the window/stringency filter
+#            is a running sum along the diagonals, so full length spike proteins (~1,270 aa)
+#            and ORF1ab compare interactively.
+#   Condition(s): Matrices are returned as NumPy uint8 arrays (1 = dot), which printDotPlot and
+#                 matplotlib's imshow both accept. dotPlotCoordinates returns the sparse dots.
+#
+#################################################################################################
+
+import sys
+
+import numpy as np
+
+
+def encode(sequence):
+    """Return a sequence as an upper case uint8 array"""
+    if isinstance(sequence, np.ndarray):
+        return sequence
+    return np.frombuffer(sequence.upper().encode('ascii', 'replace'), dtype=np.uint8)
+
+
+def createMatrix(nrows, ncols):
+    """Create a matrix of amino acid sequences to compare"""
+    return np.zeros((nrows, ncols), dtype=np.uint8)
+
+
+def dotplot(sequence1, sequence2):
+    """Return the match matrix of two sequences, 1 where both residues are equal"""
+    seq1, seq2 = encode(sequence1), encode(sequence2)
+    # compare every residue of sequence 1 with every residue of sequence 2 at once
+    return (seq1[:, None] == seq2[None, :]).astype(np.uint8)
+
+
+def diagonalWindowSums(sequence1, sequence2, window):
+    """
+    Yield (row, sums) for every row whose window fits in sequence 1, where sums[j] is the
+    number of matches in the diagonal window centered on (row, j + window // 2). Diagonal
+    cumulative sums are kept for window + 1 rows only, so memory stays O(window * len2).
+    """
+    seq1, seq2 = encode(sequence1), encode(sequence2)
+    half = window // 2
+    # the window spans half residues on each side of its center, as in the notebook
+    window = 2 * half + 1
+    ncols = len(seq2)
+    if len(seq1) < window or ncols < window:
+        return
+    # cumulative[r % (window + 1)][j + 1] = matches on the diagonal ending at (r, j)
+    cumulative = np.zeros((window + 1, ncols + 1), dtype=np.int32)
+    for row in range(len(seq1)):
+        current = cumulative[row % (window + 1)]
+        previous = cumulative[(row - 1) % (window + 1)]
+        current[0] = 0
+        current[1:] = (seq2 == seq1[row]) + previous[:-1]
+        if row >= window - 1:
+            first = cumulative[(row - window) % (window + 1)] if row >= window else np.zeros(ncols + 1, dtype=np.int32)
+            # window ending at (row, j) minus the diagonal before its start
+            yield row - half, current[window:] - first[:ncols + 1 - window]
+
+
+def filterDotPlot(sequence1, sequence2, window, stringency):
+    """
+    Method gets rid of background noise in the dot plot. A dot is kept at (i, j) when at least
+    stringency residues match in the diagonal window of the given length centered on (i, j).
+    """
+    half = window // 2
+    matrix = createMatrix(len(sequence1), len(sequence2))
+    for row, sums in diagonalWindowSums(sequence1, sequence2, window):
+        matrix[row, half:half + len(sums)] = sums >= stringency
+    return matrix
+
+
+def dotPlotCoordinates(sequence1, sequence2, window=1, stringency=1):
+    """
+    Return the (rows, columns) arrays of the filtered dots without building the dense matrix,
+    for plotting with a scatter plot
+    """
+    half = window // 2
+    rows, columns = [], []
+    for row, sums in diagonalWindowSums(sequence1, sequence2, window):
+        hits = np.flatnonzero(sums >= stringency)
+        if len(hits):
+            rows.append(np.full(len(hits), row, dtype=np.int64))
+            columns.append(hits + half)
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(rows), np.concatenate(columns)
+
+
+def printDotPlot(matrix, seq1, seq2):
+    """print dot plot in stdout """
+    # print method: stdout
+    sys.stdout.write(" " + seq2 + "\n")
+    symbols = np.frombuffer(b" *", dtype=np.uint8)
+    for index in range(len(matrix)):
+        sys.stdout.write(seq1[index])
+        sys.stdout.write(symbols[(np.asarray(matrix[index]) >= 1).astype(np.uint8)].tobytes().decode())
+        sys.stdout.write("\n")
+
+
+def main():
+    """Takes sequences and executes program"""
+    # Enter first sequence
+    sequence1 = input("Enter sequence 1: ")
+    # Entern second sequence
+    sequence2 = input("Enter sequence 2: ")
+    # call matrix
+    matrix2 = filterDotPlot(sequence1, sequence2, 5, 4)
+    # print plot
+    printDotPlot(matrix2, sequence1, sequence2)
+
+if __name__ == "__main__":
+    main()
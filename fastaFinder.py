@@ -11,15 +11,50 @@
 #               python fastaFinder.py > sarsRs4231Seq.fa
 #               python fastaFinder.py > coronavirusBtRsSeq.fa
 #
-#   Required module: pybedtools.py   
+#   Executable with options: python fastaFinder.py -r SARSCoV2.fa -b sars2.bed -o sars2Seq.fa
+#
+#   Required module: sequenceAnalysis, orfTable
 #   Pupose: Obtain fasta sequences for open reading frames (ORF) in any genome and output file
-#   Condition: Program requires to change bed and fasta genome files internally each time before running it
+#   Condition: Reference genome, bed file and output file are taken from the command line,
+#              defaults are SARSCoV2.fa, sars2.bed and stdout
 #   
 #################################################################################################
 
-import pybedtools
-from pybedtools import BedTool
 import sys
+from pipelineProfiler import profiler, addProfileOption
+from orfTable import ORFtable, isTable
+from sequenceAnalysis import FastAindex
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='fastaFinder.py - extracts ORF fasta sequences from a reference genome',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] >output'
+            )
+        self.parser.add_argument('-r', '--reference', action='store', default='SARSCoV2.fa',
+                                 help='reference genome fasta file, plain or bgzip compressed')
+        self.parser.add_argument('-b', '--bed', action='store', default='sars2.bed',
+                                 help='bed file with ORF coordinates, or a binary ORF table')
+        self.parser.add_argument('-o', '--output', action='store', default='',
+                                 help='output fasta file (default stdout)')
+        addProfileOption(self.parser)
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
 
 class getFasta:
     '''
@@ -27,29 +62,45 @@ class getFasta:
     The program outputs a file containing the raw fastas sequences for each gene found in the genome
     '''
     
-    def __init__(self):
+    def __init__(self, referenceGenome='SARSCoV2.fa', bedFile='sars2.bed'):
         '''
         Initializes program and creates empty lists 
         ''' 
-        self.outJunctions = [] # stores intron junctions
+        self.referenceGenome = referenceGenome
+        self.bedFile = bedFile
         self.orfFasta = {}
-        self.filteredFrames = {}
-        self.orfElements = {}
+        self.genome = None
 
-    def fromBedtoFasta(self):
+    def bedIntervals(self):
+        '''
+        Yield the (ID, start, end) intervals of the bed file, or of a binary ORF table
+        written by findORFs.py -b, whose columns are read without parsing text
         '''
-        Read over bed file and create a bed file containing ORF coordinates. 
-        Then,uses the ORF coordinates in new bed file and a reference genome to obtain 
-        the fasta for each ORF. The original bed file has to be in a matrix array form:
+        if isTable(self.bedFile):
+            table = ORFtable(self.bedFile)
+            yield from profiler.iterate('readBed', table.intervals())
+            return
+        with open(self.bedFile, "r") as fh:
+            # open file and go through each line, i.e. rows
+            for lines in profiler.iterate('readBed', fh): 
+                # split line into columns: chromosome, start and end
+                columns = lines.rstrip().split()
+                if len(columns) < 3:
+                    continue
+                yield columns[0], int(columns[1]), int(columns[2])
+
+    def fromBedtoFasta(self, outFile=sys.stdout, keep=False):
+        '''
+        Read over bed file and extract the fasta for each ORF from the reference genome,
+        which is indexed once and memory-mapped, so only the bytes of each ORF are read.
+        Coordinates are used as bedtools getfasta does: start is 0-based and end is
+        exclusive. Sequences are only kept in orfFasta when keep is True, so large bed
+        files are streamed. The original bed file has to be in a matrix array form:
 
         Example bedfile:
                             NC_004718.3   265 13413 13149 ORF# +1
                             NC_004718.3 13597 21485  7889 ORF# +3
                             NC_004718.3 21490 25259  3770 ORF# +3
-        intronCoord bed file:
-                            NC_004718.3 13597   21485
-                            NC_004718.3 21490   25259
-                            NC_004718.3 28120   29388
         newFasta file:
                             
                             NC_004718.3:2992-3295   
@@ -58,64 +109,45 @@ class getFasta:
                             CCTCAGCTGAAACAGTTCGAGTTGAGGAAGAAGAAGAGGAAGACTGGCTGGATGATACTACTGAGCAATCAGAGATTGAGCCAG
                             AACCAGAACCTACACCTGAAGAACCAGTTAATCAGTTTACTGGTTATTTAA.........
         ''' 
+        if self.genome is None:
+            with profiler.stage('indexGenome'):
+                self.genome = FastAindex(self.referenceGenome)
+        for ID, start, end in self.bedIntervals():
+            # skip intervals that are not in the reference, as bedtools does
+            if ID not in self.genome or start < 0 or end > self.genome.length(ID) or start >= end:
+                sys.stderr.write('Skipping interval {}:{}-{} not found in {}\n'.format(ID, start, end, self.referenceGenome))
+                profiler.count('skippedIntervals')
+                continue
+            header = '{}:{}-{}'.format(ID, start, end)
+            with profiler.stage('fetchFasta'):
+                sequence = self.genome.fetch(ID, start, end)
+            if keep:
+                self.orfFasta[header] = sequence
+            with profiler.stage('writeFasta'):
+                outFile.write('>{}\n{}\n\n'.format(header, sequence))
+            profiler.count('records')
+            profiler.count('bases', len(sequence))
 
-        self.bedFile = "sars2.bed" 
-        self.referenceGenome = "SARSCov2.fa" 
-        orfPositions = []
-        orfFasta = []
-        filteredFasta = []
-        with open(self.bedFile, "r") as fh:
-            # open file and go through each line, i.e. rows
-            for lines in fh: 
-                # split line into columns and append chromosome, start and end.
-                columns = lines.rstrip().split()
-                # defines each column
-                ID, start, end, length, orf, frame = columns[:6]
-                # map the start and end of each chromosome in each sample from bed file
-                start, end, length = map(int, [start, end, length])
-                # new bed file containing intron coordinates is stored in intronCoord
-                orfCoordinate = ('\t'.join(columns[:3]))
-                pass
-                
-                # newBed stores the intron coordinates
-                newBed = pybedtools.BedTool(orfCoordinate, from_string=True)
-                # stores the fastas for each intron coordinate
-                seq = pybedtools.BedTool(self.referenceGenome)
-                # mathches intron coordinates with fastas and stores them  
-                newBed = newBed.sequence(fi=seq) #, tab=True) 
-                # object stores introns fastas
-                outFasta = open(newBed.seqfn).read()
-                print(outFasta)
-                
-                element = outFasta.rstrip().split()
-                header, sequence = element
-                for header in element:
-                    orfPositions.append(header)
-                    for sequence in element:
-                        orfFasta.append(sequence)
-                        pass
-            
-                # create objects to store new lists for introns headers and sequences 
-                newHeader = orfFasta[::2] # dictionary keys 
-                newSeq = orfFasta[1::2] # dictionary values 
-                # create a dictionary for introns coordinates and sequences 
-                for key in newHeader:
-                    for value in newSeq:
-                        self.orfFasta[key] = value
-                        newSeq.remove(value)
-                        break
+        return self.orfFasta
 
 #################################################################################################   
 # Main function
 #################################################################################################  
 
-def main ():
+def main(inCL=None):
     '''
     Calls functions and return output file 
     '''
-    myORF = getFasta()
-    fasta = myORF.fromBedtoFasta() 
-    print(fasta)
+    myCommandLine = CommandLine(inCL)
+    if myCommandLine.args.profile:
+        profiler.enable('fastaFinder.py')
+    myORF = getFasta(myCommandLine.args.reference, myCommandLine.args.bed)
+    if myCommandLine.args.output:
+        with open(myCommandLine.args.output, 'w') as outFile:
+            myORF.fromBedtoFasta(outFile)
+    else:
+        myORF.fromBedtoFasta(sys.stdout)
+    profiler.writeReport(myCommandLine.args.profile)
 
 if __name__ == "__main__":
     main()
@@ -11,6 +11,8 @@
 #               python filterORFs.py < btRsPutativeSeq.fa > btRsFiltProt.fa
 #               python filterORFs.py < cvUrbaniPutativeSeq.fa > cvUrbaniFilProt.fa
 #
+#   Executable with genome index: python filterORFs.py -g SARSCoV2.fa > sars2FilProt.fa
+#
 #   Required module: FastAreader
 #   Purpose: match putative protein with scientific name and ignored nonfunctional proteins
 #   Condition(s): Dictinary need to be expanded due that some proteins need to be experimentally
@@ -19,55 +21,11 @@
 ##################################################################################################
 
 '''
-In this class, we define objects to read FastaA files inside the sequenceAnalysis program.
+FastA files are read with the FastAreader class of the shared sequenceAnalysis module.
 '''
-import sys
-class FastAreader:
-    ''' 
-    Define objects to read FastA files.
-    
-    instantiation: 
-    thisReader = FastAreader ('testTiny.fa')
-    usage:
-    for head, seq in thisReader.readFasta():
-        print (head,seq)
-    '''
-    def __init__ (self, fname=''):
-        '''contructor: saves attribute fname '''
-        self.fname = fname
-            
-    def doOpen (self):
-        ''' Handle file opens, allowing STDIN.'''
-        if self.fname is '':
-            return sys.stdin
-        else:
-            return open(self.fname)
-        
-    def readFasta (self):
-        ''' Read an entire FastA record and return the sequence header/sequence'''
-        header = ''
-        sequence = ''
-        
-        with self.doOpen() as fileH:
-            
-            header = ''
-            sequence = ''
-            
-            # skip to first fasta header
-            line = fileH.readline()
-            while not line.startswith('>') :
-                line = fileH.readline()
-            header = line[1:].rstrip()
-
-            for line in fileH:
-                if line.startswith ('>'):
-                    yield header,sequence
-                    header = line[1:].rstrip()
-                    sequence = ''
-                else :
-                    sequence += ''.join(line.rstrip().split()).upper()
-
-        yield header,sequence
+from sequenceAnalysis import FastAreader, FastAindex
+from annotationIndex import AnnotationIndex, parseRegion
+from pipelineProfiler import profiler, addProfileOption
 
 
 '''
@@ -79,69 +37,149 @@ class nameFinder:
     proteins are ignored. Output a file containing proteins of interest.
     '''
 
-    covidORFs = {'SARSCoV2 ORF1a': 'NC_045512.2:266-13483', 'SARSCoV2 ORF1ab': 'NC_045512.2:266-21555', 
-                'SARSCoV2 S': 'NC_045512.2:21562-25384', 'SARSCoV2 S': 'NC_045512.2:21536-25384',
-                'SARSCoV2 ORF3a': 'NC_045512.2:25393-26220', 'SARSCoV2 E': 'NC_045512.2:26245-26472', 
-                'SARSCoV2 M': 'NC_045512.2:26523-27191', 'SARSCoV2 ORF6': 'NC_045512.2:27202-27387', 
-                'SARSCoV2 ORF7a': 'NC_045512.2:27394-27759', 'SARSCoV2 ORF7b' : 'NC_045512.2:27756-27887',
-                'SARSCoV2 ORF8': 'NC_045512.2:27894-28259', 'SARSCoV2 N': 'NC_045512.2:28275-29533', 
-                'SARSCoV2 ORF10': 'NC_045512.2:29558-29674'}
-
-    ratG13 = {'ratG13 ORF1ab': 'MN996532.1:251-21537', 'ratG13 S': 'MN996532.1:21545-25354',
-              'ratG13 NS3': 'MN996532.1:25363-26190', 'ratG13 N': 'MN996532.1:28240-29499',
-              'ratG13 NS8': 'MN996532.1:27860-28225', 'ratG13 M': 'MN996532.1:26493-27158',
-              'ratG13 NS7a': 'MN996532.1:27360-27725', 'ratG13 E': 'MN996532.1:26215-26442',
-              'ratG13 NS6': 'MN996532.1:27169-27354', 'ratG13 NS7b': 'MN996532.1:27722-27853',
-              'ratG13 ORF1a': 'MN996532.1:251-13465' }
-
-    coronavirusUrbani = {'CoV_U S2': 'AY278741.1:648-1252', 'CoV_U NS8': 'AY278741.1:7-79',
-                         'CoV_U M': 'AY278741.1:3-220', 'CoV_U ORF3b': 'AY278741.1:1-153',
-                         'CoV_U S': 'AY278741.1:21492-25259', 'CoV_U S receptor binding': 'AY278741.1:318-569',
-                         'CoV_U M': 'AY278741.1:26398-27063','CoV_U PP1a': 'AY278741.1:265-13413' }
-
-
-    rs4231 = {'Rs4231 S2': 'KY417146.1:648-1252', 'Rs4231 NS8': 'KY417146.1:1-118',
-              'Rs4231 S receptor binding': 'KY417146.1:318-569', 'Rs4231 S': 'KY417146.1:21493-25260',
-              'Rs4231 M': 'KY417146.1:3-220', 'Rs4231 ORF3b': 'KY417146.1:1-114',
-              'Rs4231 ORF6': 'KY417146.1:27075-27266', 'Rs4231 ORF7b': 'KY417146.1:27639-27773',
-              'Rs4231 ORF8': 'KY417146.1:27780-28145', 'Rs4231 ORF7a': 'KY417146.1:27274-27642',
-              'Rs4231 ORF3a': 'KY417146.1:25269-26093', 'Rs4231 ORF1a': 'KY417146.1:265-13413'}
-
-    BtRsBetaCoV = {'BtRsBetaCoV ORF1ab': 'MK211376.1:264-21484', 'BtRsBetaCoV spike glycoprotein': 'MK211376.1:21491-25261',
-                   'BtRsBetaCoV Matrix': 'MK211376.1:26400-27065', 'BtRsBetaCoV S': 'MK211376.1:21491-25261', 
-                   'BtRsBetaCoV nucleocapsid': 'MK211376.1:28683-29951'}
+    covidORFs = [('SARSCoV2 ORF1a', 'NC_045512.2:266-13483'), ('SARSCoV2 ORF1ab', 'NC_045512.2:266-21555'), 
+                ('SARSCoV2 S', 'NC_045512.2:21562-25384'), ('SARSCoV2 S', 'NC_045512.2:21536-25384'),
+                ('SARSCoV2 ORF3a', 'NC_045512.2:25393-26220'), ('SARSCoV2 E', 'NC_045512.2:26245-26472'), 
+                ('SARSCoV2 M', 'NC_045512.2:26523-27191'), ('SARSCoV2 ORF6', 'NC_045512.2:27202-27387'), 
+                ('SARSCoV2 ORF7a', 'NC_045512.2:27394-27759'), ('SARSCoV2 ORF7b', 'NC_045512.2:27756-27887'),
+                ('SARSCoV2 ORF8', 'NC_045512.2:27894-28259'), ('SARSCoV2 N', 'NC_045512.2:28275-29533'), 
+                ('SARSCoV2 ORF10', 'NC_045512.2:29558-29674')]
+
+    ratG13 = [('ratG13 ORF1ab', 'MN996532.1:251-21537'), ('ratG13 S', 'MN996532.1:21545-25354'),
+              ('ratG13 NS3', 'MN996532.1:25363-26190'), ('ratG13 N', 'MN996532.1:28240-29499'),
+              ('ratG13 NS8', 'MN996532.1:27860-28225'), ('ratG13 M', 'MN996532.1:26493-27158'),
+              ('ratG13 NS7a', 'MN996532.1:27360-27725'), ('ratG13 E', 'MN996532.1:26215-26442'),
+              ('ratG13 NS6', 'MN996532.1:27169-27354'), ('ratG13 NS7b', 'MN996532.1:27722-27853'),
+              ('ratG13 ORF1a', 'MN996532.1:251-13465')]
+
+    coronavirusUrbani = [('CoV_U S2', 'AY278741.1:648-1252'), ('CoV_U NS8', 'AY278741.1:7-79'),
+                         ('CoV_U M', 'AY278741.1:3-220'), ('CoV_U ORF3b', 'AY278741.1:1-153'),
+                         ('CoV_U S', 'AY278741.1:21492-25259'), ('CoV_U S receptor binding', 'AY278741.1:318-569'),
+                         ('CoV_U M', 'AY278741.1:26398-27063'),('CoV_U PP1a', 'AY278741.1:265-13413')]
+
+
+    rs4231 = [('Rs4231 S2', 'KY417146.1:648-1252'), ('Rs4231 NS8', 'KY417146.1:1-118'),
+              ('Rs4231 S receptor binding', 'KY417146.1:318-569'), ('Rs4231 S', 'KY417146.1:21493-25260'),
+              ('Rs4231 M', 'KY417146.1:3-220'), ('Rs4231 ORF3b', 'KY417146.1:1-114'),
+              ('Rs4231 ORF6', 'KY417146.1:27075-27266'), ('Rs4231 ORF7b', 'KY417146.1:27639-27773'),
+              ('Rs4231 ORF8', 'KY417146.1:27780-28145'), ('Rs4231 ORF7a', 'KY417146.1:27274-27642'),
+              ('Rs4231 ORF3a', 'KY417146.1:25269-26093'), ('Rs4231 ORF1a', 'KY417146.1:265-13413')]
+
+    BtRsBetaCoV = [('BtRsBetaCoV ORF1ab', 'MK211376.1:264-21484'), ('BtRsBetaCoV spike glycoprotein', 'MK211376.1:21491-25261'),
+                   ('BtRsBetaCoV Matrix', 'MK211376.1:26400-27065'), ('BtRsBetaCoV S', 'MK211376.1:21491-25261'), 
+                   ('BtRsBetaCoV nucleocapsid', 'MK211376.1:28683-29951')]
         
-    # provides access to both dictionaries in single object 
-    context = dict(covidORFs.items() | ratG13.items() | rs4231.items() | BtRsBetaCoV.items() | coronavirusUrbani.items())
+    # provides access to all (name, region) lists in single object, duplicated names are kept
+    context = covidORFs + ratG13 + rs4231 + BtRsBetaCoV + coronavirusUrbani
+
+    def __init__(self, annotationFile='', minOverlap=0.9):
+        '''
+        Build the interval index of named ORFs, from an annotation file (BED or GFF) when
+        given, otherwise from the lists above
+        '''
+        self.minOverlap = minOverlap
+        self.annotation = AnnotationIndex()
+        if annotationFile:
+            self.annotation.loadFile(annotationFile)
+        else:
+            self.annotation.addRegions(self.context)
+
+    def nameRecords(self, records):
+        '''
+        Match the header (accession:start-end) of every (header, sequence) record with the
+        annotated gene sharing most of its interval and yield (name, sequence) for the named
+        ones, so coordinates a few bases off still get their name
+        '''
+        for header, sequence in records:
+            with profiler.stage('nameORFs'):
+                region = parseRegion(header.split()[0]) if header.split() else None
+                if region is None:
+                    continue
+                # matches gene with scientific name
+                name = self.annotation.bestMatch(*region, minOverlap=self.minOverlap)
+            if name is not None:
+                profiler.count('namedORFs')
+                yield name, sequence
 
     def findName(self):
         '''
-        Read thoughout dictionaries and matches genes
+        Read thoughout the fasta records and print the ORFs matching an annotated gene
+        with their scientific name
         '''
-        orfDict = self.context.items() # access dictionaries items
         inFasta = FastAreader()
-        for fasta in inFasta.readFasta():
-            header, sequence = fasta
-            pass
-            
-            # acces genes fasta files
-            for key, value in orfDict: 
-                if header == value:
-                    # matches gene with scientific name
-                    header = key
-                    print(">{}".format(key)) 
-                    print(sequence + '\n')
-                    pass
-                else:
-                   pass
-             
-def main():
+        records = profiler.iterate('readFasta', inFasta.readFasta(), countRecords=True)
+        for name, sequence in self.nameRecords(records):
+            with profiler.stage('writeFasta'):
+                print(">{}".format(name)) 
+                print(sequence + '\n')
+
+    def fetchNames(self, genomeFile):
+        '''
+        Read the named ORFs straight from an indexed genome fasta file. Each ORF region is
+        fetched from the memory-mapped genome, so multi-genome files are not rescanned.
+        '''
+        with profiler.stage('indexGenome'):
+            genome = FastAindex(genomeFile)
+        with genome:
+            for accession in self.annotation.features:
+                if accession in genome:
+                    starts, ends, names = self.annotation.getSorted(accession)[:3]
+                    for start, end, name in zip(starts, ends, names):
+                        with profiler.stage('fetchFasta'):
+                            sequence = genome.fetch(accession, start, end)
+                        profiler.count('namedORFs')
+                        profiler.count('bases', len(sequence))
+                        # matches gene with scientific name
+                        with profiler.stage('writeFasta'):
+                            print(">{}".format(name))
+                            print(sequence + '\n')
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='filterORFs.py - names putative proteins of known ORFs',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] <input >output'
+            )
+        self.parser.add_argument('-g', '--genome', action='store', default='',
+                                 help='indexed genome fasta file to fetch named ORFs from instead of stdin')
+        self.parser.add_argument('-a', '--annotation', action='store', default='',
+                                 help='BED or GFF file of named genes used instead of the built-in lists')
+        self.parser.add_argument('-mO', '--minOverlap', type=float, default=0.9, action='store',
+                                 help='minimum shared fraction of the ORF and gene intervals to name an ORF')
+        addProfileOption(self.parser)
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+def main(inCL=None):
     '''
     Call functions and output file
     '''
-    myName = nameFinder()
-    output = myName.findName()
-    print(output) 
+    myCommandLine = CommandLine(inCL)
+    if myCommandLine.args.profile:
+        profiler.enable('filterORFs.py')
+    with profiler.stage('loadAnnotation'):
+        myName = nameFinder(myCommandLine.args.annotation, myCommandLine.args.minOverlap)
+    if myCommandLine.args.genome:
+        myName.fetchNames(myCommandLine.args.genome)
+    else:
+        output = myName.findName()
+        print(output) 
+    profiler.writeReport(myCommandLine.args.profile)
 
 if __name__ == "__main__":
     main()
@@ -13,12 +13,29 @@
 #                        python findORFs.py -lG -s "ATG" -mG 100< coronavirusBtRs.fa > coronavirusBtRs.bed
 #  
 #   Multiple fastas execution: python findORFs.py -lG -s "ATG" -mG 0 < lab5test.fa > tass2ORFdata-ATG-100.txt
+#   Parallel execution: python findORFs.py -lG -s "ATG" -mG 100 -j 32 < cohort.fa > cohort.bed
+#   Longest ORFs only: python findORFs.py -mG 100 -t 10 < cohort.fa > cohortTop10.bed
+#                      python findORFs.py -mG 100 -t 10 -tF < cohort.fa > cohortTop10.bed
+#   Binary table output: python findORFs.py -mG 100 -b cohort.npy < cohort.fa
+#   Alternative starts: python findORFs.py -gC 11 -mG 100 < SARSCoV2.fa > sars2Table11.bed
+#                       python findORFs.py -s ATG -s CTG -s GTG -nO -mG 100 < SARSCoV2.fa > sars2Nested.bed
 #   Pupose: find open reading frames in the complement and reverse complement of a fasta file.
 #           Program was built to be executed in stdin and stdout.
+#   Condition: ORF calls are cached in ~/.cache/sars2ORFs/orfCache.sqlite by default, --cache or
+#              the ORF_CACHE environment variable give another file and --noCache turns it off.
 #
 #
 #####################################################################################################
 
+import collections
+import functools
+import heapq
+import itertools
+import orfCache
+import orfEngine
+import orfTable
+from packedSequence import PackedSequence
+from pipelineProfiler import profiler, addProfileOption
 import sequenceAnalysis
 import sys
 
@@ -50,21 +67,57 @@ class CommandLine():
             usage='%(prog)s [options] -option1[default] <input >output'
             )
         self.parser.add_argument('-lG', '--longestGene', action='store', nargs='?', const=True, default=True,
-                                 help='longest Gene in an ORF')
+                                 type=booleanText, help='longest Gene in an ORF, -lG no also reports the nested ORFs')
+        self.parser.add_argument('-nO', '--nested', action='store_false', dest='longestGene',
+                                 help='report the nested ORFs of every start codon, same as -lG no')
         self.parser.add_argument('-mG', '--minGene', type=int, choices=range(0, 1000), default=100, action='store',
                                  help='minimum Gene length')
         self.parser.add_argument('-s', '--start', action='append', nargs='?',
                                  help='start Codon')  # allows multiple list options
+        self.parser.add_argument('-S', '--stop', action='append', nargs='?',
+                                 help='stop Codon, may be repeated')
+        self.parser.add_argument('-gC', '--geneticCode', type=int, default=None, action='store',
+                                 help='NCBI genetic code whose start and stop codons are used, e.g. 11 for CTG/GTG/TTG starts')
+        self.parser.add_argument('-t', '--top', type=int, default=0, action='store',
+                                 help='write only the K longest ORFs of each record (default all)')
+        self.parser.add_argument('-tF', '--topPerFile', action='store_true', default=False,
+                                 help='with --top, keep the K longest ORFs of the whole input instead')
+        self.parser.add_argument('-b', '--binary', action='store', default='',
+                                 help='write the ORFs in a binary table (see orfTable.py) instead of stdout')
+        self.parser.add_argument('-j', '--jobs', type=int, default=1, action='store',
+                                 help='number of worker processes used to find ORFs')
+        self.parser.add_argument('-cS', '--chunkSize', type=int, default=4, action='store',
+                                 help='number of fasta records sent to a worker at a time')
+        addProfileOption(self.parser)
+        orfCache.addCacheOptions(self.parser)
         self.parser.add_argument('-v', '--version', action='version', version='%(prog)s 0.1')
         if inOpts is None:
             self.args = self.parser.parse_args()
         else:
             self.args = self.parser.parse_args(inOpts)
 
+def booleanText(text):
+    '''Return the boolean of a yes/no, true/false or 1/0 option value'''
+    if isinstance(text, bool):
+        return text
+    if text.lower() in ('yes', 'y', 'true', 't', '1'):
+        return True
+    if text.lower() in ('no', 'n', 'false', 'f', '0'):
+        return False
+    import argparse
+    raise argparse.ArgumentTypeError('expected yes or no, not {}'.format(text))
+
 #####################################################################################################
 # ORFfinder Class
 #####################################################################################################
 
+startCodons = ('ATG',) # default start codons
+stopCodons = ('TAG', 'TAA', 'TGA') # default stop codons
+
+def codonTuple(codons, default):
+    '''Return upper case DNA codons as a tuple, or default when no codon is given'''
+    return tuple(codon.upper().replace('U', 'T') for codon in codons) if codons else default
+
 class ORFfinder():
     '''
     This class find open reading frames (ORFs) in an input fasta file. An ORF is defined 
@@ -76,75 +129,43 @@ class ORFfinder():
     to find ORFs.
     '''
     complement = {'A': 'T', 'G': 'C', 'C': 'G', 'T': 'A'} # DNA complement dictionary
-    orfsList = [[], [], []] # creates a list of list
-    startPosition = [] # list stores the found start codon positions  
-    stopPosition = [] # list stores the stop codons positions
+    complementTable = str.maketrans(complement) # translation table built from the dictionary
     
-    def __init__(self, seq):
-        '''Initialize the program and create list for stop and start codons'''
+    def __init__(self, seq, starts=startCodons, stops=stopCodons, longest=True):
+        '''Initialize the program and create list for stop and start codons, longest False adds nested ORFs'''
+        # per instance lists, so finders running in the same process never share results
+        self.orfsList = [[], [], []] # creates a list of list
+        self.startPosition = [] # list stores the found start codon positions  
+        self.stopPosition = [] # list stores the stop codons positions
         self.seq = seq
-        self.inSeq = seq.replace(' ', '') # removes spaces in fasta sequence
-        self.startCodon = ['ATG'] # start codon list 
-        self.stopCodon = ['TAG', 'TAA', 'TGA'] # stop codons list
+        if isinstance(seq, PackedSequence):
+            # packed sequences are used as they are, codes are unpacked from the 2-bit store
+            self.inSeq = seq
+            self.codes = seq.codes()
+        else:
+            self.inSeq = seq.replace(' ', '') # removes spaces in fasta sequence
+            # encode the sequence once, both strands reuse the same array
+            self.codes = orfEngine.encodeSequence(self.inSeq)
+        self.startCodon = list(starts) # start codon list 
+        self.stopCodon = list(stops) # stop codons list
+        self.longestGene = longest
+        self.engine = orfEngine.ORFengine(self.startCodon, self.stopCodon, self.longestGene)
 
     def findORF(self):
         '''
-        Find ORFs on complement strand and return a list. Define a codon as 3 nucleotides
-        and find the positions of stop and start codons for each frame: 1, 2, 3.
+        Find ORFs on complement strand and return a list. Start and stop codon positions
+        for each frame: 1, 2, 3 are found on the encoded sequence by the ORFengine.
         '''
-        for frame in range(3):
-            #self.stopPosition.clear()
-            for position in range(frame, len(self.inSeq), 3):
-                # defines a codon as 3 nucleotides 
-                codon = self.inSeq[position: position+3]
-                # if codon is a start codon save its position to list
-                if codon in self.startCodon:
-                    self.startPosition.append(position)
-                    pass
-
-                 # if codon is a stop codon save its positio to list
-                if codon in self.stopCodon:
-                    self.stopPosition.append(position)
-                    # save frame and position if start position was not found and position equal to 1
-                    if self.startPosition:
-                        if not self.orfsList[frame] and len(self.stopPosition) == 1:
-                            # save ORFs elements if found position to list
-                            self.saveORF(0, position+3, position+3, frame)
-                            self.startPosition.clear()
-                        else: # if position not found, save ORFs elements
-                            length = (position + 3) - self.startPosition[0]
-                            self.saveORF(self.startPosition[0], (position+3), length,frame)
-                            self.startPosition.clear()
-                            pass
-
-                    # save frame and position if start position was not found and position equal to 1
-                    if not self.orfsList[frame] and len(self.stopPosition) == 1:
-                        self.saveORF(0, position+3, position+3, frame)
-
-                # save length and frame when position and start codon found
-                if position == len(self.inSeq) - 4:
-                    if self.startPosition:
-                        length = (len(self.inSeq) - 1) - self.startPosition[0]
-                        self.saveORF(self.startPosition[0], (len(self.inSeq) - 1), length, frame)
-                        pass
-
+        self.orfsList = self.engine.findFrames(self.codes)
         return self.orfsList
 
     def findReverseORF(self):
         '''
-        Find ORFs on the reverse complement strand and return a list. Method reuses the findORF 
-        function to find ORFs in the reverse complement strand: -1, -2, -3.
+        Find ORFs on the reverse complement strand and return a list. Method runs the same
+        engine over the encoded reverse complement strand: -1, -2, -3.
         '''
-        self.orfsList = [[], [], []] # creates a list of list
-        self.startPosition.clear() # clears start codon positions list 
-        self.stopPosition.clear() # clears stop codons positions list
-        pass
-        
-        # reverse complement sequence 
-        reverseComp = self.reverseComplement() 
-        # find ORFs in the reverse complement
-        self.inSeq = reverseComp  
-        return self.findORF()
+        self.orfsList = self.engine.findFrames(orfEngine.reverseCodes(self.codes))
+        return self.orfsList
 
     def saveORF(self, start, stop, length, frame):
         '''
@@ -156,7 +177,116 @@ class ORFfinder():
         '''
         Define and return reverse complement of input DNA sequence
         '''
-        return ''.join(self.complement.get(base, base) for base in self.inSeq[::-1])
+        if isinstance(self.inSeq, PackedSequence):
+            return self.inSeq.reverseComplement()
+        return self.inSeq[::-1].translate(self.complementTable)
+
+def genomeCoordinates(orfList, reverseFrames, seqLength):
+    '''
+    Return the ORFs of both strands, as found by ORFfinder.findORF and findReverseORF, as
+    (frame, start, stop, length) tuples with 1-based coordinates on the forward strand,
+    forward frames +1, +2, +3 and reverse frames -1, -2, -3.
+    '''
+    framesList = []
+    # acces ORFs in the complement strand
+    for list in orfList:
+        # define elements complement in ORFs
+        for element in list:
+            frame = element[0] + 1 # find ORFs frame
+            start = element[1] + 1 # find ORFs start position
+            stop = element[2] # find ORFs stop position
+            # append all ORFs elements to list
+            framesList.append((frame, start, stop, element[3]))
+
+    # access ORFs in the reverse complement strand
+    for list in reverseFrames:
+        # define elements in reverse ORFs
+        for element in list:
+            frame = element[0] + 1 # find ORFs' frame
+            start = seqLength - (element[2]) + 1 # find ORFs' start position
+            stop = seqLength - (element[1] + 1)  + 1 # find ORFs' stop position
+            # append all reverse ORFs' elements to list
+            framesList.append((-frame, start, stop, element[3]))
+
+    return framesList
+
+def findFrames(record, starts=startCodons, stops=stopCodons, longest=True):
+    '''
+    Find the ORFs of one fasta record and return its header and ORF list. ORFs are returned
+    as (frame, start, stop, length) tuples with 1-based coordinates, forward frames +1, +2, +3
+    and reverse frames -1, -2, -3. Defined at module level so worker processes can call it.
+    '''
+    header, sequence = record
+    # print header in stdout format
+    head = header.rstrip().split()
+    newHeader = head[0] if head else header
+    # genomes seen before are read from the cache, keyed by sequence and codons
+    cache = orfCache.activeCache
+    if cache is not None:
+        parameters = {'starts': list(starts), 'stops': list(stops)}
+        if not longest:
+            parameters['nested'] = True
+        key = cache.key('orfs', sequence, **parameters)
+        framesList = cache.getORFs(key)
+        if framesList is not None:
+            return newHeader, framesList
+    # read sequence in fasta and call class
+    myFinder = ORFfinder(sequence, starts, stops, longest)
+    # find ORFs in complement strand 
+    orfList = myFinder.findORF()
+    # find ORFs in reverse complement strand
+    reverseFrames = myFinder.findReverseORF()
+    framesList = genomeCoordinates(orfList, reverseFrames, len(sequence))
+
+    if cache is not None:
+        cache.putORFs(key, framesList)
+    return newHeader, framesList
+
+def mapRecords(records, jobs=1, chunkSize=4, starts=startCodons, stops=stopCodons, longest=True):
+    '''
+    Yield (header, ORF list) for every fasta record in input order. With jobs > 1 records are
+    sent in chunks to a pool of worker processes, so a single 30 kb genome does not pay for a
+    whole process round-trip. At most two chunks per worker are read ahead, so memory does not
+    grow with the number of records piped in.
+    '''
+    # the codons travel with every call, so workers need no setup for them
+    finder = functools.partial(findFrames, starts=tuple(starts), stops=tuple(stops), longest=longest)
+    if jobs <= 1:
+        for record in records:
+            yield finder(record)
+        return
+
+    import multiprocessing
+    # workers use the cache of the main process
+    cache = orfCache.activeCache
+    cacheArgs = (cache.path, cache.maxBytes) if cache is not None else ('',)
+    records = iter(records)
+    with multiprocessing.Pool(processes=jobs, initializer=orfCache.configure, initargs=cacheArgs) as pool:
+        pending = collections.deque() # chunks sent to the workers, in input order
+        for chunk in iter(lambda: list(itertools.islice(records, chunkSize)), []):
+            pending.append(pool.map_async(finder, chunk, chunksize=len(chunk)))
+            if len(pending) >= 2 * jobs:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+def orfOrder(orf):
+    '''Sort key of the output: longest ORFs first, then the larger start first'''
+    return orf[3], orf[1]
+
+def topORFs(orfs, minGene=100, top=0):
+    '''
+    Return the ORFs of at least minGene bases, longest first. With top only the top longest
+    are returned, kept in a heap of top entries, so the cost is O(n log top).
+    '''
+    orfs = (orf for orf in orfs if orf[3] >= minGene)
+    if top > 0:
+        return heapq.nlargest(top, orfs, key=orfOrder)
+    return sorted(orfs, key=orfOrder, reverse=True)
+
+def formatORF(newHeader, orf):
+    '''Return the output line of one ORF'''
+    return '{} {:>5d} {:>5d} {:>5d} ORF {:+d}\n'.format(newHeader, orf[1], orf[2], orf[3], orf[0])
 
 def main(inCL=None):
     '''
@@ -164,62 +294,61 @@ def main(inCL=None):
     Read in fasta file in stdin, calculates ORFs: frames, starts, stops, and lengths, 
     and returns a file. Function calculates the ORFs in complement strand first, and then,
     it calculates the ORFs in reverse complement strand and uses the stdout method to return
-    the output file with ORFs.
+    the output file with ORFs. Records are written as they are read, so memory stays the same
+    for any number of genomes; with --top --topPerFile only the heap of top ORFs is kept.
     '''
-    framesList = [] 
-    if inCL is None:
-        myCommandLine = CommandLine()
-        if myCommandLine.args.longestGene:
-            fastaFile = sequenceAnalysis.FastAreader()
-            framesList.clear()
-            # reads fasta file 
-            for header, sequence in fastaFile.readFasta():
-                # print header in stdout format
-                head = header.rstrip().split()
-                newHeader = head[0]
-                #sys.stdout.write(header + '\n')
-                # read sequence in fasta and call class
-                myFinder = ORFfinder(sequence)
-                # find ORFs in complement strand 
-                orfList = myFinder.findORF()
-                # find ORFs in reverse complement strand
-                reverseFrames = myFinder.findReverseORF()
-                pass
-
-                # acces ORFs in the complement strand
-                for list in orfList:
-                    # define elements complement in ORFs
-                    for element in list:
-                        frame = element[0] + 1 # find ORFs frame
-                        start = element[1] + 1 # find ORFs start position
-                        stop = element[2] # find ORFs stop position
-                        # append all ORFs elements to list
-                        framesList.append((frame, start, stop, element[3]))
-                        pass
-
-                # access ORFs in the reverse complement strand
-                for list in reverseFrames:
-                    # define elements in reverse ORFs
-                    for element in list:
-                        frame = element[0] + 1 # find ORFs' frame
-                        start = len(sequence) - (element[2]) + 1 # find ORFs' start position
-                        stop = len(sequence) - (element[1] + 1)  + 1 # find ORFs' stop position
-                        # append all reverse ORFs' elements to list
-                        framesList.append((-frame, start, stop, element[3]))
-                        pass
-
-                # sort ORFs and print file
-                framesList.sort(key=lambda tup: (tup[3], tup[1]), reverse=True)
-                for orf in framesList:
-                    # returns or greater or equal to the minum gene length argument called
-                    if orf[3] >= myCommandLine.args.minGene:
-                        sys.stdout.write('{} {:>5d} {:>5d} {:>5d} ORF {:+d}\n'.format(newHeader, orf[1], orf[2], orf[3], orf[0]))
+    myCommandLine = CommandLine(inCL)
+    args = myCommandLine.args
+    if args.profile:
+        profiler.enable('findORFs.py')
+    cache = orfCache.configureFromArgs(args)
+    starts = [codon for codon in args.start or [] if codon]
+    stops = [codon for codon in args.stop or [] if codon]
+    if args.geneticCode is not None:
+        import translationEngine
+        starts = starts or translationEngine.startCodons(args.geneticCode)
+        stops = stops or translationEngine.stopCodons(args.geneticCode)
+    starts, stops = codonTuple(starts, startCodons), codonTuple(stops, stopCodons)
+    writer = orfTable.ORFtableWriter(args.binary) if args.binary else None
+    fastaFile = sequenceAnalysis.FastAreader()
+    # reads fasta file, records are processed by one or more worker processes
+    records = profiler.iterate('readFasta', fastaFile.readFasta(), countRecords=True)
+    results = profiler.iterate('findORFs', mapRecords(records, args.jobs, args.chunkSize,
+                                                       starts, stops, args.longestGene))
+    if args.top > 0 and args.topPerFile:
+        # one heap of the longest ORFs over every record, each ORF keeps its header
+        def recordORFs():
+            for newHeader, orfs in results:
+                profiler.count('orfs', len(orfs))
+                for orf in orfs:
+                    if orf[3] >= args.minGene:
+                        yield newHeader, orf
+        with profiler.stage('sortORFs'):
+            best = heapq.nlargest(args.top, recordORFs(), key=lambda item: orfOrder(item[1]))
+        with profiler.stage('writeORFs'):
+            for newHeader, orf in best:
+                if writer is not None:
+                    writer.addRecord(newHeader, [orf])
+                else:
+                    sys.stdout.write(formatORF(newHeader, orf))
     else:
-        myCommandLine = CommandLine(inCL)
+        for newHeader, orfs in results:
+            profiler.count('orfs', len(orfs))
+            # sort ORFs of the record and print them
+            with profiler.stage('sortORFs'):
+                orfs = topORFs(orfs, args.minGene, args.top)
+            with profiler.stage('writeORFs'):
+                if writer is not None:
+                    writer.addRecord(newHeader, orfs)
+                else:
+                    sys.stdout.write(''.join([formatORF(newHeader, orf) for orf in orfs]))
+    if writer is not None:
+        writer.close()
+    if cache is not None:
+        profiler.count('cacheHits', cache.hits)
+        profiler.count('cacheMisses', cache.misses)
+    profiler.writeReport(args.profile)
 
 
 if __name__ == "__main__":
     main()
-
-
-
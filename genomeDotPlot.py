@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: genomeDotPlot.py
+#   Executable: python genomeDotPlot.py -q SARSCoV2.fa -t ratG13.fa -k 12 -o sars2VsRatG13.pgm
+#               python genomeDotPlot.py -q SARSCoV2.fa -t SARSCoV2.fa -k 16 -r -o sars2Self.pgm
+#
+#   Required module: numpy, sequenceAnalysis, orfEngine
+#   Purpose: whole genome nucleotide dot plots (e.g. SARS-CoV-2 vs RaTG13, 30k x 30k bases).
+#            The k-mers of the target genome are indexed once, the query genome is streamed
+#            against the index in chunks and only matching diagonal runs are kept, so memory
+#            scales with the number of hits instead of the product of the genome lengths.
+#            Runs are rendered into downsampled density images, whole or as tiles.
+#   Condition(s): k is at most 31 (k-mers are packed in 64-bit integers), k-mers with N or
+#                 ambiguity codes are skipped. Images are written as binary PGM files.
+#
+#################################################################################################
+
+import sys
+
+import numpy as np
+
+import orfEngine
+from sequenceAnalysis import FastAreader
+
+# diagonal run fields: query start, target start, length and strand (+1 or -1)
+runType = np.dtype([('queryStart', np.int64), ('targetStart', np.int64), ('length', np.int64), ('strand', np.int8)])
+
+
+def kmerCodes(codes, k):
+    '''
+    Return (kmers, valid) for every k-mer start of an encoded sequence: kmers packs the k bases
+    in 2 bits each and valid is False for k-mers holding a non-ACGT base.
+    '''
+    count = len(codes) - k + 1
+    if count <= 0:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=bool)
+    kmers = np.zeros(count, dtype=np.uint64)
+    invalid = np.zeros(count, dtype=bool)
+    for offset in range(k):
+        window = codes[offset:offset + count]
+        kmers = (kmers << np.uint64(2)) | (window & 3).astype(np.uint64)
+        invalid |= window > 3
+    return kmers, ~invalid
+
+
+class KmerIndex():
+    '''
+    Sorted k-mer index of one genome. Lookups are binary searches over the sorted k-mers.
+
+    instantiation:
+    thisIndex = KmerIndex(targetSequence, k=12)
+    usage:
+    queryPositions, targetPositions = thisIndex.lookup(queryKmers, queryPositions)
+    '''
+
+    def __init__(self, sequence, k=12, maxOccurrences=100):
+        '''Index the valid k-mers of a sequence, ignoring k-mers repeated more than maxOccurrences times'''
+        if not 0 < k <= 31:
+            raise ValueError('k must be between 1 and 31, got {}'.format(k))
+        self.k = k
+        self.length = len(sequence)
+        kmers, valid = kmerCodes(orfEngine.encodeSequence(sequence), k)
+        positions = np.flatnonzero(valid)
+        order = np.argsort(kmers[positions], kind='stable')
+        self.kmers = kmers[positions][order]
+        self.positions = positions[order]
+        self.maxOccurrences = maxOccurrences
+
+    def lookup(self, kmers, queryPositions):
+        '''Return the (query, target) position pairs of every indexed match of the given k-mers'''
+        first = np.searchsorted(self.kmers, kmers, side='left')
+        last = np.searchsorted(self.kmers, kmers, side='right')
+        counts = last - first
+        # repeated k-mers would flood the plot with off-diagonal noise
+        counts[counts > self.maxOccurrences] = 0
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        queryHits = np.repeat(queryPositions, counts)
+        # index of every hit inside the sorted k-mer array
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        targetHits = self.positions[np.repeat(first, counts) + offsets]
+        return queryHits, targetHits
+
+
+def hitsToRuns(queryHits, targetHits, k, strand=1):
+    '''
+    Collapse k-mer hits into diagonal runs. Hits on the same diagonal with consecutive query
+    positions form one run covering the query bases of all their k-mers.
+    '''
+    if len(queryHits) == 0:
+        return np.empty(0, dtype=runType)
+    diagonals = targetHits - strand * queryHits
+    order = np.lexsort((queryHits, diagonals))
+    queryHits, targetHits, diagonals = queryHits[order], targetHits[order], diagonals[order]
+    # a new run starts where the diagonal changes or the query position jumps
+    breaks = np.flatnonzero((np.diff(diagonals) != 0) | (np.diff(queryHits) != 1)) + 1
+    firsts = np.concatenate(([0], breaks))
+    lasts = np.concatenate((breaks, [len(queryHits)])) - 1
+    runs = np.empty(len(firsts), dtype=runType)
+    runs['queryStart'] = queryHits[firsts]
+    runs['targetStart'] = targetHits[firsts] if strand == 1 else targetHits[lasts]
+    runs['length'] = queryHits[lasts] - queryHits[firsts] + k
+    runs['strand'] = strand
+    return runs
+
+
+def mergeRuns(runs):
+    '''Merge runs of the same strand and diagonal that touch or overlap, e.g. across chunks'''
+    if len(runs) == 0:
+        return runs
+    strands = runs['strand'].astype(np.int64)
+    # forward runs keep target - query, reverse runs keep target + query + length
+    diagonals = np.where(strands == 1, runs['targetStart'] - runs['queryStart'],
+                         runs['targetStart'] + runs['queryStart'] + runs['length'])
+    order = np.lexsort((runs['queryStart'], diagonals, strands))
+    runs, diagonals, strands = runs[order], diagonals[order], strands[order]
+    merged = []
+    current = runs[0].copy()
+    for index in range(1, len(runs)):
+        run = runs[index]
+        sameDiagonal = strands[index] == current['strand'] and diagonals[index] == diagonals[index - 1]
+        if sameDiagonal and run['queryStart'] <= current['queryStart'] + current['length']:
+            end = max(current['queryStart'] + current['length'], run['queryStart'] + run['length'])
+            if current['strand'] == -1:
+                current['targetStart'] = min(current['targetStart'], run['targetStart'])
+            current['length'] = end - current['queryStart']
+        else:
+            merged.append(current)
+            current = run.copy()
+    merged.append(current)
+    return np.array(merged, dtype=runType)
+
+
+def findRuns(query, index, chunkSize=1000000, minLength=0, reverse=False):
+    '''
+    Stream the query sequence against a KmerIndex in chunks of chunkSize k-mers and return the
+    diagonal runs at least minLength bases long. With reverse, reverse complement matches are
+    added with strand -1 (query coordinates stay on the forward strand).
+    '''
+    k = index.k
+    codes = orfEngine.encodeSequence(query)
+    strands = [(1, codes)]
+    if reverse:
+        strands.append((-1, orfEngine.reverseCodes(codes)))
+    allRuns = []
+    for strand, strandCodes in strands:
+        kmerTotal = max(len(strandCodes) - k + 1, 0)
+        for chunkStart in range(0, kmerTotal, chunkSize):
+            chunkEnd = min(chunkStart + chunkSize, kmerTotal)
+            kmers, valid = kmerCodes(strandCodes[chunkStart:chunkEnd + k - 1], k)
+            positions = np.flatnonzero(valid)
+            queryHits, targetHits = index.lookup(kmers[positions], positions + chunkStart)
+            if strand == -1:
+                # position of the k-mer on the forward query strand
+                queryHits = len(strandCodes) - k - queryHits
+            allRuns.append(hitsToRuns(queryHits, targetHits, k, strand))
+    runs = mergeRuns(np.concatenate(allRuns)) if allRuns else np.empty(0, dtype=runType)
+    return runs[runs['length'] >= minLength]
+
+
+def densityImage(runs, queryLength, targetLength, width=1000, height=1000, queryRange=None, targetRange=None):
+    '''
+    Render runs into a height x width float array counting matching bases per pixel. Rows
+    follow the query and columns the target. queryRange and targetRange (start, end) select
+    a window of the plot, used to render tiles.
+    '''
+    queryStart, queryEnd = queryRange if queryRange else (0, queryLength)
+    targetStart, targetEnd = targetRange if targetRange else (0, targetLength)
+    image = np.zeros((height, width), dtype=np.float64)
+    if len(runs) == 0:
+        return image
+    rowScale = height / max(queryEnd - queryStart, 1)
+    columnScale = width / max(targetEnd - targetStart, 1)
+    # sample every run about once per pixel along its diagonal
+    step = max(1, int(min(1 / rowScale, 1 / columnScale)))
+    samples = (runs['length'] + step - 1) // step
+    runIndex = np.repeat(np.arange(len(runs)), samples)
+    offsets = (np.arange(samples.sum()) - np.repeat(np.cumsum(samples) - samples, samples)) * step
+    queryPoints = runs['queryStart'][runIndex] + offsets
+    strands = runs['strand'][runIndex].astype(np.int64)
+    targetPoints = np.where(strands == 1, runs['targetStart'][runIndex] + offsets,
+                            runs['targetStart'][runIndex] + runs['length'][runIndex] - 1 - offsets)
+    weights = np.minimum(step, runs['length'][runIndex] - offsets)
+    inside = (queryPoints >= queryStart) & (queryPoints < queryEnd) & (targetPoints >= targetStart) & (targetPoints < targetEnd)
+    rows = ((queryPoints[inside] - queryStart) * rowScale).astype(np.int64)
+    columns = ((targetPoints[inside] - targetStart) * columnScale).astype(np.int64)
+    np.add.at(image, (np.minimum(rows, height - 1), np.minimum(columns, width - 1)), weights[inside])
+    return image
+
+
+def writePGM(image, fname):
+    '''Write a density image as an 8-bit binary PGM file, darker pixels hold more matches'''
+    scaled = np.log1p(image)
+    if scaled.max() > 0:
+        scaled = scaled / scaled.max()
+    pixels = (255 - scaled * 255).astype(np.uint8)
+    with open(fname, 'wb') as fileH:
+        fileH.write('P5\n{} {}\n255\n'.format(pixels.shape[1], pixels.shape[0]).encode('ascii'))
+        fileH.write(pixels.tobytes())
+
+
+def writeTiles(runs, queryLength, targetLength, prefix, level=1, tileSize=512):
+    '''
+    Write the plot as 2**level x 2**level tiles of tileSize pixels named
+    <prefix>_<level>_<row>_<column>.pgm and return the file names.
+    '''
+    tiles = 2 ** level
+    names = []
+    for row in range(tiles):
+        queryRange = (row * queryLength // tiles, (row + 1) * queryLength // tiles)
+        for column in range(tiles):
+            targetRange = (column * targetLength // tiles, (column + 1) * targetLength // tiles)
+            image = densityImage(runs, queryLength, targetLength, tileSize, tileSize, queryRange, targetRange)
+            name = '{}_{}_{}_{}.pgm'.format(prefix, level, row, column)
+            writePGM(image, name)
+            names.append(name)
+    return names
+
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='genomeDotPlot.py - k-mer dot plot of two genomes',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] >runs'
+            )
+        self.parser.add_argument('-q', '--query', action='store', required=True,
+                                 help='query genome fasta file (plot rows), first record is used')
+        self.parser.add_argument('-t', '--target', action='store', required=True,
+                                 help='target genome fasta file (plot columns), first record is used')
+        self.parser.add_argument('-k', '--kmer', type=int, default=12, action='store',
+                                 help='k-mer length (1-31)')
+        self.parser.add_argument('-mL', '--minLength', type=int, default=0, action='store',
+                                 help='minimum diagonal run length')
+        self.parser.add_argument('-r', '--reverse', action='store_true', default=False,
+                                 help='also plot reverse complement matches')
+        self.parser.add_argument('-o', '--output', action='store', default='',
+                                 help='density image (.pgm) to write')
+        self.parser.add_argument('-s', '--size', type=int, default=1000, action='store',
+                                 help='image width and height in pixels')
+        self.parser.add_argument('-l', '--tileLevel', type=int, default=0, action='store',
+                                 help='write 2**level x 2**level tiles instead of one image')
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+
+def main(inCL=None):
+    '''
+    Plot two genomes: write the diagonal runs as text in stdout and, when asked, the density
+    image or tiles
+    '''
+    myCommandLine = CommandLine(inCL)
+    args = myCommandLine.args
+    records = []
+    for fname in (args.query, args.target):
+        record = next(FastAreader(fname).readFasta(), None)
+        if record is None:
+            myCommandLine.parser.error('no fasta record in {}'.format(fname))
+        records.append(record)
+    (queryHeader, query), (targetHeader, target) = records
+    index = KmerIndex(target, args.kmer)
+    runs = findRuns(query, index, minLength=args.minLength, reverse=args.reverse)
+    queryName, targetName = queryHeader.split()[0], targetHeader.split()[0]
+    for run in runs:
+        sys.stdout.write('{} {:>6d} {} {:>6d} {:>6d} {:+d}\n'.format(
+            queryName, run['queryStart'], targetName, run['targetStart'], run['length'], run['strand']))
+    if args.output:
+        if args.tileLevel:
+            prefix = args.output[:-4] if args.output.endswith('.pgm') else args.output
+            writeTiles(runs, len(query), len(target), prefix, args.tileLevel, args.size)
+        else:
+            writePGM(densityImage(runs, len(query), len(target), args.size, args.size), args.output)
+
+if __name__ == "__main__":
+    main()
@@ -11,90 +11,82 @@
 #               python getCodingSeq.py < sarsRs4231Seq.fa > sarsRs4231PutativeSeq.fa
 #               python getCodingSeq.py < coronavirusUrbaniSeq.fa > cvUrbaniPutativeSeq.fa
 #
-#   Required module: FastAreader
+#   Required module: FastAreader, pipelineProfiler
 #   Purpose: Obtain putative proteins (codin sequences) from each gene or fasta file
 #   Condition(s): None 
 #
 ##################################################################################################
 
-import sys
-
 '''
-In this class, we define objects to read FastaA files inside the sequenceAnalysis program.
+FastA files are read with the FastAreader class of the shared sequenceAnalysis module.
 '''
-class FastAreader :
-    ''' 
-    Define objects to read FastA files.
-    
-    instantiation: 
-    thisReader = FastAreader ('testTiny.fa')
-    usage:
-    for head, seq in thisReader.readFasta():
-        print (head,seq)
-    '''
-    def __init__ (self, fname=''):
-        '''contructor: saves attribute fname '''
-        self.fname = fname
-           
-    def doOpen (self):
-        ''' Handle file opens, allowing STDIN.'''
-        if self.fname is '':
-            return sys.stdin
-        else:
-            return open(self.fname)
-        
-    def readFasta (self):
-        ''' Read an entire FastA record and return the sequence header/sequence'''
-        header = ''
-        sequence = ''
-        
-        with self.doOpen() as fileH:
-
-            header = ''
-            sequence = ''
-            
-            # skip to first fasta header
-            line = fileH.readline()
-            while not line.startswith('>') :
-                line = fileH.readline()
-            header = line[1:].rstrip()
-
-            for line in fileH:
-                if line.startswith ('>'):
-                    yield header,sequence
-                    header = line[1:].rstrip()
-                    sequence = ''
-                else :
-                    sequence += ''.join(line.rstrip().split()).upper()
-
-        yield header, sequence
+from sequenceAnalysis import FastAreader
+from pipelineProfiler import profiler, addProfileOption
 
 '''
 Program get coding sequences from gene fasta files.
 In Eukaryotes, a coding sequence is defined from the first start codon to the first stop codon in an ORF.
 '''
 
-def main():
+def putativeSequence(sequence):
+    '''
+    Return the sequence from its first ATG, or None when the sequence has no ATG codon
+    '''
+    sequence = sequence.upper()
+    sequence = sequence.replace('_', '')
+    sequence = sequence.replace('\n', '')
+    sequence = sequence.replace('\r', '')
+    startPosition = sequence.find('ATG')
+    if startPosition == -1:
+        return None
+    return sequence[startPosition:]
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='getCodingSeq.py - trims ORF fasta sequences to their putative coding sequence',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] <input >output'
+            )
+        addProfileOption(self.parser)
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+def main(inCL=None):
     '''
     Function read the fasta file and defines a putative sequence. Program defines putative sequences 
     from the fisrt start codon to the first stop codon. Program outputs a fasta file containing putative
     proteins only.
     '''
+    myCommandLine = CommandLine(inCL)
+    if myCommandLine.args.profile:
+        profiler.enable('getCodingSeq.py')
     myReader = FastAreader()
-    for header, sequence in myReader.readFasta():
-        print('>{}'.format(header))
-        sequence = sequence.upper()
-        sequence = sequence.replace('_', '')
-        sequence = sequence.replace('\n', '')
-        sequence = sequence.replace('\r', '')
-        for start in range(0, len(sequence), 3):
-            codon = sequence[start: start + 3]
-            if codon == 'ATG':
-                startPosition = sequence.find('ATG')
-                proteinSeq = sequence[startPosition:]
-                
-        print(proteinSeq + '\n')
+    for header, sequence in profiler.iterate('readFasta', myReader.readFasta(), countRecords=True):
+        with profiler.stage('codingSeq'):
+            proteinSeq = putativeSequence(sequence)
+        # records without an ATG have no putative sequence
+        if proteinSeq is None:
+            profiler.count('noStartCodon')
+            continue
+        with profiler.stage('writeFasta'):
+            print('>{}'.format(header))
+            print(proteinSeq + '\n')
+    profiler.writeReport(myCommandLine.args.profile)
 
 if __name__ == "__main__":
     main()
-                        
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: incrementalORFs.py
+#   Executable: python incrementalORFs.py -r SARSCoV2.fa -v cohortMutations.tsv > cohort.bed
+#               python incrementalORFs.py -a cohortGenomes.aln -n NC_045512.2 > cohort.bed
+#
+#   Required module: numpy, orfEngine, findORFs, clustalReader, mutationTable
+#   Purpose: ORFs of genomes that differ from a reference by a few SNPs and small indels,
+#            without rescanning them. The start and stop codons of both reference strands are
+#            found once; for a sample only the codons touching a variant are read, every other
+#            codon keeps its reference mark shifted past the indels before it, and the ORFs are
+#            paired from the marks by the ORFengine rules, so the result is identical to a full
+#            ORFfinder scan of the sample.
+#   Condition(s): Variants are (0-based position, ref, alt) on the reference, '-' or '' being an
+#                 empty allele, or the mutation table of mutationTable.py (1-based positions,
+#                 insertions after the given base). Output lines have the findORFs.py format.
+#
+#################################################################################################
+
+import sys
+
+import numpy as np
+
+import orfEngine
+from findORFs import genomeCoordinates, startCodons, stopCodons
+
+
+def normalizeVariants(reference, variants):
+    '''
+    Return the variants as (start, end, alt) reference intervals sorted by position. Reference
+    alleles are checked against the reference and variants may not overlap.
+    '''
+    edits = []
+    for position, refAllele, altAllele in variants:
+        refAllele = '' if refAllele in ('-', '.') else refAllele.upper()
+        altAllele = '' if altAllele in ('-', '.') else altAllele.upper()
+        position = int(position)
+        if position < 0 or reference[position:position + len(refAllele)].upper() != refAllele:
+            raise ValueError('Reference allele {} does not match the reference at {}'.format(refAllele or '-', position))
+        if refAllele != altAllele:
+            edits.append((position, position + len(refAllele), altAllele))
+    edits.sort(key=lambda edit: (edit[0], edit[1]))
+    for previous, edit in zip(edits, edits[1:]):
+        if edit[0] < previous[1] or (edit[0] == previous[0] and edit[1] == previous[1] == edit[0]):
+            raise ValueError('Overlapping variants at {} and {}'.format(previous[0], edit[0]))
+    return edits
+
+
+def applyVariants(reference, edits):
+    '''Return the sample sequence of normalized variants'''
+    pieces = []
+    previous = 0
+    for start, end, alt in edits:
+        pieces.append(reference[previous:start])
+        pieces.append(alt)
+        previous = end
+    pieces.append(reference[previous:])
+    return ''.join(pieces)
+
+
+def mutationVariant(kind, position, refAllele, altAllele):
+    '''
+    Return the (position, ref, alt) variant of a mutationTable row with a 0-based position.
+    Insertions are reported after their anchor base, so they start one base later.
+    '''
+    if kind == 'INS':
+        return position + 1, '', altAllele
+    if kind == 'DEL':
+        return position, refAllele, ''
+    return position, refAllele, altAllele
+
+
+class IncrementalORFfinder():
+    '''
+    ORFs of variant genomes computed from the start and stop codons of a reference.
+
+    instantiation:
+    thisFinder = IncrementalORFfinder(referenceSequence)
+    usage:
+    sample, orfsList, reverseList = thisFinder.findFrames([(23402, 'A', 'G'), (21764, 'ATACATG', '-')])
+    '''
+
+    def __init__(self, reference, starts=startCodons, stops=stopCodons, longest=True):
+        '''contructor: finds the start and stop codons of both reference strands'''
+        self.reference = reference
+        self.engine = orfEngine.ORFengine(starts, stops, longest)
+        codes = orfEngine.encodeSequence(reference)
+        self.marks = (self.engine.findMarks(codes), self.engine.findMarks(orfEngine.reverseCodes(codes)))
+
+    def strandEdits(self, edits, sampleLength, strand):
+        '''
+        Return (refStarts, refEnds, sampleStarts, sampleEnds, shifts) arrays of the edits in
+        the coordinates of one strand, shifts being the cumulative length change up to each edit
+        '''
+        refLength = len(self.reference)
+        refStarts, refEnds, sampleStarts, sampleEnds = [], [], [], []
+        offset = 0
+        for start, end, alt in edits:
+            refStarts.append(start)
+            refEnds.append(end)
+            sampleStarts.append(start + offset)
+            sampleEnds.append(start + offset + len(alt))
+            offset += len(alt) - (end - start)
+        refStarts, refEnds = np.array(refStarts, dtype=np.int64), np.array(refEnds, dtype=np.int64)
+        sampleStarts, sampleEnds = np.array(sampleStarts, dtype=np.int64), np.array(sampleEnds, dtype=np.int64)
+        if strand < 0:
+            # the reverse strand reads the intervals from the other end, in reverse order
+            refStarts, refEnds = (refLength - refEnds)[::-1], (refLength - refStarts)[::-1]
+            sampleStarts, sampleEnds = (sampleLength - sampleEnds)[::-1], (sampleLength - sampleStarts)[::-1]
+        shifts = np.cumsum((sampleEnds - sampleStarts) - (refEnds - refStarts))
+        return refStarts, refEnds, sampleStarts, sampleEnds, shifts
+
+    @staticmethod
+    def carriedMarks(positions, refStarts, refEnds, shifts):
+        '''
+        Return the codon positions whose codon is not touched by an edit, shifted to the sample.
+        Only the last edit starting before the end of a codon can touch it, as edits do not
+        overlap; an insertion touches the codons it splits.
+        '''
+        index = np.searchsorted(refStarts, positions + 3, side='left') - 1
+        before = index >= 0
+        index = np.maximum(index, 0)
+        editStarts, editEnds = refStarts[index], refEnds[index]
+        touched = before & np.where(editStarts == editEnds, editStarts > positions, editEnds > positions)
+        keep = ~touched
+        return positions[keep] + np.where(before, shifts[index], 0)[keep]
+
+    def windowMarks(self, sample, lows, highs, strand):
+        '''
+        Return the (starts, stops) codon positions in the strand windows [lows, highs] of a
+        sample. The windows are encoded as one string and codons across two windows dropped.
+        '''
+        sampleLength = len(sample)
+        if strand > 0:
+            codes = orfEngine.encodeSequence(''.join([sample[lo:hi + 3] for lo, hi in zip(lows, highs)]))
+        else:
+            # the reverse complement of the joined pieces holds the windows in strand order
+            pieces = [sample[sampleLength - hi - 3:sampleLength - lo] for lo, hi in zip(lows[::-1], highs[::-1])]
+            codes = orfEngine.reverseCodes(orfEngine.encodeSequence(''.join(pieces)))
+        codons = orfEngine.codonIndices(codes)
+        lows, highs = np.array(lows, dtype=np.int64), np.array(highs, dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(highs - lows + 3)[:-1]))
+        marks = []
+        for isMark in (self.engine.isStart, self.engine.isStop):
+            found = np.flatnonzero(isMark[codons])
+            window = np.searchsorted(offsets, found, side='right') - 1
+            local = found - offsets[window]
+            inside = local <= highs[window] - lows[window]
+            marks.append(lows[window][inside] + local[inside])
+        return marks
+
+    def strandFrames(self, sample, edits, strand):
+        '''Return the three ORF lists of one sample strand'''
+        refStartMarks, refStopMarks = self.marks[0 if strand > 0 else 1]
+        if not edits:
+            return self.engine.pairFrames(refStartMarks, refStopMarks, len(sample))
+        refStarts, refEnds, sampleStarts, sampleEnds, shifts = self.strandEdits(edits, len(sample), strand)
+        # codons touching an edit in the sample: the ones splitting its left end to its last base
+        lows = np.maximum(sampleStarts - 2, 0)
+        highs = np.minimum(np.where(sampleEnds > sampleStarts, sampleEnds, sampleStarts) - 1, len(sample) - 3)
+        valid = lows <= highs
+        lows, highs = lows[valid], highs[valid]
+        # edits are ordered and disjoint, so windows only need merging with the previous one
+        first = np.concatenate(([True], lows[1:] > highs[:-1] + 1))[:len(lows)]
+        last = np.concatenate((first[1:], [True]))[:len(lows)]
+        lows, highs = lows[first].tolist(), highs[last].tolist()
+        startMarks = [self.carriedMarks(refStartMarks, refStarts, refEnds, shifts)]
+        stopMarks = [self.carriedMarks(refStopMarks, refStarts, refEnds, shifts)]
+        if lows:
+            newStarts, newStops = self.windowMarks(sample, lows, highs, strand)
+            startMarks.append(newStarts)
+            stopMarks.append(newStops)
+        return self.engine.pairFrames(np.sort(np.concatenate(startMarks)), np.sort(np.concatenate(stopMarks)), len(sample))
+
+    def findFrames(self, variants):
+        '''
+        Return (sample, orfsList, reverseList) for variants of the reference, the ORF lists
+        being the ones ORFfinder.findORF and findReverseORF return for the sample
+        '''
+        edits = normalizeVariants(self.reference, variants)
+        sample = applyVariants(self.reference, edits)
+        return sample, self.strandFrames(sample, edits, 1), self.strandFrames(sample, edits, -1)
+
+    def findORFs(self, variants):
+        '''Return (sample, ORFs) with the 1-based ORF tuples of findORFs.findFrames'''
+        sample, orfList, reverseFrames = self.findFrames(variants)
+        return sample, genomeCoordinates(orfList, reverseFrames, len(sample))
+
+
+def readMutationTable(fname):
+    '''Yield (sample, variants) from a mutationTable.py file, samples in file order'''
+    samples = {}
+    with open(fname) as fileH:
+        for line in fileH:
+            columns = line.rstrip('\n').split('\t')
+            if len(columns) < 5 or columns[0] == 'sample':
+                continue
+            sample, kind, position, refAllele, altAllele = columns[:5]
+            samples.setdefault(sample, []).append(mutationVariant(kind, int(position) - 1, refAllele, altAllele))
+    yield from samples.items()
+
+
+def alignmentVariants(alignment, refIndex):
+    '''
+    Yield (sample, variants) for every row of a ClustalMatrix against its reference row.
+    Every residue differing from the reference is a variant, N included, so the samples are
+    the ungapped alignment rows.
+    '''
+    from mutationTable import findMutations
+    names = alignment.names
+    mutations = findMutations(alignment.rows, refIndex, missing=b'')
+    bounds = np.searchsorted(mutations['sample'], np.arange(len(names) + 1))
+    for index, name in enumerate(names):
+        rows = mutations[bounds[index]:bounds[index + 1]].tolist()
+        yield name, [mutationVariant(kind, position, refAllele, altAllele)
+                     for sample, kind, position, refAllele, altAllele in rows]
+
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='incrementalORFs.py - ORFs of variant genomes from the reference ORF marks',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] >output'
+            )
+        self.parser.add_argument('-r', '--reference', action='store', default='SARSCoV2.fa',
+                                 help='reference genome fasta file of the mutation table, the first record is used')
+        self.parser.add_argument('-v', '--variants', action='store', default='',
+                                 help='mutation table written by mutationTable.py')
+        self.parser.add_argument('-a', '--alignment', action='store', default='',
+                                 help='Clustal alignment of the samples and the reference')
+        self.parser.add_argument('-n', '--name', action='store', default='',
+                                 help='name of the reference row of the alignment (default NC_045512 or the first row)')
+        self.parser.add_argument('-mG', '--minGene', type=int, choices=range(0, 1000), default=100, action='store',
+                                 help='minimum Gene length')
+        self.parser.add_argument('-c', '--check', action='store_true', default=False,
+                                 help='compare every sample with a full scan and stop at the first difference')
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+
+def main(inCL=None):
+    '''
+    Read the reference and the sample variants and write the ORFs of every sample
+    '''
+    from findORFs import findFrames
+    from sequenceAnalysis import FastAreader
+    myCommandLine = CommandLine(inCL)
+    args = myCommandLine.args
+    if args.alignment:
+        from clustalReader import ClustalMatrix
+        alignment = ClustalMatrix(args.alignment)
+        names = alignment.names
+        name = args.name or next((name for name in names if name.startswith(('NC_045512', 'SARSCoV2'))), names[0])
+        refIndex = alignment.nameIndex[name]
+        finder = IncrementalORFfinder(alignment.row(refIndex).replace('-', ''))
+        samples = alignmentVariants(alignment, refIndex)
+    elif args.variants:
+        header, reference = next(FastAreader(args.reference).readFasta())
+        finder = IncrementalORFfinder(reference)
+        samples = readMutationTable(args.variants)
+    else:
+        myCommandLine.parser.error('a mutation table (-v) or an alignment (-a) is required')
+    for name, variants in samples:
+        sample, orfs = finder.findORFs(variants)
+        if args.check and findFrames((name, sample))[1] != orfs:
+            raise RuntimeError('Incremental ORFs of {} differ from a full scan'.format(name))
+        orfs.sort(key=lambda tup: (tup[3], tup[1]), reverse=True)
+        for orf in orfs:
+            if orf[3] >= args.minGene:
+                sys.stdout.write('{} {:>5d} {:>5d} {:>5d} ORF {:+d}\n'.format(name, orf[1], orf[2], orf[3], orf[0]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: mutationTable.py
+#   Executable: python mutationTable.py -i ORFS.aln -r SARSCoV2_S -g S > spikeMutations.tsv
+#               python mutationTable.py -i cohortGenomes.aln -r NC_045512.2 > cohortMutations.tsv
+#               python -m doctest mutationTable.py
+#
+#   Required module: numpy, clustalReader, annotationIndex, filterORFs, translationEngine
+#   Purpose: per sample substitutions, insertions and deletions relative to a reference row of
+#            an alignment (NC_045512.2 for genomes, the SARS-CoV-2 protein for ORF alignments).
+#            Every block of rows is compared with the reference column by column with array
+#            masks, alignment columns are mapped to reference coordinates with one cumulative
+#            sum, and genome mutations are named with the nameFinder ORF coordinates (amino
+#            acid changes for substitutions inside an ORF, e.g. S:D614G).
+#   Condition(s): Positions are 1-based reference coordinates. Insertions are reported at the
+#                 reference base they follow. N (genomes) and X (proteins) are missing data.
+#                 ORF1ab codons after the -1 frameshift at 13468 are read in the ORF1b frame.
+#
+#################################################################################################
+
+import sys
+
+import numpy as np
+
+from annotationIndex import AnnotationIndex
+from clustalReader import ClustalMatrix
+from translationEngine import TranslationEngine
+
+gap = ord('-')
+# 0-based reference position of the base read twice by the -1 ribosomal frameshift, codons
+# of the ORF from that base on are in the shifted frame
+frameshifts = {('NC_045512.2', 'ORF1ab'): 13467}
+
+
+def mutationType(width=1):
+    '''Return the mutation table fields, alleles are strings of up to width residues'''
+    return np.dtype([('sample', np.int64), ('kind', 'U3'), ('position', np.int64),
+                     ('reference', 'U{}'.format(width)), ('alternative', 'U{}'.format(width))])
+
+
+def residueRuns(residues, starts, lengths):
+    '''
+    Return the runs residues[start:start + length] of a uint8 array as a fixed width bytes
+    array, padded with zeros into one (runs, longest) matrix that is viewed as strings
+    '''
+    width = max(int(lengths.max()), 1) if len(lengths) else 1
+    offsets = np.arange(width)
+    inside = offsets < lengths[:, None]
+    runs = np.where(inside, residues[np.where(inside, starts[:, None] + offsets, 0)], 0).astype(np.uint8)
+    return np.ascontiguousarray(runs).view('S{}'.format(width)).reshape(-1)
+
+
+def findMutations(matrix, refIndex, missing=b'N', blockRows=1024):
+    '''
+    Compare every row of an encoded alignment (n x length uint8) with the reference row and
+    return a structured array of mutations sorted by sample and position. Rows are processed
+    in blocks of blockRows so memory-mapped alignments are read once.
+    '''
+    reference = np.asarray(matrix[refIndex])
+    refBase = reference != gap
+    # 0-based reference position of every column, gap columns get the base they follow
+    refPosition = np.cumsum(refBase) - 1
+    refResidues = reference[refBase]
+    missingCodes = np.frombuffer(missing.upper() + missing.lower() + b'?', dtype=np.uint8)
+    tables = []
+    for blockStart in range(0, matrix.shape[0], blockRows):
+        block = np.asarray(matrix[blockStart:blockStart + blockRows])
+        isGap = block == gap
+        isMissing = np.isin(block, missingCodes)
+        substitution = refBase & ~isGap & ~isMissing & (block != reference)
+        deletion = refBase & isGap
+        insertion = ~refBase & ~isGap
+
+        # substitutions, one row per changed column
+        rows, columns = np.nonzero(substitution)
+        table = np.empty(len(rows), dtype=mutationType())
+        table['sample'] = rows + blockStart
+        table['kind'] = 'SNP'
+        table['position'] = refPosition[columns]
+        table['reference'] = reference[columns].view('S1')
+        table['alternative'] = np.ascontiguousarray(block[rows, columns]).view('S1')
+        tables.append(table)
+
+        # deletions, runs of consecutive reference positions in the same row
+        rows, columns = np.nonzero(deletion)
+        positions = refPosition[columns]
+        breaks = np.flatnonzero((np.diff(rows) != 0) | (np.diff(positions) != 1)) + 1
+        firsts = np.concatenate(([0], breaks)).astype(np.int64) if len(rows) else np.empty(0, dtype=np.int64)
+        lasts = np.concatenate((breaks, [len(rows)])) - 1 if len(rows) else np.empty(0, dtype=np.int64)
+        alleles = residueRuns(refResidues, positions[firsts], positions[lasts] - positions[firsts] + 1)
+        table = np.empty(len(firsts), dtype=mutationType(alleles.itemsize))
+        table['sample'] = rows[firsts] + blockStart
+        table['kind'] = 'DEL'
+        table['position'] = positions[firsts]
+        table['reference'] = alleles
+        table['alternative'] = '-'
+        tables.append(table)
+
+        # insertions, runs of reference gap columns following the same reference base
+        rows, columns = np.nonzero(insertion)
+        anchors = refPosition[columns]
+        breaks = np.flatnonzero((np.diff(rows) != 0) | (np.diff(anchors) != 0)) + 1
+        firsts = np.concatenate(([0], breaks)).astype(np.int64) if len(rows) else np.empty(0, dtype=np.int64)
+        bounds = np.concatenate((firsts, [len(rows)])).astype(np.int64)
+        residues = block[rows, columns]
+        alleles = residueRuns(residues, bounds[:-1], np.diff(bounds))
+        table = np.empty(len(firsts), dtype=mutationType(alleles.itemsize))
+        table['sample'] = rows[firsts] + blockStart
+        table['kind'] = 'INS'
+        table['position'] = anchors[firsts]
+        table['reference'] = '-'
+        table['alternative'] = alleles
+        tables.append(table)
+    if not tables:
+        return np.empty(0, dtype=mutationType())
+    # the blocks are cast to the longest allele before they are joined
+    fields = mutationType(max(table.dtype['reference'].itemsize // 4 for table in tables))
+    mutations = np.concatenate([table.astype(fields) for table in tables])
+    return mutations[np.lexsort((mutations['position'], mutations['sample']))]
+
+
+def codingStart(refSequence, start):
+    '''
+    Return the first base of the start codon of an ORF region, or None when there is no ATG
+    at it. The nameFinder regions are written as bedtools headers of findORFs.py output, so
+    the ATG can begin one base before the region start.
+    '''
+    for candidate in (start, start - 1, start + 1):
+        if 0 <= candidate and refSequence[candidate:candidate + 3] == 'ATG':
+            return candidate
+    return None
+
+
+class MutationNamer():
+    '''
+    Name genome mutations with the ORFs covering them and the amino acid change of
+    substitutions, using the nameFinder ORF coordinates of the reference accession. Codons
+    past a ribosomal frameshift of the ORF (frameshifts) are read in the shifted frame, so
+    ORF1b changes keep the ORF1ab numbering.
+
+    instantiation:
+    thisNamer = MutationNamer(refSequence, 'NC_045512.2')
+    usage:
+    genes, change = thisNamer.describe('SNP', 23402, 'G')
+    '''
+
+    def __init__(self, refSequence, accession, annotation=None, shifts=None):
+        '''contructor: saves the ungapped reference and builds the ORF index'''
+        self.refSequence = refSequence
+        self.accession = accession
+        self.frameshifts = frameshifts if shifts is None else shifts
+        if annotation is None:
+            from filterORFs import nameFinder
+            # nameFinder lists alternative regions of some ORFs, the first one listed is kept
+            regions = {}
+            for name, region in nameFinder.context:
+                regions.setdefault(name, region)
+            annotation = AnnotationIndex().addRegions(regions.items())
+        self.annotation = annotation
+        self.engine = TranslationEngine(1, stopSymbol='*')
+        self.starts = {}
+
+    def codingStarts(self, start, end):
+        '''Return the start codon of a region, or the region start when it has no ATG'''
+        if (start, end) not in self.starts:
+            cds = codingStart(self.refSequence, start)
+            self.starts[(start, end)] = start if cds is None else cds
+        return self.starts[(start, end)]
+
+    def describe(self, kind, position, alternative):
+        '''
+        Return (genes, change) for a mutation at a 0-based reference position
+
+        >>> from sequenceAnalysis import FastAreader
+        >>> namer = MutationNamer(next(FastAreader('SARSCoV2.fa').readFasta())[1], 'NC_045512.2')
+        >>> namer.describe('SNP', 23402, 'G')
+        ('S', 'S:D614G')
+        >>> namer.describe('SNP', 14407, 'T')
+        ('ORF1ab', 'ORF1ab:P4715L')
+        '''
+        features = self.annotation.overlaps(self.accession, position, position + 1)
+        genes, changes = [], []
+        for start, end, name in features:
+            gene = name.split()[-1]
+            genes.append(gene)
+            cds = self.codingStarts(start, end)
+            if kind != 'SNP' or position < cds:
+                continue
+            # bases of the ORF before the position, the frameshift base is read twice
+            phase = position - cds
+            shift = self.frameshifts.get((self.accession, gene))
+            if shift is not None and position >= shift:
+                phase += 1
+            offset = phase % 3
+            codonStart = position - offset
+            refCodon = self.refSequence[codonStart:codonStart + 3]
+            if len(refCodon) < 3:
+                continue
+            altCodon = refCodon[:offset] + alternative + refCodon[offset + 1:]
+            refAmino, altAmino = self.engine.translate(refCodon), self.engine.translate(altCodon)
+            changes.append('{}:{}{}{}'.format(gene, refAmino, phase // 3 + 1, altAmino))
+        return ','.join(genes) or '-', ','.join(changes) or '-'
+
+
+def writeTable(mutations, names, outFile=sys.stdout, gene='', namer=None):
+    '''
+    Write the mutation table as tab separated text. For protein alignments gene names the
+    protein and substitutions are written as amino acid changes (e.g. S:D614G).
+    '''
+    outFile.write('sample\ttype\tposition\tref\talt\tgene\tchange\n')
+    for sample, kind, position, reference, alternative in mutations.tolist():
+        if namer is not None:
+            genes, change = namer.describe(kind, position, alternative)
+        else:
+            genes = gene or '-'
+            change = '{}:{}{}{}'.format(gene, reference, position + 1, alternative) if gene and kind == 'SNP' else '-'
+        outFile.write('{}\t{}\t{}\t{}\t{}\t{}\t{}\n'.format(names[sample], kind, position + 1, reference, alternative, genes, change))
+
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='mutationTable.py - substitutions, insertions and deletions against a reference row',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] >output'
+            )
+        self.parser.add_argument('-i', '--input', action='store', required=True,
+                                 help='Clustal alignment file')
+        self.parser.add_argument('-r', '--reference', action='store', default='',
+                                 help='name of the reference row (default: NC_045512.2 or SARSCoV2 row, else the first)')
+        self.parser.add_argument('-g', '--gene', action='store', default='',
+                                 help='protein name of a protein alignment, e.g. S')
+        self.parser.add_argument('-a', '--annotation', action='store', default='',
+                                 help='BED or GFF file of ORFs used instead of the nameFinder coordinates')
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+
+def main(inCL=None):
+    '''
+    Read an alignment and write its mutation table in stdout
+    '''
+    myCommandLine = CommandLine(inCL)
+    args = myCommandLine.args
+    alignment = ClustalMatrix(args.input)
+    names = alignment.names
+    reference = args.reference or next((name for name in names if name.startswith(('NC_045512', 'SARSCoV2'))), names[0])
+    refIndex = alignment.nameIndex[reference]
+    refRow = alignment.row(refIndex)
+    refSequence = refRow.replace('-', '')
+    # any character outside the IUPAC nucleotide codes makes the reference a protein
+    isProtein = bool(args.gene) or len(set(refSequence.upper()) - set('ACGTUNRYSWKMBDHV')) > 0
+    mutations = findMutations(alignment.rows, refIndex, missing=b'X' if isProtein else b'N')
+    namer = None
+    if not isProtein:
+        annotation = AnnotationIndex().loadFile(args.annotation) if args.annotation else None
+        namer = MutationNamer(refSequence, reference.split(':')[0], annotation)
+    writeTable(mutations, names, sys.stdout, args.gene, namer)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: orfCache.py
+#   Executable: python orfCache.py            (prints the cache location, entries and size)
+#               python orfCache.py --clear
+#
+#   Required module: numpy
+#   Purpose: persistent content-addressed cache of ORF and translation results. Entries are
+#            keyed by the SHA-256 of the upper case sequence, the parameters of the result
+#            (start and stop codons, genetic code, frame) and cacheVersion, so re-submitted
+#            genomes of a batch are looked up instead of scanned again. ORF tuples are stored
+#            as compressed int32 arrays in a SQLite database, the least recently used entries
+#            are evicted above a size limit.
+#   Condition(s): The database runs in WAL mode with a busy timeout, so worker processes and
+#                 concurrent runs can read and write it at the same time. The location is
+#                 --cache, the ORF_CACHE environment variable or ~/.cache/sars2ORFs/orfCache.sqlite.
+#                 ORF calls are cached by default, translations only with --cacheTranslations:
+#                 a lookup per record costs more than translating the record again.
+#
+#################################################################################################
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+import zlib
+
+import numpy as np
+
+defaultPath = os.environ.get('ORF_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'sars2ORFs', 'orfCache.sqlite'))
+defaultMegabytes = 512
+# part of every key: bump it whenever orfEngine or the translation output changes, so results
+# cached by earlier versions are no longer served (they are evicted as least recently used)
+cacheVersion = 1
+# lastUsed is only refreshed on a hit when older than this, so reads rarely take the write lock
+refreshSeconds = 3600
+
+
+class ORFcache():
+    '''
+    SQLite cache of ORF lists and proteins with least recently used eviction.
+
+    instantiation:
+    thisCache = ORFcache('orfCache.sqlite', maxBytes=2 ** 29)
+    usage:
+    key = thisCache.key('orfs', sequence, starts=['ATG'], stops=['TAG', 'TAA', 'TGA'])
+    orfs = thisCache.getORFs(key)
+    if orfs is None:
+        thisCache.putORFs(key, orfs)
+    '''
+
+    def __init__(self, path=defaultPath, maxBytes=defaultMegabytes * 2 ** 20):
+        '''contructor: saves the database path and size limit, connections are opened on use'''
+        self.path = path
+        self.maxBytes = maxBytes
+        self.connection = None
+        self.pid = None
+        # bytes written since the last eviction check
+        self.written = 0
+        self.hits = self.misses = 0
+
+    def connect(self):
+        '''Return the connection of the current process, worker processes open their own'''
+        if self.connection is None or self.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.pid = os.getpid()
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, '
+                                    'size INTEGER, lastUsed REAL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS entriesLastUsed ON entries (lastUsed)')
+        return self.connection
+
+    def close(self):
+        if self.connection is not None and self.pid == os.getpid():
+            self.connection.close()
+        self.connection = None
+
+    @staticmethod
+    def key(kind, sequence, **parameters):
+        '''
+        Return the key of a result: the hash of the upper case sequence, the kind of result,
+        its parameters and the cache version
+        '''
+        if not isinstance(sequence, str):
+            sequence = str(sequence)
+        digest = hashlib.sha256(sequence.upper().encode('ascii', 'replace'))
+        digest.update(json.dumps([kind, parameters, cacheVersion], sort_keys=True).encode('ascii'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        '''
+        Return the stored bytes of a key, or None. A hit marks the entry as used when its
+        lastUsed is older than refreshSeconds
+        '''
+        connection = self.connect()
+        row = connection.execute('SELECT value, lastUsed FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        now = time.time()
+        if now - row[1] > refreshSeconds:
+            connection.execute('UPDATE entries SET lastUsed = ? WHERE key = ?', (now, key))
+        return zlib.decompress(row[0])
+
+    def put(self, key, value):
+        '''Store bytes under a key, evicting old entries when the cache grew past its limit'''
+        blob = zlib.compress(value, 1)
+        self.connect().execute('INSERT OR REPLACE INTO entries (key, value, size, lastUsed) VALUES (?, ?, ?, ?)',
+                               (key, blob, len(blob), time.time()))
+        self.written += len(blob)
+        # summing the sizes is a table scan, so the limit is checked every 1/16 of it
+        if self.written > self.maxBytes // 16:
+            self.evict()
+
+    def evict(self):
+        '''Delete the least recently used entries until the cache is under 90% of its limit'''
+        self.written = 0
+        connection = self.connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if total > self.maxBytes:
+                excess = total - int(0.9 * self.maxBytes)
+                victims = []
+                for key, size in connection.execute('SELECT key, size FROM entries ORDER BY lastUsed'):
+                    victims.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                connection.executemany('DELETE FROM entries WHERE key = ?', victims)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def getORFs(self, key):
+        '''Return the stored list of ORF tuples of a key, or None'''
+        value = self.get(key)
+        if value is None:
+            return None
+        return [tuple(orf) for orf in np.frombuffer(value, dtype=np.int32).reshape(-1, 4).tolist()]
+
+    def putORFs(self, key, orfs):
+        '''Store a list of (frame, start, stop, length) tuples as an int32 array'''
+        self.put(key, np.asarray(orfs, dtype=np.int32).reshape(-1, 4).tobytes())
+
+    def getText(self, key):
+        '''Return the stored text of a key, or None'''
+        value = self.get(key)
+        return None if value is None else value.decode('ascii')
+
+    def putText(self, key, text):
+        self.put(key, text.encode('ascii'))
+
+    def stats(self):
+        '''Return (entries, stored bytes)'''
+        return self.connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+
+    def clear(self):
+        self.connect().execute('DELETE FROM entries')
+        self.connect().execute('VACUUM')
+
+
+# cache used by the ORF calling and translation stages, set up by configure()
+activeCache = None
+# translations are only read from and written to activeCache when asked for
+translationsCached = False
+
+
+def configure(path=defaultPath, maxBytes=defaultMegabytes * 2 ** 20, translations=False):
+    '''Set the cache used by the stages of this process, an empty path turns caching off'''
+    global activeCache, translationsCached
+    activeCache = ORFcache(path, maxBytes) if path else None
+    translationsCached = translations
+    return activeCache
+
+
+def translationCache():
+    '''Return the cache of the translation stages, None unless translations are cached'''
+    return activeCache if translationsCached else None
+
+
+def addCacheOptions(parser, translations=False):
+    '''Add the cache options to an argparse parser, translations adds --cacheTranslations'''
+    parser.add_argument('--cache', action='store', default=defaultPath,
+                        help='ORF and translation cache database')
+    parser.add_argument('--cacheSize', type=float, default=defaultMegabytes, action='store',
+                        help='cache size limit in megabytes')
+    parser.add_argument('--noCache', action='store_true', default=False,
+                        help='do not read or write the cache')
+    if translations:
+        parser.add_argument('--cacheTranslations', action='store_true', default=False,
+                            help='also cache proteins, usually slower than translating again')
+
+
+def configureFromArgs(args):
+    '''Set the cache from the options added by addCacheOptions'''
+    return configure('' if args.noCache else args.cache, int(args.cacheSize * 2 ** 20),
+                     getattr(args, 'cacheTranslations', False))
+
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='orfCache.py - shows or clears the ORF and translation cache',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] >output'
+            )
+        self.parser.add_argument('--cache', action='store', default=defaultPath,
+                                 help='ORF and translation cache database')
+        self.parser.add_argument('--clear', action='store_true', default=False,
+                                 help='delete every entry')
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+
+def main(inCL=None):
+    '''
+    Print the cache location, entries and size
+    '''
+    myCommandLine = CommandLine(inCL)
+    cache = ORFcache(myCommandLine.args.cache)
+    if myCommandLine.args.clear:
+        cache.clear()
+    entries, size = cache.stats()
+    sys.stdout.write('{}\t{} entries\t{} bytes\n'.format(cache.path, entries, size))
+    cache.close()
+
+if __name__ == "__main__":
+    main()
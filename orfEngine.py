@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+#####################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: orfEngine.py
+#   Required module: numpy
+#   Purpose: array-backed six-frame ORF engine used by findORFs.ORFfinder. The sequence is encoded
+#            once into a uint8 array and every codon is turned into an index (0-63), so start and
+#            stop positions for all frames are found with NumPy operations instead of slicing a
+#            3-character string at every position.
+#   Condition(s): ORFs returned match the ORFfinder.saveORF tuples (frame, start, stop, length),
+#                 including the leading stop and trailing open ORF edge cases.
+#
+#####################################################################################################
+
+import numpy as np
+
+# nucleotide code table: A=0, C=1, G=2, T=3, anything else=4
+baseCode = np.full(256, 4, dtype=np.uint8)
+for code, base in enumerate('ACGT'):
+    baseCode[ord(base)] = code
+    baseCode[ord(base.lower())] = code
+
+# codon index returned for codons containing a non-ACGT base
+invalidCodon = 64
+
+
+def encodeSequence(seq):
+    '''
+    Encode a DNA string (or bytes) into a uint8 array of nucleotide codes.
+    '''
+    if isinstance(seq, str):
+        seq = seq.encode('ascii', 'replace')
+    return baseCode[np.frombuffer(seq, dtype=np.uint8)]
+
+
+def reverseCodes(codes):
+    '''
+    Return the reverse complement of an encoded sequence. Non-ACGT bases keep their code,
+    as ORFfinder.reverseComplement keeps unknown characters unchanged.
+    '''
+    reverse = codes[::-1].copy()
+    known = reverse < 4
+    # A<->T and C<->G are 3 - code in the A=0, C=1, G=2, T=3 encoding
+    reverse[known] = 3 - reverse[known]
+    return reverse
+
+
+def codonIndices(codes):
+    '''
+    Return the codon index (16*first + 4*second + third) for every position that starts
+    a full codon. Codons with a non-ACGT base get invalidCodon.
+    '''
+    if len(codes) < 3:
+        return np.empty(0, dtype=np.uint8)
+    first, second, third = codes[:-2], codes[1:-1], codes[2:]
+    index = (first << 4) | (second << 2) | third
+    index[(first > 3) | (second > 3) | (third > 3)] = invalidCodon
+    return index
+
+
+# codon classes of ORFengine.codonClass, a codon may be both a start and a stop
+startClass = 1
+stopClass = 2
+
+
+def codonSet(codons):
+    '''
+    Return a boolean lookup table over the 65 codon indices marking the given codons.
+    '''
+    table = np.zeros(invalidCodon + 1, dtype=bool)
+    for codon in codons:
+        codon = codon.upper().replace('U', 'T')
+        first, second, third = (int(baseCode[ord(base)]) for base in codon)
+        if max(first, second, third) < 4:
+            table[(first << 4) | (second << 2) | third] = True
+    return table
+
+
+class ORFengine():
+    '''
+    Find ORFs in the three frames of one encoded strand. The engine reproduces the scan
+    done by the original per-codon ORFfinder loop:
+
+        - the first stop codon found on the strand opens a leading ORF at position 0
+        - every other stop is paired with the first start seen since the previous stop
+        - a start still open at position len - 4 saves a trailing ORF ending at len - 1
+        - a start left open at the end of a frame carries over into the next frame
+
+    With longestGene False the ORFs of every later start before the same stop (nested ORFs)
+    are added. Start and stop sets of any size are matched in one lookup of a 65 entry
+    codon class table.
+
+    instantiation:
+    engine = ORFengine(['ATG', 'CTG', 'TTG'], ['TAG', 'TAA', 'TGA'], longestGene=False)
+    usage:
+    orfsList = engine.findFrames(encodeSequence(seq))
+    '''
+
+    def __init__(self, startCodons, stopCodons, longestGene=True):
+        '''Precompute the codon class table of the start and stop codons'''
+        self.isStart = codonSet(startCodons)
+        self.isStop = codonSet(stopCodons)
+        self.codonClass = (self.isStart * startClass + self.isStop * stopClass).astype(np.uint8)
+        self.longestGene = longestGene
+
+    def findFrames(self, codes):
+        '''
+        Return a list of three lists (one per frame) holding the ORF tuples
+        (frame, start, stop, length) found in the encoded strand.
+        '''
+        starts, stops = self.findMarks(codes)
+        return self.pairFrames(starts, stops, len(codes))
+
+    def findMarks(self, codes):
+        '''Return the sorted positions of the start and stop codons of an encoded strand'''
+        classes = self.codonClass[codonIndices(codes)]
+        return np.flatnonzero(classes & startClass), np.flatnonzero(classes & stopClass)
+
+    def pairFrames(self, startPositions, stopPositions, seqLength):
+        '''
+        Return the three ORF lists of a strand of length seqLength from the sorted positions
+        of its start and stop codons, the frame of a codon being its position modulo 3
+        '''
+        startFrames, stopFrames = startPositions % 3, stopPositions % 3
+        orfsList = [[], [], []]
+        pending = None  # first open start position carried over from the previous frame
+        leadingFound = False  # True once the first stop codon of the strand was seen
+        # only the frame holding position len - 4 can save a trailing ORF
+        trailingFrame = (seqLength - 4) % 3 if seqLength >= 4 else None
+
+        for frame in range(3):
+            starts = startPositions[startFrames == frame]
+            stops = stopPositions[stopFrames == frame]
+            frameORFs = orfsList[frame]
+
+            if len(stops):
+                # first start seen before the first stop of the frame
+                if pending is None and len(starts) and starts[0] < stops[0]:
+                    pending = int(starts[0])
+                firstStop = int(stops[0])
+                if not leadingFound:
+                    # leading ORF: the first stop of the strand opens at position 0
+                    frameORFs.append((frame, 0, firstStop + 3, firstStop + 3))
+                    leadingFound = True
+                elif pending is not None:
+                    frameORFs.append((frame, pending, firstStop + 3, firstStop + 3 - pending))
+
+                # pair every following stop with the first start after the previous stop
+                if len(stops) > 1 and len(starts):
+                    index = np.searchsorted(starts, stops[:-1], side='right')
+                    hasStart = index < len(starts)
+                    candidate = starts[np.minimum(index, len(starts) - 1)]
+                    hasStart &= candidate < stops[1:]
+                    for orfStart, orfStop in zip(candidate[hasStart].tolist(), stops[1:][hasStart].tolist()):
+                        frameORFs.append((frame, orfStart, orfStop + 3, orfStop + 3 - orfStart))
+
+                # start left open after the last stop of the frame
+                index = np.searchsorted(starts, stops[-1], side='right')
+                pending = int(starts[index]) if index < len(starts) else None
+            elif pending is None and len(starts):
+                pending = int(starts[0])
+
+            # trailing ORF still open at the end of the sequence
+            if frame == trailingFrame and pending is not None:
+                frameORFs.append((frame, pending, seqLength - 1, seqLength - 1 - pending))
+
+            if not self.longestGene:
+                self.addNested(frameORFs, frame, starts, stops)
+
+        return orfsList
+
+    @staticmethod
+    def addNested(frameORFs, frame, starts, stops):
+        '''
+        Add to the ORFs of a frame the nested ORFs: every start of the frame paired with the
+        first stop after it, unless it already starts an ORF. The list is sorted by start.
+        '''
+        if len(starts) and len(stops):
+            index = np.searchsorted(stops, starts, side='right')
+            hasStop = index < len(stops)
+            orfStops = stops[np.minimum(index, len(stops) - 1)]
+            known = {orf[1] for orf in frameORFs}
+            for orfStart, orfStop in zip(starts[hasStop].tolist(), orfStops[hasStop].tolist()):
+                if orfStart not in known:
+                    frameORFs.append((frame, orfStart, orfStop + 3, orfStop + 3 - orfStart))
+        frameORFs.sort(key=lambda orf: orf[1])
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: orfPipeline.py
+#   Executable: python orfPipeline.py < SARSCoV2.fa > sars2ProteinSeq.fa
+#               python orfPipeline.py -i cohort.fa -j 8 -o cohortProteins.fa
+#   Executable with debug files: python orfPipeline.py -b sars2.bed -f sars2Seq.fa -c sars2PutativeSeq.fa
+#                                -n sars2FilProt.fa < SARSCoV2.fa > sars2ProteinSeq.fa
+#
+#   Required module: findORFs, getCodingSeq, filterORFs, seqTranslator, sequenceAnalysis, orfCache
+#   Purpose: genome to named proteins in one process. The stages of findORFs.py, fastaFinder.py,
+#            getCodingSeq.py, filterORFs.py and seqTranslator.py are chained as generators over
+#            in-memory records, so no stage formats, writes and reparses text for the next one,
+#            and with -j ORF calling of the next genomes runs while the previous ones are
+#            extracted, named and translated.
+#   Condition(s): Every stage gives the records the script would write: ORFs of at least
+#                 --minGene bases sorted by length, regions cut with the bed coordinates as
+#                 fastaFinder.py does, sequences trimmed to their first ATG (records without
+#                 one are dropped), ORFs named with the nameFinder annotation and translated
+#                 with stops removed. Intermediate files are only written when asked for.
+#                 ORF calls are cached in ~/.cache/sars2ORFs/orfCache.sqlite by default (--cache
+#                 or ORF_CACHE for another file, --noCache to turn it off), proteins only with
+#                 --cacheTranslations.
+#
+#################################################################################################
+
+import collections
+import sys
+
+import orfCache
+from findORFs import mapRecords, topORFs
+from filterORFs import nameFinder
+from getCodingSeq import putativeSequence
+from pipelineProfiler import profiler, addProfileOption
+from seqTranslator import translateSeq
+from sequenceAnalysis import FastAreader
+
+
+def callORFs(records, minGene=100, jobs=1, chunkSize=4):
+    '''
+    Yield (header, sequence, ORFs) for every (header, sequence) genome. ORFs are the
+    (frame, start, stop, length) tuples of findORFs.py longer than minGene, longest first.
+    Genomes are kept in a queue while their ORFs are called, by worker processes with jobs > 1.
+    '''
+    pending = collections.deque()
+
+    def remember(records):
+        for record in records:
+            pending.append(record)
+            yield record
+
+    for newHeader, orfs in profiler.iterate('findORFs', mapRecords(remember(records), jobs, chunkSize)):
+        header, sequence = pending.popleft()
+        with profiler.stage('sortORFs'):
+            orfs = topORFs(orfs, minGene)
+        profiler.count('orfs', len(orfs))
+        yield newHeader, sequence, orfs
+
+
+def orfSequences(genomes):
+    '''
+    Yield (accession:start-end, sequence) for the ORFs of every genome. As in fastaFinder.py
+    the bed start is used as a 0-based start and the stop as an exclusive end.
+    '''
+    for newHeader, sequence, orfs in genomes:
+        for frame, start, stop, length in orfs:
+            if start < 0 or stop > len(sequence) or start >= stop:
+                profiler.count('skippedIntervals')
+                continue
+            yield '{}:{}-{}'.format(newHeader, start, stop), sequence[start:stop]
+
+
+def putativeSequences(records):
+    '''
+    Yield (header, putative sequence) for every ORF record. As in getCodingSeq.py, records
+    without an ATG are skipped and counted.
+    '''
+    for header, sequence in records:
+        with profiler.stage('codingSeq'):
+            proteinSeq = putativeSequence(sequence)
+        if proteinSeq is None:
+            profiler.count('noStartCodon')
+            continue
+        yield header, proteinSeq
+
+
+def translateRecords(records, table=1):
+    '''Yield (name, protein) for every (name, sequence) record, stops are removed'''
+    engine = translateSeq.getEngine(table)
+    for name, sequence in records:
+        with profiler.stage('translate'):
+            protein = translateSeq.cachedTranslation(engine, sequence.replace("None", ""), 0).replace("-", "")
+        yield name, protein
+
+
+def writeBed(genomes, fname):
+    '''Pass genomes through, writing their ORFs in fname as findORFs.py does'''
+    with open(fname, 'w') as outFile:
+        for newHeader, sequence, orfs in genomes:
+            for orf in orfs:
+                outFile.write('{} {:>5d} {:>5d} {:>5d} ORF {:+d}\n'.format(newHeader, orf[1], orf[2], orf[3], orf[0]))
+            yield newHeader, sequence, orfs
+
+
+def writeFasta(records, fname):
+    '''Pass (header, sequence) records through, writing them in fname as the scripts do'''
+    with open(fname, 'w') as outFile:
+        for header, sequence in records:
+            outFile.write('>{}\n{}\n\n'.format(header, sequence))
+            yield header, sequence
+
+
+def pipeline(records, minGene=100, jobs=1, chunkSize=4, table=1, annotationFile='', minOverlap=0.9,
+             bedFile='', orfFasta='', putativeFasta='', namedFasta=''):
+    '''
+    Chain the stages over (header, sequence) genomes and return the generator of
+    (name, protein) records. Debug files are written for the stages given a file name.
+    '''
+    genomes = callORFs(records, minGene, jobs, chunkSize)
+    if bedFile:
+        genomes = writeBed(genomes, bedFile)
+    orfs = orfSequences(genomes)
+    if orfFasta:
+        orfs = writeFasta(orfs, orfFasta)
+    putative = putativeSequences(orfs)
+    if putativeFasta:
+        putative = writeFasta(putative, putativeFasta)
+    named = nameFinder(annotationFile, minOverlap).nameRecords(putative)
+    if namedFasta:
+        named = writeFasta(named, namedFasta)
+    return translateRecords(named, table)
+
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='orfPipeline.py - genome fasta to named protein sequences in one process',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] <input >output'
+            )
+        self.parser.add_argument('-i', '--input', action='store', default='',
+                                 help='genome fasta file (default stdin)')
+        self.parser.add_argument('-o', '--output', action='store', default='',
+                                 help='protein fasta file (default stdout)')
+        self.parser.add_argument('-mG', '--minGene', type=int, choices=range(0, 1000), default=100, action='store',
+                                 help='minimum Gene length')
+        self.parser.add_argument('-j', '--jobs', type=int, default=1, action='store',
+                                 help='number of worker processes used to find ORFs')
+        self.parser.add_argument('-cS', '--chunkSize', type=int, default=4, action='store',
+                                 help='number of fasta records sent to a worker at a time')
+        self.parser.add_argument('-t', '--table', type=int, default=1, action='store',
+                                 help='NCBI genetic code used for translation')
+        self.parser.add_argument('-a', '--annotation', action='store', default='',
+                                 help='BED or GFF file of named genes used instead of the built-in lists')
+        self.parser.add_argument('-mO', '--minOverlap', type=float, default=0.9, action='store',
+                                 help='minimum shared fraction of the ORF and gene intervals to name an ORF')
+        self.parser.add_argument('-b', '--bed', action='store', default='',
+                                 help='debug output: ORF bed file as written by findORFs.py')
+        self.parser.add_argument('-f', '--orfFasta', action='store', default='',
+                                 help='debug output: ORF fasta as written by fastaFinder.py')
+        self.parser.add_argument('-c', '--putative', action='store', default='',
+                                 help='debug output: putative sequences as written by getCodingSeq.py')
+        self.parser.add_argument('-n', '--named', action='store', default='',
+                                 help='debug output: named ORFs as written by filterORFs.py')
+        addProfileOption(self.parser)
+        orfCache.addCacheOptions(self.parser, translations=True)
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+
+def main(inCL=None):
+    '''
+    Read genomes, run the pipeline and write the named proteins
+    '''
+    myCommandLine = CommandLine(inCL)
+    args = myCommandLine.args
+    if args.profile:
+        profiler.enable('orfPipeline.py')
+    orfCache.configureFromArgs(args)
+    records = profiler.iterate('readFasta', FastAreader(args.input).readFasta(), countRecords=True)
+    proteins = pipeline(records, args.minGene, args.jobs, args.chunkSize, args.table, args.annotation,
+                        args.minOverlap, args.bed, args.orfFasta, args.putative, args.named)
+    outFile = open(args.output, 'w') if args.output else sys.stdout
+    for name, protein in proteins:
+        with profiler.stage('writeFasta'):
+            outFile.write('>{}\n{}\n\n'.format(name, protein))
+    if args.output:
+        outFile.close()
+    profiler.writeReport(args.profile)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: orfTable.py
+#   Executable: python findORFs.py -mG 100 -b cohort.npy < cohort.fa
+#               python orfTable.py cohort.npy -mG 300 -f +1 -f -2 > cohortLong.bed
+#               python orfTable.py cohort.npy -mG 300 -o cohortLong.npy
+#
+#   Required module: numpy
+#   Purpose: binary columnar ORF table. Rows (record, frame, start, stop, length) are written
+#            as a NumPy .npy structured array with the record accessions in <table>.names,
+#            so large cohorts skip formatting and parsing text. ORFtable memory-maps the file:
+#            columns are read without parsing and filtering by length, frame or record is a
+#            vectorized mask.
+#   Condition(s): Coordinates are the findORFs.py ones (1-based start, frames +1..+3 and
+#                 -1..-3); rows keep the order they were written in. The row count in the
+#                 header is written when the writer is closed.
+#
+#################################################################################################
+
+import ast
+import sys
+
+import numpy as np
+
+orfType = np.dtype([('record', np.uint32), ('frame', np.int8), ('start', np.int32),
+                    ('stop', np.int32), ('length', np.int32)])
+magic = b'\x93NUMPY\x01\x00'
+headerSize = 256 # bytes of the .npy header, fixed so the row count can be rewritten in place
+
+
+def npyHeader(rows):
+    '''Return the .npy version 1.0 header of a table of rows, padded to headerSize bytes'''
+    text = "{{'descr': {!r}, 'fortran_order': False, 'shape': ({},), }}".format(orfType.descr, rows)
+    text = text.ljust(headerSize - len(magic) - 2 - 1) + '\n'
+    return magic + len(text).to_bytes(2, 'little') + text.encode('latin1')
+
+
+def orfRows(record, orfs):
+    '''Return a list of (frame, start, stop, length) tuples as table rows of one record'''
+    rows = np.empty(len(orfs), dtype=orfType)
+    if len(orfs):
+        columns = np.asarray(orfs, dtype=np.int64).reshape(-1, 4)
+        rows['record'] = record
+        rows['frame'], rows['start'], rows['stop'], rows['length'] = columns.T
+    return rows
+
+
+class ORFtableWriter():
+    '''
+    Write the ORFs of the records of a run in a binary table.
+
+    instantiation:
+    thisWriter = ORFtableWriter('cohort.npy')
+    usage:
+    with thisWriter:
+        thisWriter.addRecord('NC_045512.2', orfs)
+    '''
+
+    def __init__(self, fname):
+        '''contructor: opens the table and names files, the header is rewritten on close'''
+        self.fname = fname
+        self.namesName = fname + '.names'
+        self.rows = 0
+        # record index of every name written, a record added again reuses its index
+        self.recordIndex = {}
+        self.fileH = open(fname, 'wb')
+        self.namesH = open(self.namesName, 'w')
+        self.fileH.write(npyHeader(0))
+
+    def record(self, name):
+        '''Return the record index of a name, writing the name the first time it is seen'''
+        if name not in self.recordIndex:
+            self.recordIndex[name] = len(self.recordIndex)
+            self.namesH.write(name + '\n')
+        return self.recordIndex[name]
+
+    def addRecord(self, name, orfs):
+        '''Append the (frame, start, stop, length) ORFs of a record, possibly in several calls'''
+        rows = orfRows(self.record(name), orfs)
+        self.fileH.write(rows.tobytes())
+        self.rows += len(rows)
+
+    def addRows(self, names, rows):
+        '''Append table rows whose record column indexes names'''
+        used, inverse = np.unique(rows['record'], return_inverse=True)
+        recordIndex = np.array([self.record(names[record]) for record in used.tolist()], dtype=np.uint32)
+        rows = rows.copy()
+        rows['record'] = recordIndex[inverse.reshape(-1)]
+        self.fileH.write(rows.tobytes())
+        self.rows += len(rows)
+
+    def close(self):
+        if self.fileH is not None:
+            self.fileH.seek(0)
+            self.fileH.write(npyHeader(self.rows))
+            self.fileH.close()
+            self.namesH.close()
+        self.fileH = self.namesH = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def isTable(fname):
+    '''Return True if fname is a .npy file rather than a text bed file'''
+    with open(fname, 'rb') as fileH:
+        return fileH.read(len(magic) - 2) == magic[:-2]
+
+
+class ORFtable():
+    '''
+    Memory-mapped ORF table with vectorized filters.
+
+    instantiation:
+    thisTable = ORFtable('cohort.npy')
+    usage:
+    longORFs = thisTable.rows[thisTable.mask(minLength=300, frames=[1, 2, 3])]
+    for name, start, stop in thisTable.intervals(longORFs):
+        ...
+    '''
+
+    def __init__(self, fname):
+        '''contructor: maps the table and reads the record names'''
+        self.fname = fname
+        self.namesName = fname + '.names'
+        with open(fname, 'rb') as fileH:
+            if fileH.read(len(magic)) != magic:
+                raise ValueError('{} is not an ORF table'.format(fname))
+            length = int.from_bytes(fileH.read(2), 'little')
+            header = ast.literal_eval(fileH.read(length).decode('latin1'))
+            offset = fileH.tell()
+        if np.dtype(header['descr']) != orfType:
+            raise ValueError('{} does not hold ORF rows'.format(fname))
+        count = header['shape'][0]
+        self.rows = np.memmap(fname, dtype=orfType, mode='r', offset=offset, shape=(count,)) if count else np.empty(0, dtype=orfType)
+        with open(self.namesName) as fileH:
+            self.names = [line.rstrip('\n') for line in fileH]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, column):
+        '''Return a column (record, frame, start, stop or length) without copying it'''
+        return self.rows[column]
+
+    def mask(self, minLength=0, maxLength=None, frames=None, records=None):
+        '''Return the boolean mask of the rows passing the length, frame and record filters'''
+        keep = self.rows['length'] >= minLength
+        if maxLength is not None:
+            keep &= self.rows['length'] <= maxLength
+        if frames:
+            keep &= np.isin(self.rows['frame'], list(frames))
+        if records:
+            # a name matches every record written under it
+            wanted = {record for record in records if isinstance(record, str)}
+            recordIndex = [index for index, name in enumerate(self.names) if name in wanted]
+            recordIndex += [record for record in records if not isinstance(record, str)]
+            keep &= np.isin(self.rows['record'], recordIndex)
+        return keep
+
+    def intervals(self, rows=None, blockRows=1 << 16):
+        '''Yield (name, start, stop) for rows, all by default, converting blockRows rows at a time'''
+        rows = self.rows if rows is None else rows
+        names = self.names
+        for blockStart in range(0, len(rows), blockRows):
+            block = rows[blockStart:blockStart + blockRows]
+            for record, start, stop in zip(block['record'].tolist(), block['start'].tolist(), block['stop'].tolist()):
+                yield names[record], start, stop
+
+    def writeText(self, rows=None, outFile=sys.stdout, blockRows=1 << 16):
+        '''Write rows as findORFs.py text lines'''
+        rows = self.rows if rows is None else rows
+        names = self.names
+        for blockStart in range(0, len(rows), blockRows):
+            block = rows[blockStart:blockStart + blockRows]
+            outFile.write(''.join(['{} {:>5d} {:>5d} {:>5d} ORF {:+d}\n'.format(names[record], start, stop, length, frame)
+                                   for record, frame, start, stop, length in block.tolist()]))
+
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='orfTable.py - filters a binary ORF table and writes it as text or as a new table',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] table >output'
+            )
+        self.parser.add_argument('table', action='store', help='ORF table written by findORFs.py -b')
+        self.parser.add_argument('-mG', '--minGene', type=int, default=0, action='store',
+                                 help='minimum Gene length')
+        self.parser.add_argument('-MG', '--maxGene', type=int, default=None, action='store',
+                                 help='maximum Gene length')
+        self.parser.add_argument('-f', '--frame', type=int, action='append', choices=[-3, -2, -1, 1, 2, 3],
+                                 help='keep ORFs of this frame, may be repeated')
+        self.parser.add_argument('-r', '--record', action='append',
+                                 help='keep ORFs of this record, may be repeated')
+        self.parser.add_argument('-o', '--output', action='store', default='',
+                                 help='write the kept rows as a new table instead of text')
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+
+def main(inCL=None):
+    '''
+    Filter an ORF table and write the kept ORFs
+    '''
+    myCommandLine = CommandLine(inCL)
+    args = myCommandLine.args
+    table = ORFtable(args.table)
+    rows = table.rows[table.mask(args.minGene, args.maxGene, args.frame, args.record)]
+    if args.output:
+        with ORFtableWriter(args.output) as writer:
+            writer.addRows(table.names, rows)
+    else:
+        table.writeText(rows, sys.stdout)
+
+if __name__ == "__main__":
+    main()
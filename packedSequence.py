@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+#####################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: packedSequence.py
+#   Required module: numpy, orfEngine
+#   Purpose: compact nucleotide store. Bases are packed 4 per byte (2 bits each, A=0, C=1, G=2,
+#            T=3 as in orfEngine) and N or any other ambiguity code is kept in a side list of
+#            runs, so a 30 kb genome takes about 7.5 kB. Slicing, reverse complement and codon
+#            extraction work on the packed bytes, and ORFfinder and TranslationEngine accept
+#            a PackedSequence wherever they accept a string.
+#   Condition(s): Sequences are stored upper case with U stored as T, as TranslationEngine
+#                 translates it, so str() of a packed RNA sequence gives its DNA form
+#
+#####################################################################################################
+
+import numpy as np
+
+import orfEngine
+
+bases = np.frombuffer(b'ACGT', dtype=np.uint8)
+# complement of the characters kept in the ambiguity runs (IUPAC codes)
+ambiguityComplement = {'N': 'N', 'R': 'Y', 'Y': 'R', 'S': 'S', 'W': 'W', 'K': 'M', 'M': 'K',
+                       'B': 'V', 'V': 'B', 'D': 'H', 'H': 'D', '-': '-'}
+
+
+def buildReverseTable():
+    '''
+    Return the 256-entry table mapping a packed byte to the byte holding the complement of its
+    four bases in reverse order.
+    '''
+    table = np.zeros(256, dtype=np.uint8)
+    for byte in range(256):
+        fields = [(byte >> shift) & 3 for shift in (0, 2, 4, 6)]
+        reverse = [3 - field for field in fields[::-1]]
+        table[byte] = reverse[0] | (reverse[1] << 2) | (reverse[2] << 4) | (reverse[3] << 6)
+    return table
+
+reverseTable = buildReverseTable()
+
+
+def packCodes(codes):
+    '''Pack nucleotide codes (0-3) 4 per byte, first base in the low bits'''
+    padded = np.zeros((len(codes) + 3) // 4 * 4, dtype=np.uint8)
+    padded[:len(codes)] = codes & 3
+    fields = padded.reshape(-1, 4)
+    return fields[:, 0] | (fields[:, 1] << 2) | (fields[:, 2] << 4) | (fields[:, 3] << 6)
+
+
+def unpackBytes(packed):
+    '''Unpack bytes into 4 nucleotide codes each'''
+    return np.stack([(packed >> shift) & 3 for shift in (0, 2, 4, 6)], axis=1).ravel()
+
+
+class PackedSequence():
+    '''
+    DNA sequence packed in 2 bits per base with a side list of ambiguity runs.
+
+    instantiation:
+    thisSeq = PackedSequence('ATGNNNTAA')
+    usage:
+    len(thisSeq), str(thisSeq[3:6]), thisSeq.reverseComplement(), thisSeq.codonIndices()
+    '''
+
+    def __init__(self, seq='', packed=None, length=0, runs=None):
+        '''
+        Pack a DNA string or bytes. The packed, length and runs arguments build a sequence
+        straight from packed data. Runs are (starts, ends, characters) arrays of the
+        stretches of non-ACGT characters.
+        '''
+        if packed is not None:
+            self.packed, self.length = packed, length
+            self.runStarts, self.runEnds, self.runChars = runs
+            return
+        if isinstance(seq, str):
+            seq = seq.replace(' ', '').upper().encode('ascii', 'replace')
+        # U is packed as T
+        raw = np.frombuffer(bytes(seq).upper().replace(b'U', b'T'), dtype=np.uint8)
+        codes = orfEngine.baseCode[raw]
+        self.length = len(codes)
+        self.packed = packCodes(codes)
+        # runs of identical non-ACGT characters
+        ambiguous = np.flatnonzero(codes > 3)
+        if len(ambiguous):
+            chars = raw[ambiguous]
+            breaks = np.flatnonzero((np.diff(ambiguous) != 1) | (np.diff(chars) != 0)) + 1
+            firsts = np.concatenate(([0], breaks))
+            lasts = np.concatenate((breaks, [len(ambiguous)])) - 1
+            self.runStarts = ambiguous[firsts]
+            self.runEnds = ambiguous[lasts] + 1
+            self.runChars = chars[firsts]
+        else:
+            self.runStarts = self.runEnds = np.empty(0, dtype=np.int64)
+            self.runChars = np.empty(0, dtype=np.uint8)
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return self.toBytes().decode('ascii')
+
+    def __repr__(self):
+        return 'PackedSequence({!r})'.format(str(self) if self.length <= 40 else str(self[:37]) + '...')
+
+    def __eq__(self, other):
+        if isinstance(other, PackedSequence):
+            return str(self) == str(other)
+        return str(self) == other
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def nbytes(self):
+        '''Return the number of bytes used by the packed bases and the ambiguity runs'''
+        return self.packed.nbytes + self.runStarts.nbytes + self.runEnds.nbytes + self.runChars.nbytes
+
+    def selectRuns(self, start, end):
+        '''Return the ambiguity runs overlapping start-end, clipped to it'''
+        first = np.searchsorted(self.runEnds, start, side='right')
+        last = np.searchsorted(self.runStarts, end, side='left')
+        runStarts = np.maximum(self.runStarts[first:last], start)
+        runEnds = np.minimum(self.runEnds[first:last], end)
+        return runStarts, runEnds, self.runChars[first:last]
+
+    def codes(self, start=0, end=None):
+        '''
+        Return orfEngine nucleotide codes (A=0, C=1, G=2, T=3, other=4) for start-end. Only the
+        packed bytes covering the range are unpacked.
+        '''
+        end = self.length if end is None else min(end, self.length)
+        start = max(start, 0)
+        if start >= end:
+            return np.empty(0, dtype=np.uint8)
+        firstByte = start // 4
+        codes = unpackBytes(self.packed[firstByte:(end + 3) // 4])[start - firstByte * 4:end - firstByte * 4]
+        for runStart, runEnd in zip(*self.selectRuns(start, end)[:2]):
+            codes[runStart - start:runEnd - start] = 4
+        return codes
+
+    def toBytes(self, start=0, end=None):
+        '''Return the bases of start-end as ASCII bytes'''
+        end = self.length if end is None else min(end, self.length)
+        start = max(start, 0)
+        codes = self.codes(start, end)
+        chars = bases[np.minimum(codes, 3)]
+        for runStart, runEnd, char in zip(*self.selectRuns(start, end)):
+            chars[runStart - start:runEnd - start] = char
+        return chars.tobytes()
+
+    def __getitem__(self, item):
+        '''Return a base for an index, or a PackedSequence for a slice with step 1'''
+        if isinstance(item, slice):
+            start, end, step = item.indices(self.length)
+            if step != 1:
+                return PackedSequence(self.toBytes()[item])
+            return self.slice(start, end)
+        if item < 0:
+            item += self.length
+        if not 0 <= item < self.length:
+            raise IndexError('PackedSequence index out of range')
+        return self.toBytes(item, item + 1).decode('ascii')
+
+    def slice(self, start, end):
+        '''
+        Return the packed sub-sequence start-end. When start is a multiple of 4 the packed
+        bytes are reused as they are, otherwise the bytes are shifted by whole bases.
+        '''
+        end = max(start, end)
+        shift = start % 4
+        packed = self.packed[start // 4:(end + 3) // 4]
+        if shift:
+            # move every base down by shift fields, pulling the low fields of the next byte
+            following = np.concatenate((packed[1:], np.zeros(1, dtype=np.uint8)))
+            packed = (packed >> (2 * shift)) | (following << (8 - 2 * shift))
+        length = end - start
+        packed = packed[:(length + 3) // 4].copy()
+        runStarts, runEnds, runChars = self.selectRuns(start, end)
+        return PackedSequence(packed=packed, length=length, runs=(runStarts - start, runEnds - start, runChars.copy()))
+
+    def reverseComplement(self):
+        '''
+        Return the reverse complement as a PackedSequence. Each byte is reversed and
+        complemented with a 256-entry table, then the padding bases are shifted out.
+        '''
+        packed = reverseTable[self.packed[::-1]]
+        pad = len(self.packed) * 4 - self.length
+        if pad:
+            following = np.concatenate((packed[1:], np.zeros(1, dtype=np.uint8)))
+            packed = (packed >> (2 * pad)) | (following << (8 - 2 * pad))
+        runStarts = self.length - self.runEnds[::-1]
+        runEnds = self.length - self.runStarts[::-1]
+        runChars = np.array([ord(ambiguityComplement.get(chr(char), chr(char))) for char in self.runChars[::-1]],
+                            dtype=np.uint8)
+        return PackedSequence(packed=packed.copy(), length=self.length, runs=(runStarts, runEnds, runChars))
+
+    def codonIndices(self, start=0, end=None):
+        '''Return the orfEngine codon index of every codon start in start-end'''
+        return orfEngine.codonIndices(self.codes(start, end))
+
+    def codons(self, frame=0):
+        '''Return the codon indices of one frame (0, 1 or 2)'''
+        return self.codonIndices(frame)[::3]
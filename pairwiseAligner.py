@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: pairwiseAligner.py
+#   Executable: python pairwiseAligner.py -r spikeSequences.fasta -i spikeSequences.fasta -B 32 > spikes.tsv
+#               python pairwiseAligner.py -i sars2FilProt.fa -m local -f fasta > orfPairs.fa
+#
+#   Required module: numpy, substitutionMatrix, sequenceAnalysis
+#   Purpose: global (Needleman-Wunsch) and local (Smith-Waterman) alignment with affine gaps
+#            and BLOSUM62 or match/mismatch nucleotide scoring, replacing the Clustal runs and
+#            the notebook dot plot for pairwise comparisons. The dynamic programming matrix is
+#            filled one row at a time with NumPy: diagonal and vertical moves are whole-row
+#            operations and horizontal gaps are a running maximum along the row. A row holds
+#            either every column or, in banded mode, only the diagonals near the main one, so
+#            near-identical sequences (variant spikes against the reference) fill a narrow
+#            band. Pairs are aligned in batches, a batch sharing every row operation.
+#   Condition(s): The first gap residue costs gapOpen, each following one gapExtend, with
+#                 gapOpen >= gapExtend. A band of B keeps the diagonals within B of the ones
+#                 joining both matrix corners, alignments leaving it are not found. Positions
+#                 in the output are 1-based and inclusive.
+#
+#################################################################################################
+
+import sys
+
+import numpy as np
+
+from pipelineProfiler import profiler, addProfileOption
+from substitutionMatrix import blosum62, encodeNucleotide, encodeProtein, nucleotideMatrix
+
+negativeInfinity = -(1 << 28) # low enough to never win, high enough not to overflow int32
+padScore = -1000 # score of the padding past the end of the shorter sequences of a batch
+nucleotides = frozenset('ACGTUN')
+
+# traceback bits of a cell: where its score came from and whether its gaps were extended
+fromDiagonal, fromHorizontal, fromVertical, fromStart = 0, 1, 2, 3
+horizontalExtended, verticalExtended = 4, 8
+
+
+def isNucleotide(sequence):
+    '''Return True if a sequence only holds ACGTUN'''
+    sequence = sequence.upper()
+    return bool(sequence) and set(sequence) <= nucleotides
+
+
+def scoreTable(matrix):
+    '''Return a substitution matrix as int32 with an extra padding code scoring padScore'''
+    table = np.full((len(matrix) + 1, len(matrix) + 1), padScore, dtype=np.int32)
+    table[:-1, :-1] = matrix
+    return table
+
+
+class SubstitutionScores():
+    '''
+    Substitution scores of a batch of encoded pairs, gathered a block of matrix rows at a time.
+
+    instantiation:
+    thisScores = SubstitutionScores([encodeProtein(protein1)], [encodeProtein(protein2)], scoreTable(blosum62))
+    usage:
+    blockScores = thisScores.block(0, 64, 0, 0, thisScores.lengths2.max())
+    '''
+
+    def __init__(self, codes1, codes2, table):
+        '''contructor: pads the pairs of the batch to the same lengths with the padding code'''
+        self.count = len(codes1)
+        self.lengths1 = np.array([len(codes) for codes in codes1], dtype=np.int64)
+        self.lengths2 = np.array([len(codes) for codes in codes2], dtype=np.int64)
+        self.table = table
+        pad = len(table) - 1
+        # one extra padding column for the positions before or past sequence 2
+        self.padded1 = np.full((self.count, int(self.lengths1.max())), pad, dtype=np.intp)
+        self.padded2 = np.full((self.count, int(self.lengths2.max()) + 1), pad, dtype=np.intp)
+        for pair in range(self.count):
+            self.padded1[pair, :self.lengths1[pair]] = codes1[pair]
+            self.padded2[pair, :self.lengths2[pair]] = codes2[pair]
+
+    def block(self, rowStart, rowEnd, columnStart, step, width):
+        '''
+        Return the (count, rowEnd - rowStart, width) scores of the residues rowStart..rowEnd of
+        the sequences 1 against width residues of the sequences 2, from columnStart on the
+        first row and step more on each following row. Positions past the ends score padScore.
+        '''
+        columns = columnIndexes(rowEnd - rowStart, columnStart, step, width, self.padded2.shape[1] - 1)
+        return self.table[self.padded1[:, rowStart:rowEnd, None], self.padded2[:, columns]]
+
+
+def columnIndexes(rows, columnStart, step, width, length):
+    '''
+    Return the (rows, width) column indexes of a block, positions outside 0..length as length.
+    Rows of full matrices (step 0) share their columns, returned once as a (1, width) array.
+    '''
+    columns = columnStart + step * np.arange(rows if step else 1)[:, None] + np.arange(width)
+    columns[(columns < 0) | (columns > length)] = length
+    return columns
+
+
+def fillMatrices(substitutions, gapOpen, gapExtend, local=False, band=None, traceback=True, blockCells=1 << 22):
+    '''
+    Fill the alignment matrices of a batch of pairs, scored by a SubstitutionScores-like
+    object, and return (scores, endRows, endColumns, traces, low, step). traces[pair] is an
+    (rows + 1, width) uint8 array of traceback bits, or None. Row i of every matrix holds the
+    columns step * (i + low) .. step * (i + low) + width - 1: all of them (step 0) or a band
+    of diagonals (step 1). Substitution scores are gathered and traceback bits packed for
+    blocks of about blockCells cells at a time, leaving a few whole-row operations per row.
+    '''
+    count = substitutions.count
+    lengths1, lengths2 = substitutions.lengths1, substitutions.lengths2
+    rows, columns = int(lengths1.max()), int(lengths2.max())
+    if band is None:
+        low, step, width = 0, 0, columns + 1
+    else:
+        differences = lengths2 - lengths1
+        low = int(min(0, differences.min())) - band
+        step, width = 1, int(max(0, differences.max())) + band - low + 1
+
+    def first(row):
+        return step * (row + low)
+
+    blockRows = max(1, min(rows, blockCells // (count * width)))
+    traces = np.empty((count, rows + 1, width), dtype=np.uint8) if traceback else None
+    # per block: horizontal best, vertical beats diagonal, horizontal and vertical extended, local start
+    planes = np.zeros((5 if local else 4, count, blockRows, width), dtype=bool)
+    ramp = gapExtend * np.arange(width, dtype=np.int32)
+    openExtendDelta = gapOpen - gapExtend
+    rowMaxima = np.zeros((count, rows + 1), dtype=np.int32) if local else None
+    rowArgmax = np.zeros((count, rows + 1), dtype=np.intp) if local else None
+
+    # H and F rows keep a guard column on each side so shifted reads are views
+    previousH = np.full((count, width + 2), negativeInfinity, dtype=np.int32)
+    previousF = np.full((count, width + 2), negativeInfinity, dtype=np.int32)
+    currentH, currentF = previousH.copy(), previousF.copy()
+    horizontal = np.full((count, width), negativeInfinity, dtype=np.int32)
+    running = np.empty((count, width), dtype=np.int32)
+
+    # row 0: leading gaps in sequence 1, free in local alignments
+    j = first(0) + np.arange(width)
+    if local:
+        previousH[:, 1:-1] = np.where(j >= 0, 0, negativeInfinity)
+        bits = fromStart
+    else:
+        previousH[:, 1:-1] = np.where(j > 0, -(gapOpen + (j - 1) * gapExtend), np.where(j == 0, 0, negativeInfinity))
+        bits = np.where(j > 1, fromHorizontal | horizontalExtended, fromHorizontal)
+    if traceback:
+        traces[:, 0] = bits
+    scores = np.full(count, negativeInfinity, dtype=np.int64)
+    # global alignments end in the last cell of each pair, read when its row is filled
+    finishing = {}
+    for pair, length in enumerate(lengths1.tolist()):
+        finishing.setdefault(length, []).append(pair)
+    if not local and 0 in finishing:
+        pairs = np.array(finishing[0])
+        scores[pairs] = previousH[pairs, 1 + lengths2[pairs] - first(0)]
+
+    for blockStart in range(1, rows + 1, blockRows):
+        blockEnd = min(rows + 1, blockStart + blockRows)
+        # row i scores residue i - 1 of sequence 1 against the residues before its columns
+        blockScores = substitutions.block(blockStart - 1, blockEnd - 1, first(blockStart) - 1, step, width)
+        for row in range(blockStart, blockEnd):
+            start = first(row)
+            line = row - blockStart
+            # diagonal move from (row - 1, j - 1), vertical move from (row - 1, j)
+            diagonal = previousH[:, step:step + width] + blockScores[:, line]
+            upH = previousH[:, 1 + step:1 + step + width]
+            upF = previousF[:, 1 + step:1 + step + width]
+            vertical = currentF[:, 1:-1]
+            np.maximum(upH - gapOpen, upF - gapExtend, out=vertical)
+            best = np.maximum(diagonal, vertical)
+            if local:
+                np.maximum(best, 0, out=best)
+            # column 0 and the columns before it (banded rows near the top)
+            zero = -start
+            if zero >= 0:
+                best[:, :zero] = vertical[:, :zero] = negativeInfinity
+                if zero < width:
+                    boundary = 0 if local else -(gapOpen + (row - 1) * gapExtend)
+                    best[:, zero] = boundary
+                    vertical[:, zero] = negativeInfinity if local else boundary
+            # horizontal gaps: E[k] = max over c < k of best[c] - gapOpen - (k - c - 1) * gapExtend
+            np.add(best, ramp, out=running)
+            np.maximum.accumulate(running, axis=1, out=running)
+            np.subtract(running[:, :-1], gapOpen + ramp[:-1], out=horizontal[:, 1:])
+            H = currentH[:, 1:-1]
+            np.maximum(best, horizontal, out=H)
+
+            if traceback:
+                np.greater(horizontal, best, out=planes[0, :, line])
+                np.greater(vertical, diagonal, out=planes[1, :, line])
+                np.greater(horizontal[:, :-1] + openExtendDelta, best[:, :-1], out=planes[2, :, line, 1:])
+                np.greater(upF + openExtendDelta, upH, out=planes[3, :, line])
+                if local:
+                    np.less_equal(H, 0, out=planes[4, :, line])
+            if local:
+                np.max(H, axis=1, out=rowMaxima[:, row])
+                np.argmax(H, axis=1, out=rowArgmax[:, row])
+            elif row in finishing:
+                pairs = np.array(finishing[row])
+                scores[pairs] = H[pairs, lengths2[pairs] - start]
+            previousH, currentH = currentH, previousH
+            previousF, currentF = currentF, previousF
+
+        if traceback:
+            used = planes[:, :, :blockEnd - blockStart]
+            bits = np.where(used[0], fromHorizontal, np.where(used[1], fromVertical, fromDiagonal)).astype(np.uint8)
+            if local:
+                bits[used[4]] = fromStart
+            bits |= used[2].view(np.uint8) << 2
+            bits |= used[3].view(np.uint8) << 3
+            traces[:, blockStart:blockEnd] = bits
+            # column 0 of the block rows
+            for row in range(blockStart, blockEnd):
+                zero = -first(row)
+                if 0 <= zero < width:
+                    traces[:, row, zero] = fromStart if local else (fromVertical | verticalExtended if row > 1 else fromVertical)
+
+    endRows, endColumns = lengths1.copy(), lengths2.copy()
+    if local:
+        endRows = rowMaxima.argmax(axis=1)
+        scores = rowMaxima[np.arange(count), endRows].astype(np.int64)
+        endColumns = step * (endRows + low) + rowArgmax[np.arange(count), endRows]
+        # without a positive cell the best local alignment is empty, the argmax can fall anywhere
+        endRows[scores <= 0] = endColumns[scores <= 0] = 0
+    return scores, endRows, endColumns, traces, low, step
+
+
+def tracebackOperations(trace, row, column, low, step, local):
+    '''
+    Follow the traceback bits from the end cell (row, column) and return
+    (operations, startRow, startColumn), operations being a uint8 array of 0 (residue pair),
+    1 (gap in sequence 1) and 2 (gap in sequence 2) in alignment order.
+    '''
+    width = trace.shape[1]
+    cells = trace.tobytes()
+    operations = []
+    state = fromDiagonal
+    while row > 0 or column > 0:
+        bits = cells[row * width + column - step * (row + low)]
+        if state == fromDiagonal:
+            source = bits & 3
+            if source == fromStart:
+                break
+            if source == fromDiagonal:
+                operations.append(0)
+                row -= 1
+                column -= 1
+            else:
+                state = source
+        elif state == fromHorizontal:
+            operations.append(1)
+            state = fromHorizontal if bits & horizontalExtended else fromDiagonal
+            column -= 1
+        else:
+            operations.append(2)
+            state = fromVertical if bits & verticalExtended else fromDiagonal
+            row -= 1
+    return np.array(operations[::-1], dtype=np.uint8), row, column
+
+
+def alignedStrings(sequence1, sequence2, operations, start1, start2):
+    '''Return the two gapped rows of an alignment given by its operations'''
+    rows = []
+    for sequence, gap, start in ((sequence1, 1, start1), (sequence2, 2, start2)):
+        residues = np.frombuffer(sequence.encode('ascii', 'replace'), dtype=np.uint8)
+        taken = operations != gap
+        positions = np.cumsum(taken) - 1 + start
+        row = np.full(len(operations), ord('-'), dtype=np.uint8)
+        row[taken] = residues[positions[taken]]
+        rows.append(row.tobytes().decode('ascii'))
+    return rows
+
+
+def alignBatch(pairs, matrix=blosum62, encoder=encodeProtein, gapOpen=11, gapExtend=1, local=False,
+               band=None, traceback=True):
+    '''
+    Align a batch of (sequence1, sequence2) string pairs together and return a list of
+    (score, aligned1, aligned2, start1, end1, start2, end2) tuples, with 0-based exclusive
+    ends. Without traceback the aligned rows are None and local starts are not known (0).
+    '''
+    if not pairs:
+        return []
+    substitutions = SubstitutionScores([encoder(sequence1) for sequence1, sequence2 in pairs],
+                                       [encoder(sequence2) for sequence1, sequence2 in pairs], scoreTable(matrix))
+    with profiler.stage('fillMatrices'):
+        scores, endRows, endColumns, traces, low, step = fillMatrices(substitutions, gapOpen, gapExtend,
+                                                                      local, band, traceback)
+    results = []
+    with profiler.stage('traceback'):
+        for pair, (sequence1, sequence2) in enumerate(pairs):
+            score, end1, end2 = int(scores[pair]), int(endRows[pair]), int(endColumns[pair])
+            if not traceback:
+                results.append((score, None, None, 0, end1, 0, end2))
+                continue
+            operations, start1, start2 = tracebackOperations(traces[pair], end1, end2, low, step, local)
+            aligned1, aligned2 = alignedStrings(sequence1, sequence2, operations, start1, start2)
+            results.append((score, aligned1, aligned2, start1, end1, start2, end2))
+    return results
+
+
+def align(sequence1, sequence2, **options):
+    '''Align two sequences, see alignBatch for the options and the returned tuple'''
+    return alignBatch([(sequence1, sequence2)], **options)[0]
+
+
+def batchAlign(pairs, batchSize=64, **options):
+    '''
+    Yield the alignments of many pairs in input order, aligning them in batches of batchSize
+    pairs of similar lengths so little of each batch is padding
+    '''
+    order = sorted(range(len(pairs)), key=lambda pair: (len(pairs[pair][0]), len(pairs[pair][1])))
+    results = [None] * len(pairs)
+    emitted = 0
+    for batchStart in range(0, len(order), batchSize):
+        chosen = order[batchStart:batchStart + batchSize]
+        for pair, result in zip(chosen, alignBatch([pairs[pair] for pair in chosen], **options)):
+            results[pair] = result
+        while emitted < len(results) and results[emitted] is not None:
+            yield results[emitted]
+            results[emitted] = None
+            emitted += 1
+    for result in results[emitted:]:
+        yield result
+
+
+def identity(aligned1, aligned2):
+    '''Return the fraction of alignment columns holding the same residue in both rows'''
+    if not aligned1:
+        return 0.0
+    row1 = np.frombuffer(aligned1.upper().encode('ascii'), dtype=np.uint8)
+    row2 = np.frombuffer(aligned2.upper().encode('ascii'), dtype=np.uint8)
+    return float(np.mean((row1 == row2) & (row1 != ord('-'))))
+
+
+def alignChunk(pairs, batchSize=64, **options):
+    '''Return the alignments of a chunk of pairs, the unit of work of the worker processes'''
+    return list(batchAlign(pairs, batchSize, **options))
+
+
+def writeAlignments(referenceName, records, alignments, format):
+    '''Write the alignments of the records with the reference as tsv lines or fasta pairs'''
+    if format == 'tsv':
+        sys.stdout.write('reference\tquery\tscore\tidentity\tlength\treferenceStart\treferenceEnd\tqueryStart\tqueryEnd\n')
+    for (header, sequence), (score, aligned1, aligned2, start1, end1, start2, end2) in zip(records, alignments):
+        with profiler.stage('writeAlignments'):
+            if format == 'tsv':
+                sys.stdout.write('{}\t{}\t{}\t{:.1f}\t{}\t{}\t{}\t{}\t{}\n'.format(
+                    referenceName, header, score, 100 * identity(aligned1, aligned2), len(aligned1),
+                    start1 + 1, end1, start2 + 1, end2))
+            else:
+                sys.stdout.write('>{}\n{}\n>{}\n{}\n\n'.format(referenceName, aligned1, header, aligned2))
+
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='pairwiseAligner.py - aligns every sequence of a fasta file with a reference',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] <input >output'
+            )
+        self.parser.add_argument('-i', '--input', action='store', default='',
+                                 help='fasta file of the sequences to align (default stdin)')
+        self.parser.add_argument('-r', '--reference', action='store', default=None,
+                                 help='fasta file whose first record is the reference (default the first input record)')
+        self.parser.add_argument('-m', '--mode', action='store', choices=['global', 'local'], default='global',
+                                 help='Needleman-Wunsch (global) or Smith-Waterman (local) alignment')
+        self.parser.add_argument('-t', '--type', action='store', choices=['auto', 'protein', 'nucleotide'], default='auto',
+                                 help='sequence type, auto uses nucleotide scoring when the reference is only ACGTUN')
+        self.parser.add_argument('-B', '--band', type=int, default=None, action='store',
+                                 help='band width around the main diagonals (default full matrices)')
+        self.parser.add_argument('-gO', '--gapOpen', type=int, default=None, action='store',
+                                 help='cost of the first gap residue (default 11 protein, 5 nucleotide)')
+        self.parser.add_argument('-gE', '--gapExtend', type=int, default=None, action='store',
+                                 help='cost of each following gap residue (default 1 protein, 2 nucleotide)')
+        self.parser.add_argument('-M', '--match', type=int, default=2, action='store',
+                                 help='nucleotide match score')
+        self.parser.add_argument('-X', '--mismatch', type=int, default=-3, action='store',
+                                 help='nucleotide mismatch score')
+        self.parser.add_argument('-s', '--batchSize', type=int, default=64, action='store',
+                                 help='number of pairs aligned together')
+        self.parser.add_argument('-j', '--jobs', type=int, default=1, action='store',
+                                 help='number of worker processes aligning batches')
+        self.parser.add_argument('-f', '--format', action='store', choices=['tsv', 'fasta'], default='tsv',
+                                 help='alignment summaries or aligned pairs as fasta records')
+        addProfileOption(self.parser)
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+
+def main(inCL=None):
+    '''
+    Align the input records with the reference and write the alignments
+    '''
+    import functools
+    from sequenceAnalysis import FastAreader
+    myCommandLine = CommandLine(inCL)
+    args = myCommandLine.args
+    if args.profile:
+        profiler.enable('pairwiseAligner.py')
+    with profiler.stage('readFasta'):
+        records = list(FastAreader(args.input).readFasta())
+        if args.reference is not None:
+            reference = next(iter(FastAreader(args.reference).readFasta()))
+        elif records:
+            reference, records = records[0], records[1:]
+        else:
+            return
+    profiler.count('records', len(records))
+    nucleotide = args.type == 'nucleotide' or (args.type == 'auto' and isNucleotide(reference[1]))
+    options = dict(local=args.mode == 'local', band=args.band)
+    if nucleotide:
+        options.update(matrix=nucleotideMatrix(args.match, args.mismatch), encoder=encodeNucleotide,
+                       gapOpen=5 if args.gapOpen is None else args.gapOpen,
+                       gapExtend=2 if args.gapExtend is None else args.gapExtend)
+    else:
+        options.update(gapOpen=11 if args.gapOpen is None else args.gapOpen,
+                       gapExtend=1 if args.gapExtend is None else args.gapExtend)
+    pairs = [(reference[1], sequence) for header, sequence in records]
+    if args.jobs > 1:
+        import multiprocessing
+        chunks = [pairs[chunkStart:chunkStart + args.batchSize * 4] for chunkStart in range(0, len(pairs), args.batchSize * 4)]
+        with multiprocessing.Pool(processes=args.jobs) as pool:
+            alignments = (result for chunk in pool.imap(functools.partial(alignChunk, batchSize=args.batchSize, **options), chunks)
+                          for result in chunk)
+            writeAlignments(reference[0], records, alignments, args.format)
+    else:
+        writeAlignments(reference[0], records, batchAlign(pairs, args.batchSize, **options), args.format)
+    profiler.writeReport(args.profile)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: pipelineProfiler.py
+#   Required module: None
+#   Purpose: shared instrumentation of the command-line tools. Every script enables the module
+#            profiler with --profile, times its stages (fasta parsing, ORF scanning, sorting,
+#            bed extraction, output formatting, ...) and counts records, bases and ORFs. At the
+#            end the report, with wall and CPU time per stage and peak RSS, is written as JSON
+#            in stderr or a file.
+#   Condition(s): Stage times are exclusive: time spent in a stage started inside another one
+#                 (e.g. fasta parsing pulled by the ORF scan) is only counted in the inner
+#                 stage. When the profiler is off, stage() returns a shared no-op context,
+#                 iterate() returns its input and count() returns at once.
+#
+#################################################################################################
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+nullStage = contextlib.nullcontext()
+
+
+def peakRSS(who='self'):
+    '''Return the peak resident set size in bytes of the process or its children'''
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+
+class StageTimer():
+    '''Context manager timing one run of a stage, nested stages are subtracted'''
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        stack = self.profiler.stack()
+        # [wall, cpu] of the stages started inside this one
+        self.children = [0.0, 0.0]
+        stack.append(self)
+        self.wall, self.cpu = time.perf_counter(), time.process_time()
+        return self
+
+    def __exit__(self, *exception):
+        wall, cpu = time.perf_counter() - self.wall, time.process_time() - self.cpu
+        stack = self.profiler.stack()
+        stack.pop()
+        if stack:
+            stack[-1].children[0] += wall
+            stack[-1].children[1] += cpu
+        self.profiler.addStage(self.name, wall - self.children[0], cpu - self.children[1])
+        return False
+
+
+class Profiler():
+    '''
+    Per-stage wall and CPU times and counters of one run of a tool.
+
+    usage:
+    profiler.enable('findORFs.py')
+    for header, sequence in profiler.iterate('readFasta', reader.readFasta(), countRecords=True):
+        with profiler.stage('findORFs'):
+            ...
+        profiler.count('orfs', len(orfs))
+    profiler.writeReport('-')
+    '''
+
+    def __init__(self):
+        '''contructor: the profiler starts disabled'''
+        self.enabled = False
+        self.tool = ''
+        self.stages = {}
+        self.counters = {}
+        self.local = threading.local()
+        self.started = None
+
+    def enable(self, tool=''):
+        '''Start profiling a run of tool'''
+        self.enabled = True
+        self.tool = tool
+        self.stages = {}
+        self.counters = {}
+        self.started = (time.perf_counter(), time.process_time())
+        return self
+
+    def stack(self):
+        '''Return the stack of running stages of the current thread'''
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def addStage(self, name, wall, cpu):
+        totals = self.stages.get(name)
+        if totals is None:
+            totals = self.stages[name] = {'wallSeconds': 0.0, 'cpuSeconds': 0.0, 'calls': 0}
+        totals['wallSeconds'] += wall
+        totals['cpuSeconds'] += cpu
+        totals['calls'] += 1
+
+    def stage(self, name):
+        '''Return a context manager timing a stage, or a no-op context when disabled'''
+        if not self.enabled:
+            return nullStage
+        return StageTimer(self, name)
+
+    def count(self, name, value=1):
+        '''Add value to a counter'''
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def iterate(self, name, iterable, countRecords=False):
+        '''
+        Return iterable with the time spent producing every item counted as a stage. With
+        countRecords, items are (header, sequence) records counted as records and bases.
+        '''
+        if not self.enabled:
+            return iterable
+        return self.timedIterator(name, iterable, countRecords)
+
+    def timedIterator(self, name, iterable, countRecords):
+        iterator = iter(iterable)
+        while True:
+            with StageTimer(self, name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            if countRecords:
+                self.count('records')
+                self.count('bases', len(item[1]))
+            yield item
+
+    def report(self):
+        '''Return the report of the run as a dictionary'''
+        wall, cpu = self.started if self.started else (time.perf_counter(), time.process_time())
+        return {'tool': self.tool, 'argv': sys.argv[1:], 'pid': os.getpid(),
+                'wallSeconds': time.perf_counter() - wall, 'cpuSeconds': time.process_time() - cpu,
+                'peakRssBytes': peakRSS('self'), 'peakChildRssBytes': peakRSS('children'),
+                'counters': dict(self.counters), 'stages': {name: dict(totals) for name, totals in self.stages.items()}}
+
+    def writeReport(self, destination='-'):
+        '''Write the JSON report in stderr ('-' or '') or in a file'''
+        if not self.enabled:
+            return
+        text = json.dumps(self.report(), indent=1) + '\n'
+        if destination in ('', '-'):
+            sys.stderr.write(text)
+        else:
+            with open(destination, 'w') as outFile:
+                outFile.write(text)
+
+
+# profiler shared by every module of the project, enabled by the --profile option
+profiler = Profiler()
+
+
+def addProfileOption(parser):
+    '''Add the --profile option to an argparse parser'''
+    parser.add_argument('-p', '--profile', action='store', nargs='?', const='-', default='',
+                        help='write a JSON report of stage times and counters in stderr, or in the given file')
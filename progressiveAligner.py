@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: progressiveAligner.py
+#   Executable: python progressiveAligner.py -i ORF3a.fasta > ORF3a.aln
+#               python progressiveAligner.py -i spikeCohort.fa -B 32 -j 16 > spikeCohort.aln
+#
+#   Required module: numpy, alignmentTree, pairwiseAligner, proteinIndex, substitutionMatrix,
+#                    sequenceAnalysis
+#   Purpose: progressive multiple sequence alignment written in Clustal format, so alignments
+#            such as ORFS.aln are made in the project and still read by AlignIO.read in the
+#            notebook. Identical sequences are collapsed first. A UPGMA guide tree is built
+#            from k-mer distances (shared distinct k-mers, one matrix product), then profiles
+#            are aligned from the leaves up with the pairwise aligner's row-vectorized affine
+#            gap dynamic programming, scoring column pairs by their average substitution
+#            score. Merges of the same tree level do not depend on each other and run in
+#            parallel worker processes.
+#   Condition(s): Gaps cost as in pairwiseAligner.py, terminal gaps included. Sequences are
+#                 written in input order, named by the first word of their header, and the
+#                 collapsed copies of a sequence get its aligned row.
+#
+#################################################################################################
+
+import sys
+
+import numpy as np
+
+from alignmentTree import upgma
+from pairwiseAligner import columnIndexes, fillMatrices, isNucleotide, padScore, tracebackOperations
+from pipelineProfiler import profiler, addProfileOption
+from proteinIndex import kmerCodes
+from substitutionMatrix import aminoAcidCount, blosum62, nucleotideCode, nucleotideMatrix, proteinCode
+
+profileScale = 100 # profile scores are averages, kept as integers in hundredths
+gap = ord('-')
+
+# Clustal conservation groups: ':' for strongly and '.' for weakly similar residues
+strongGroups = ['STA', 'NEQK', 'NHQK', 'NDEQ', 'QHRK', 'MILV', 'MILF', 'HY', 'FYW']
+weakGroups = ['CSA', 'ATV', 'SAG', 'STNK', 'STPA', 'SGND', 'SNDEQK', 'NDEQHK', 'NEQHRK', 'FVLIM', 'HFY']
+
+
+def collapseIdentical(sequences):
+    '''Return (unique, owners): the distinct sequences and, for each sequence, its index in unique'''
+    first = {}
+    owners = [first.setdefault(sequence, len(first)) for sequence in sequences]
+    return list(first), owners
+
+
+def kmerDistances(sequences, codeTable, k, base):
+    '''
+    Return the n x n k-mer distance matrix of sequences: 1 - shared distinct k-mers / distinct
+    k-mers of the sequence holding fewer. Sequences become rows of a presence matrix over the
+    k-mers found, so all shared counts are one matrix product.
+    '''
+    kmerSets = []
+    for sequence in sequences:
+        kmers, valid = kmerCodes(codeTable[np.frombuffer(sequence.encode('ascii', 'replace'), dtype=np.uint8)], k, base)
+        kmerSets.append(np.unique(kmers[valid]))
+    found = np.unique(np.concatenate(kmerSets)) if kmerSets else np.empty(0, dtype=np.int64)
+    presence = np.zeros((len(sequences), len(found)), dtype=np.float32)
+    for row, kmers in enumerate(kmerSets):
+        presence[row, np.searchsorted(found, kmers)] = 1
+    sizes = presence.sum(axis=1)
+    shared = presence @ presence.T
+    distances = 1 - shared / np.maximum(np.minimum(sizes[:, None], sizes[None, :]), 1)
+    np.fill_diagonal(distances, 0)
+    return distances.astype(np.float64)
+
+
+def treeLevels(root):
+    '''
+    Return the internal nodes of a tree grouped in levels, every node being one level above
+    its highest child, so the nodes of a level can be merged independently
+    '''
+    heights = {}
+    levels = []
+    stack = [(root, False)]
+    # iterative post-order walk, guide trees of similar sequences can be very deep
+    while stack:
+        node, visited = stack.pop()
+        if node.isLeaf():
+            heights[id(node)] = 0
+        elif visited:
+            height = 1 + max(heights[id(child)] for child in node.children)
+            heights[id(node)] = height
+            if len(levels) < height:
+                levels.append([])
+            levels[height - 1].append(node)
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children)
+    return levels
+
+
+def residueFrequencies(rows, codeTable, alphabetSize):
+    '''Return the (columns, alphabetSize) residue frequencies of aligned rows, gaps counting for no residue'''
+    sequences, columns = rows.shape
+    cells = np.arange(columns) * alphabetSize + codeTable[rows].astype(np.int64)
+    counts = np.bincount(cells[rows != gap], minlength=columns * alphabetSize)
+    return counts.reshape(columns, alphabetSize) / max(sequences, 1)
+
+
+class ProfileScores():
+    '''
+    Average substitution scores between the columns of a batch of profile pairs, in
+    profileScale units, gathered a block of matrix rows at a time like SubstitutionScores
+    in pairwiseAligner.py.
+
+    instantiation:
+    thisScores = ProfileScores([residueFrequencies(rows1, proteinCode, 24)], [residueFrequencies(rows2, proteinCode, 24)], blosum62)
+    usage:
+    scores, endRows, endColumns, traces, low, step = fillMatrices(thisScores, 1100, 100)
+    '''
+
+    def __init__(self, frequencies1, frequencies2, matrix, subRows=256):
+        '''contructor: weights the profile 1 columns by the matrix once'''
+        self.count = len(frequencies1)
+        self.lengths1 = np.array([len(frequencies) for frequencies in frequencies1], dtype=np.int64)
+        self.lengths2 = np.array([len(frequencies) for frequencies in frequencies2], dtype=np.int64)
+        self.weighted1 = [profileScale * frequencies @ matrix for frequencies in frequencies1]
+        # one extra row of zeros for the positions before or past profile 2
+        self.frequencies2 = [np.vstack([frequencies, np.zeros((1, frequencies.shape[1]))]) for frequencies in frequencies2]
+        self.subRows = subRows
+
+    def block(self, rowStart, rowEnd, columnStart, step, width):
+        '''
+        Return the (count, rowEnd - rowStart, width) scores of a block, see
+        SubstitutionScores.block. Every subRows rows are scored against all the columns they
+        span with one matrix product, from which the band is read.
+        '''
+        scores = np.full((self.count, rowEnd - rowStart, width), padScore * profileScale, dtype=np.int32)
+        subRows = self.subRows if step else rowEnd - rowStart
+        for pair, (weighted, frequencies) in enumerate(zip(self.weighted1, self.frequencies2)):
+            outside = len(frequencies) - 1
+            for subStart in range(rowStart, min(rowEnd, len(weighted)), subRows):
+                subEnd = min(rowEnd, len(weighted), subStart + subRows)
+                spanStart = columnStart + step * (subStart - rowStart)
+                span = columnIndexes(1, spanStart, 0, step * (subEnd - subStart - 1) + width, outside)[0]
+                dense = weighted[subStart:subEnd] @ frequencies[span].T
+                dense[:, span == outside] = padScore * profileScale
+                if step:
+                    dense = np.take_along_axis(dense, np.arange(subEnd - subStart)[:, None] + np.arange(width), axis=1)
+                scores[pair, subStart - rowStart:subEnd - rowStart] = np.rint(dense)
+        return scores
+
+
+def insertGaps(rows, operations, gapOperation):
+    '''Return aligned rows with a gap column wherever the alignment operation is gapOperation'''
+    taken = operations != gapOperation
+    merged = np.full((len(rows), len(operations)), gap, dtype=np.uint8)
+    merged[:, taken] = rows
+    return merged
+
+
+def alignProfiles(pairs, matrix, codeTable, gapOpen, gapExtend, band=None):
+    '''
+    Align a batch of (rows1, rows2) profile pairs, 2-D uint8 arrays of aligned rows, together
+    and return the rows of each merged profile
+    '''
+    substitutions = ProfileScores([residueFrequencies(rows1, codeTable, len(matrix)) for rows1, rows2 in pairs],
+                                  [residueFrequencies(rows2, codeTable, len(matrix)) for rows1, rows2 in pairs], matrix)
+    scores, endRows, endColumns, traces, low, step = fillMatrices(substitutions, gapOpen * profileScale,
+                                                                  gapExtend * profileScale, band=band)
+    merged = []
+    for pair, (rows1, rows2) in enumerate(pairs):
+        operations, startRow, startColumn = tracebackOperations(traces[pair], rows1.shape[1], rows2.shape[1], low, step, False)
+        merged.append(np.vstack([insertGaps(rows1, operations, 1), insertGaps(rows2, operations, 2)]))
+    return merged
+
+
+def progressiveAlignment(sequences, matrix=blosum62, codeTable=proteinCode, base=aminoAcidCount, k=3,
+                         gapOpen=11, gapExtend=1, band=None, batchSize=32, jobs=1):
+    '''
+    Return the aligned rows (strings) of sequences. Identical sequences are aligned once and
+    the guide tree is the UPGMA tree of their k-mer distances. The profile merges of a tree
+    level are aligned in batches of batchSize pairs, spread over jobs worker processes.
+    '''
+    import functools
+    if not sequences:
+        return []
+    unique, owners = collapseIdentical(sequences)
+    profiler.count('uniqueSequences', len(unique))
+    with profiler.stage('kmerDistances'):
+        distances = kmerDistances(unique, codeTable, k, base)
+    with profiler.stage('guideTree'):
+        root = upgma(distances, [str(index) for index in range(len(unique))])
+    profiles = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.isLeaf():
+            profiles[id(node)] = ([int(node.name)], np.frombuffer(unique[int(node.name)].encode('ascii', 'replace'),
+                                                                   dtype=np.uint8).reshape(1, -1))
+        stack.extend(node.children)
+    align = functools.partial(alignProfiles, matrix=matrix, codeTable=codeTable, gapOpen=gapOpen,
+                              gapExtend=gapExtend, band=band)
+    pool = None
+    if jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes=jobs)
+    try:
+        for level in treeLevels(root):
+            with profiler.stage('alignProfiles'):
+                # the first child is the starting profile, a node with more children adds one per round
+                waiting = {id(node): node.children[1:] for node in level}
+                for node in level:
+                    profiles[id(node)] = profiles.pop(id(node.children[0]))
+                while any(waiting.values()):
+                    # batches of similar lengths pad less
+                    nodes = sorted((node for node in level if waiting[id(node)]),
+                                   key=lambda node: (profiles[id(node)][1].shape[1], profiles[id(waiting[id(node)][0])][1].shape[1]))
+                    children = [waiting[id(node)].pop(0) for node in nodes]
+                    pairs = [(profiles[id(node)][1], profiles[id(child)][1]) for node, child in zip(nodes, children)]
+                    batches = [pairs[batchStart:batchStart + batchSize] for batchStart in range(0, len(pairs), batchSize)]
+                    results = pool.map(align, batches, chunksize=1) if pool is not None and len(batches) > 1 else map(align, batches)
+                    for node, child, rows in zip(nodes, children, (rows for batch in results for rows in batch)):
+                        profiles[id(node)] = (profiles[id(node)][0] + profiles.pop(id(child))[0], rows)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    members, rows = profiles[id(root)]
+    aligned = [None] * len(unique)
+    for member, row in zip(members, rows):
+        aligned[member] = row.tobytes().decode('ascii')
+    return [aligned[owner] for owner in owners]
+
+
+def conservationLine(rows, protein=True):
+    '''
+    Return the Clustal conservation line of aligned rows: '*' for identical columns and, for
+    proteins, ':' and '.' for columns within a strong or weak residue group
+    '''
+    rows = np.array([np.frombuffer(row.upper().encode('ascii', 'replace'), dtype=np.uint8) for row in rows])
+    columns = rows.shape[1]
+    presence = np.zeros((columns, 256), dtype=bool)
+    presence[np.broadcast_to(np.arange(columns), rows.shape), rows] = True
+    line = np.full(columns, ord(' '), dtype=np.uint8)
+    if protein:
+        for groups, symbol in ((weakGroups, '.'), (strongGroups, ':')):
+            for group in groups:
+                outside = np.ones(256, dtype=bool)
+                outside[list(group.encode('ascii'))] = False
+                line[~presence[:, outside].any(axis=1)] = ord(symbol)
+    line[(presence.sum(axis=1) == 1) & ~presence[:, gap]] = ord('*')
+    return line.tobytes().decode('ascii')
+
+
+def writeClustal(names, rows, outFile=sys.stdout, protein=True, lineLength=60):
+    '''Write aligned rows in Clustal format, lineLength columns per block'''
+    outFile.write('CLUSTAL multiple sequence alignment (progressiveAligner.py)\n\n\n')
+    if not rows:
+        return
+    width = max(len(name) for name in names) + 6
+    conservation = conservationLine(rows, protein)
+    for blockStart in range(0, len(rows[0]), lineLength):
+        for name, row in zip(names, rows):
+            outFile.write(name.ljust(width) + row[blockStart:blockStart + lineLength] + '\n')
+        outFile.write(' ' * width + conservation[blockStart:blockStart + lineLength] + '\n\n')
+
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='progressiveAligner.py - multiple sequence alignment along a k-mer guide tree',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] <input >output'
+            )
+        self.parser.add_argument('-i', '--input', action='store', default='',
+                                 help='fasta file of the sequences to align (default stdin)')
+        self.parser.add_argument('-t', '--type', action='store', choices=['auto', 'protein', 'nucleotide'], default='auto',
+                                 help='sequence type, auto uses nucleotide scoring when every sequence is only ACGTUN')
+        self.parser.add_argument('-k', '--kmer', type=int, default=None, action='store',
+                                 help='k-mer length of the guide tree distances (default 3 protein, 6 nucleotide)')
+        self.parser.add_argument('-B', '--band', type=int, default=None, action='store',
+                                 help='band width of the profile alignments (default full matrices)')
+        self.parser.add_argument('-gO', '--gapOpen', type=int, default=None, action='store',
+                                 help='cost of the first gap residue (default 11 protein, 5 nucleotide)')
+        self.parser.add_argument('-gE', '--gapExtend', type=int, default=None, action='store',
+                                 help='cost of each following gap residue (default 1 protein, 2 nucleotide)')
+        self.parser.add_argument('-M', '--match', type=int, default=2, action='store',
+                                 help='nucleotide match score')
+        self.parser.add_argument('-X', '--mismatch', type=int, default=-3, action='store',
+                                 help='nucleotide mismatch score')
+        self.parser.add_argument('-s', '--batchSize', type=int, default=32, action='store',
+                                 help='number of profile pairs of a tree level aligned together')
+        self.parser.add_argument('-j', '--jobs', type=int, default=1, action='store',
+                                 help='number of worker processes aligning the profiles of a tree level')
+        self.parser.add_argument('-f', '--format', action='store', choices=['clustal', 'fasta'], default='clustal',
+                                 help='output format')
+        addProfileOption(self.parser)
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+
+def main(inCL=None):
+    '''
+    Align the records of a fasta file and write the alignment
+    '''
+    from sequenceAnalysis import FastAreader
+    myCommandLine = CommandLine(inCL)
+    args = myCommandLine.args
+    if args.profile:
+        profiler.enable('progressiveAligner.py')
+    with profiler.stage('readFasta'):
+        records = list(FastAreader(args.input).readFasta())
+    profiler.count('sequences', len(records))
+    names = [header.split()[0] if header.split() else 'sequence{}'.format(number + 1)
+             for number, (header, sequence) in enumerate(records)]
+    sequences = [sequence for header, sequence in records]
+    nucleotide = args.type == 'nucleotide' or (args.type == 'auto' and bool(sequences) and all(map(isNucleotide, sequences)))
+    if nucleotide:
+        options = dict(matrix=nucleotideMatrix(args.match, args.mismatch), codeTable=nucleotideCode, base=4,
+                       k=6 if args.kmer is None else args.kmer,
+                       gapOpen=5 if args.gapOpen is None else args.gapOpen,
+                       gapExtend=2 if args.gapExtend is None else args.gapExtend)
+    else:
+        options = dict(k=3 if args.kmer is None else args.kmer,
+                       gapOpen=11 if args.gapOpen is None else args.gapOpen,
+                       gapExtend=1 if args.gapExtend is None else args.gapExtend)
+    rows = progressiveAlignment(sequences, band=args.band, batchSize=args.batchSize, jobs=args.jobs, **options)
+    with profiler.stage('writeAlignment'):
+        if args.format == 'clustal':
+            writeClustal(names, rows, sys.stdout, not nucleotide)
+        else:
+            for name, row in zip(names, rows):
+                sys.stdout.write('>{}\n{}\n'.format(name, row))
+    profiler.writeReport(args.profile)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: proteinIndex.py
+#   Executable: python proteinIndex.py -b spikeSequences.fasta sars2ProteinSeq.fa -x coronaProteins
+#               python proteinIndex.py -x coronaProteins -q sars2FilProt.fa -n 3 > sars2Matches.tsv
+#
+#   Required module: numpy, substitutionMatrix, translationEngine, sequenceAnalysis
+#   Purpose: on-disk k-mer index of protein collections and seed-and-extend search, to find
+#            which known protein a new ORF resembles without aligning everything against
+#            everything. The library is stored as one concatenated residue array and an
+#            inverted list of k-mer (protein, position) postings in CSR layout, all memory-mapped,
+#            so a query gathers its seed hits with a few array lookups. Seeds are grouped by
+#            subject and diagonal, the diagonals with most seeds are extended together without
+#            gaps with BLOSUM62 and subjects are ranked by their best segment score.
+#   Condition(s): Nucleotide records (only ACGTUN) are translated with the standard code
+#                 before indexing or searching. Index files are <prefix>.names, .offsets.npy,
+#                 .residues.npy, .kmerStarts.npy, .kmerSubjects.npy and .kmerOffsets.npy.
+#                 Output positions are 1-based and inclusive.
+#
+#################################################################################################
+
+import sys
+
+import numpy as np
+
+from pipelineProfiler import profiler, addProfileOption
+from substitutionMatrix import aminoAcidCount, blosum62, encodeProtein, unknownCode
+
+nucleotides = frozenset('ACGTUN')
+
+
+def proteinSequence(sequence, engine=None):
+    '''Return a protein sequence, translating nucleotide sequences in the first frame'''
+    sequence = sequence.upper()
+    if sequence and set(sequence) <= nucleotides:
+        if engine is None:
+            from translationEngine import TranslationEngine
+            engine = TranslationEngine(1, '*')
+        return engine.translate(sequence)
+    return sequence
+
+
+def kmerCodes(codes, k, base=aminoAcidCount):
+    '''
+    Return (kmers, valid) for every position of an encoded sequence: the base 20 (or base)
+    number of the k residues starting there, and whether they are all below base, i.e.
+    standard amino acids (or ACGT with base 4 and nucleotide codes)
+    '''
+    count = len(codes) - k + 1
+    if count <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+    kmers = np.zeros(count, dtype=np.int64)
+    valid = np.ones(count, dtype=bool)
+    for offset in range(k):
+        residues = codes[offset:offset + count]
+        kmers = kmers * base + residues
+        valid &= residues < base
+    return kmers, valid
+
+
+def buildIndex(records, prefix, k=4):
+    '''
+    Write the index of (name, protein) records at prefix and return the number of proteins.
+    Proteins are separated by an X so no k-mer spans two of them.
+    '''
+    names, encoded = [], []
+    for name, sequence in records:
+        names.append(name)
+        encoded.append(encodeProtein(proteinSequence(sequence)))
+        encoded.append(np.array([unknownCode], dtype=np.uint8))
+    lengths = np.array([len(codes) for codes in encoded[0::2]], dtype=np.int64)
+    offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum(lengths + 1, out=offsets[1:])
+    residues = np.concatenate(encoded) if encoded else np.empty(0, dtype=np.uint8)
+
+    kmers, valid = kmerCodes(residues, k)
+    positions = np.flatnonzero(valid)
+    kmers = kmers[valid]
+    order = np.argsort(kmers, kind='stable')
+    positions = positions[order]
+    # postings hold the protein and the position in it, so queries need no offset lookup
+    subjects = np.searchsorted(offsets, positions, side='right') - 1
+    kmerStarts = np.zeros(aminoAcidCount ** k + 1, dtype=np.int64)
+    np.cumsum(np.bincount(kmers, minlength=aminoAcidCount ** k), out=kmerStarts[1:])
+
+    with open(prefix + '.names', 'w') as fileH:
+        for name in names:
+            fileH.write(name + '\n')
+    np.save(prefix + '.offsets.npy', offsets)
+    np.save(prefix + '.residues.npy', residues)
+    np.save(prefix + '.kmerStarts.npy', kmerStarts)
+    np.save(prefix + '.kmerSubjects.npy', subjects.astype(np.uint32))
+    np.save(prefix + '.kmerOffsets.npy', (positions - offsets[subjects]).astype(np.uint32))
+    return len(names)
+
+
+class ProteinIndex():
+    '''
+    Memory-mapped protein k-mer index with seed-and-extend search.
+
+    instantiation:
+    thisIndex = ProteinIndex('coronaProteins')
+    usage:
+    for subject, score, identity, qStart, qEnd, sStart, sEnd, seeds in thisIndex.search(protein):
+        ...
+    '''
+
+    def __init__(self, prefix):
+        '''contructor: maps the index files, k is read from the size of the k-mer table'''
+        self.prefix = prefix
+        with open(prefix + '.names') as fileH:
+            self.names = [line.rstrip('\n') for line in fileH]
+        self.offsets = np.load(prefix + '.offsets.npy')
+        self.residues = np.load(prefix + '.residues.npy', mmap_mode='r')
+        self.kmerStarts = np.load(prefix + '.kmerStarts.npy', mmap_mode='r')
+        self.kmerSubjects = np.load(prefix + '.kmerSubjects.npy', mmap_mode='r')
+        self.kmerOffsets = np.load(prefix + '.kmerOffsets.npy', mmap_mode='r')
+        self.k = int(round(np.log(len(self.kmerStarts) - 1) / np.log(aminoAcidCount)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def protein(self, subject):
+        '''Return the encoded residues of a library protein'''
+        return self.residues[self.offsets[subject]:self.offsets[subject + 1] - 1]
+
+    def seeds(self, query, maxKmerHits=10000):
+        '''
+        Return the (subject, diagonal, seeds) arrays of the diagonals holding k-mer hits of an
+        encoded query, diagonal being subject position - query position. K-mers found more
+        than maxKmerHits times in the library (low complexity) are not used as seeds.
+        '''
+        kmers, valid = kmerCodes(query, self.k)
+        queryPositions = np.flatnonzero(valid)
+        kmers = kmers[valid]
+        first = np.asarray(self.kmerStarts[kmers])
+        counts = np.asarray(self.kmerStarts[kmers + 1]) - first
+        counts[counts > maxKmerHits] = 0
+        total = int(counts.sum())
+        if total == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        # position of every hit in the inverted list, one run per query k-mer
+        owner = np.repeat(np.arange(len(kmers)), counts)
+        hits = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + first[owner]
+        subjects = np.asarray(self.kmerSubjects[hits]).astype(np.int64)
+        diagonals = np.asarray(self.kmerOffsets[hits]).astype(np.int64) - queryPositions[owner]
+        keys, seeds = np.unique(subjects * (1 << 32) + diagonals + (1 << 31), return_counts=True)
+        return keys >> 32, (keys & 0xffffffff) - (1 << 31), seeds
+
+    def extend(self, query, subjects, diagonals):
+        '''
+        Return (scores, identities, queryStarts, queryEnds, subjectStarts, subjectEnds) arrays
+        of the best ungapped BLOSUM62 segment of every (subject, diagonal), with 0-based
+        exclusive ends. The diagonals are laid out as the rows of one padded matrix.
+        '''
+        starts = self.offsets[subjects]
+        lengths = self.offsets[subjects + 1] - 1 - starts
+        queryStarts = np.maximum(0, -diagonals)
+        spans = np.minimum(len(query) - queryStarts, lengths - queryStarts - diagonals)
+        steps = np.arange(int(spans.max()))
+        inside = steps < spans[:, None]
+        queryResidues = query[np.minimum(queryStarts[:, None] + steps, len(query) - 1)]
+        targetResidues = np.asarray(self.residues[np.where(inside, (starts + queryStarts + diagonals)[:, None] + steps, 0)])
+        # padding scores are low enough that no segment reaches into them
+        scores = np.where(inside, blosum62[queryResidues, targetResidues], -(1 << 20)).astype(np.int64)
+        cumulative = np.zeros((len(subjects), len(steps) + 1), dtype=np.int64)
+        np.cumsum(scores, axis=1, out=cumulative[:, 1:])
+        # best segment: largest rise of the cumulative score over its running minimum
+        gains = cumulative[:, 1:] - np.minimum.accumulate(cumulative, axis=1)[:, :-1]
+        ends = np.argmax(gains, axis=1) + 1
+        rows = np.arange(len(subjects))
+        segmentScores = gains[rows, ends - 1]
+        columns = np.arange(len(steps) + 1)
+        begins = np.argmin(np.where(columns < ends[:, None], cumulative, np.iinfo(np.int64).max), axis=1)
+        matches = np.zeros_like(cumulative)
+        np.cumsum(inside & (queryResidues == targetResidues), axis=1, out=matches[:, 1:])
+        identities = (matches[rows, ends] - matches[rows, begins]) / (ends - begins)
+        return segmentScores, identities, queryStarts + begins, queryStarts + ends, \
+            queryStarts + diagonals + begins, queryStarts + diagonals + ends
+
+    def search(self, query, hits=5, candidates=64, minScore=0, maxKmerHits=10000):
+        '''
+        Return the best hits of a protein (str or encoded) as (subject name, score, identity,
+        queryStart, queryEnd, subjectStart, subjectEnd, seeds) tuples, best score first.
+        The candidates diagonals with most seeds are extended, the best one per subject kept.
+        '''
+        query = encodeProtein(query)
+        with profiler.stage('seeds'):
+            subjects, diagonals, seeds = self.seeds(query, maxKmerHits)
+        if len(seeds) == 0:
+            return []
+        if len(seeds) > candidates:
+            chosen = np.argpartition(-seeds, candidates - 1)[:candidates]
+            subjects, diagonals, seeds = subjects[chosen], diagonals[chosen], seeds[chosen]
+        with profiler.stage('extend'):
+            scores, identities, queryStarts, queryEnds, subjectStarts, subjectEnds = self.extend(query, subjects, diagonals)
+        # best diagonal of every subject, subjects ranked by score
+        order = np.lexsort((subjects, -scores))
+        order = order[scores[order] >= minScore]
+        _, first = np.unique(subjects[order], return_index=True)
+        order = order[np.sort(first)][:hits]
+        return [(self.names[subject], score, identity, queryStart, queryEnd, subjectStart, subjectEnd, seedCount)
+                for subject, score, identity, queryStart, queryEnd, subjectStart, subjectEnd, seedCount
+                in zip(subjects[order].tolist(), scores[order].tolist(), identities[order].tolist(),
+                       queryStarts[order].tolist(), queryEnds[order].tolist(), subjectStarts[order].tolist(),
+                       subjectEnds[order].tolist(), seeds[order].tolist())]
+
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='proteinIndex.py - builds a protein k-mer index and finds the closest library proteins of queries',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] <input >output'
+            )
+        self.parser.add_argument('-x', '--index', action='store', default='proteinIndex',
+                                 help='index file prefix')
+        self.parser.add_argument('-b', '--build', action='store', nargs='+', default=[],
+                                 help='protein (or ORF nucleotide) fasta files to index')
+        self.parser.add_argument('-k', '--kmer', type=int, choices=range(2, 7), default=4, action='store',
+                                 help='k-mer length of a new index')
+        self.parser.add_argument('-q', '--query', action='store', default=None,
+                                 help='query fasta file (default stdin when no index is built)')
+        self.parser.add_argument('-n', '--hits', type=int, default=5, action='store',
+                                 help='number of hits reported per query')
+        self.parser.add_argument('-c', '--candidates', type=int, default=64, action='store',
+                                 help='number of seeded diagonals extended per query')
+        self.parser.add_argument('-mS', '--minScore', type=int, default=30, action='store',
+                                 help='minimum BLOSUM62 segment score of a hit')
+        addProfileOption(self.parser)
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+
+def main(inCL=None):
+    '''
+    Build an index and/or search it with the records of a fasta file
+    '''
+    from sequenceAnalysis import FastAreader
+    myCommandLine = CommandLine(inCL)
+    args = myCommandLine.args
+    if args.profile:
+        profiler.enable('proteinIndex.py')
+    if args.build:
+        records = (record for fname in args.build for record in FastAreader(fname).readFasta())
+        with profiler.stage('buildIndex'):
+            profiler.count('proteins', buildIndex(profiler.iterate('readFasta', records, countRecords=True),
+                                                  args.index, args.kmer))
+    if args.query is not None or not args.build:
+        with profiler.stage('loadIndex'):
+            index = ProteinIndex(args.index)
+        sys.stdout.write('query\tsubject\tscore\tidentity\tqueryStart\tqueryEnd\tsubjectStart\tsubjectEnd\tseeds\n')
+        for header, sequence in profiler.iterate('readFasta', FastAreader(args.query or '').readFasta(), countRecords=True):
+            matches = index.search(proteinSequence(sequence), args.hits, args.candidates, args.minScore)
+            profiler.count('hits', len(matches))
+            with profiler.stage('writeHits'):
+                for subject, score, identity, queryStart, queryEnd, subjectStart, subjectEnd, seeds in matches:
+                    sys.stdout.write('{}\t{}\t{}\t{:.1f}\t{}\t{}\t{}\t{}\t{}\n'.format(
+                        header, subject, score, 100 * identity, queryStart + 1, queryEnd, subjectStart + 1, subjectEnd, seeds))
+    profiler.writeReport(args.profile)
+
+if __name__ == "__main__":
+    main()
@@ -10,64 +10,24 @@
 #				python seqTranslator.py < sars4231FilProt.fa > sars4231ProteinSeq.fa
 #				python seqTranslator.py < sarsG13FilProt.fa > sarsG13ProteinSeq.fa
 #				python seqTranslator.py < cvUrbaniFilProt.fa > coronavirusUProteinSeq.fa
+#	Six-frame execution: python seqTranslator.py --six-frame < SARSCoV2.fa > sars2SixFrame.fa
 #
-#	Required module: FastAreader
+#	Required module: FastAreader, translationEngine, pipelineProfiler, orfCache
 #	Purpose: translate multiple RNA and DNA sequences to single letter amino acid sequences
-#	Condition(s): None
+#	Condition(s): NCBI genetic codes are chosen with -t, codons with N or ambiguity codes translate to X.
+#				  Proteins are only cached with --cacheTranslations, in ~/.cache/sars2ORFs/orfCache.sqlite
+#				  unless --cache or ORF_CACHE gives another file
 #
 ##################################################################################################
 
 '''
-In this class, we define objects to read FastaA files inside the sequenceAnalysis program.
+FastA files are read with the FastAreader class of the shared sequenceAnalysis module.
 '''
-
 import sys
-class FastAreader :
-    ''' 
-    Define objects to read FastA files.
-    
-    instantiation: 
-    thisReader = FastAreader ('testTiny.fa')
-    usage:
-    for head, seq in thisReader.readFasta():
-        print (head,seq)
-    '''
-    def __init__ (self, fname=''):
-        '''contructor: saves attribute fname '''
-        self.fname = fname
-           
-    def doOpen (self):
-        ''' Handle file opens, allowing STDIN.'''
-        if self.fname is '':
-            return sys.stdin
-        else:
-            return open(self.fname)
-        
-    def readFasta (self):
-        ''' Read an entire FastA record and return the sequence header/sequence'''
-        header = ''
-        sequence = ''
-        
-        with self.doOpen() as fileH:
-
-            header = ''
-            sequence = ''
-            
-            # skip to first fasta header
-            line = fileH.readline()
-            while not line.startswith('>') :
-                line = fileH.readline()
-            header = line[1:].rstrip()
-
-            for line in fileH:
-                if line.startswith ('>'):
-                    yield header,sequence
-                    header = line[1:].rstrip()
-                    sequence = ''
-                else :
-                    sequence += ''.join(line.rstrip().split()).upper()
-
-        yield header,sequence
+import orfCache
+from sequenceAnalysis import FastAreader
+from translationEngine import TranslationEngine
+from pipelineProfiler import profiler, addProfileOption
 
 """
 Class translated RNA and DNA to protein sequence
@@ -110,70 +70,113 @@ class translateSeq:
 		else:
 			return False 
 
-	def translateCodon(codon):
-		"""Translate a codon into a single letter amino acid"""
-
-		rnaCodonTable = {
-        	# Second Base
-        	# U             C             A             G
-        	# U
-        	'UUU': 'F', 'UCU': 'S', 'UAU': 'Y', 'UGU': 'C',
-        	'UUC': 'F', 'UCC': 'S', 'UAC': 'Y', 'UGC': 'C',
-        	'UUA': 'L', 'UCA': 'S', 'UAA': '-', 'UGA': '-',
-        	'UUG': 'L', 'UCG': 'S', 'UAG': '-', 'UGG': 'W',
-        	# C
-        	'CUU': 'L', 'CCU': 'P', 'CAU': 'H', 'CGU': 'R',
-        	'CUC': 'L', 'CCC': 'P', 'CAC': 'H', 'CGC': 'R',
-        	'CUA': 'L', 'CCA': 'P', 'CAA': 'Q', 'CGA': 'R',
-        	'CUG': 'L', 'CCG': 'P', 'CAG': 'Q', 'CGG': 'R',
-        	# A
-        	'AUU': 'I', 'ACU': 'T', 'AAU': 'N', 'AGU': 'S',
-        	'AUC': 'I', 'ACC': 'T', 'AAC': 'N', 'AGC': 'S',
-        	'AUA': 'I', 'ACA': 'T', 'AAA': 'K', 'AGA': 'R',
-        	'AUG': 'M', 'ACG': 'T', 'AAG': 'K', 'AGG': 'R',
-        	# G
-        	'GUU': 'V', 'GCU': 'A', 'GAU': 'D', 'GGU': 'G',
-        	'GUC': 'V', 'GCC': 'A', 'GAC': 'D', 'GGC': 'G',
-        	'GUA': 'V', 'GCA': 'A', 'GAA': 'E', 'GGA': 'G',
-        	'GUG': 'V', 'GCG': 'A', 'GAG': 'E', 'GGG': 'G'
-    		}
-
-    	# converts RNA codon table to DNA codon table
-		dnaCodonTable = {key.replace('U', 'T'): value for key, value in rnaCodonTable.items()}
-
-		# stores dictionaries 
-		context = dict(rnaCodonTable.items() | dnaCodonTable.items()) 
-   		
-   		# if codon is found in dictionary return it
-		if codon in context:
-			return context[codon]
-		else:
-			return None
-
-	def translator(dnaSequence, start = 0):
+	def translateCodon(codon, table=1):
+		"""Translate a codon into a single letter amino acid, stops are '-' and ambiguous codons 'X'"""
+		return translateSeq.getEngine(table).translateCodon(codon.upper())
+
+	engines = {} # precompiled translation engines by NCBI genetic code
+
+	def cachedTranslation(engine, sequence, start=0):
+		"""Translate a sequence with an engine, reading and storing proteins in the cache when translations are cached"""
+		cache = orfCache.translationCache()
+		if cache is None:
+			return engine.translate(sequence, start)
+		key = cache.key('protein', sequence, table=engine.table, start=start, stopSymbol=engine.stopSymbol, unknown=engine.unknown)
+		protein = cache.getText(key)
+		if protein is None:
+			protein = engine.translate(sequence, start)
+			cache.putText(key, protein)
+		return protein
+
+	def getEngine(table=1):
+		"""Return the precompiled translation engine of an NCBI genetic code"""
+		if table not in translateSeq.engines:
+			translateSeq.engines[table] = TranslationEngine(table, stopSymbol='-')
+		return translateSeq.engines[table]
+
+	def translator(dnaSequence=None, start=0, table=1):
 		"""Translate a DNA sequence into amino acid sequence (protein).
 		Return a putative protein sequence"""
 		
+		engine = translateSeq.getEngine(table)
 		fastaFile = FastAreader()
-		dnaSequence = fastaFile.readFasta()
-		for header, sequence in fastaFile.readFasta():
+		for header, sequence in profiler.iterate('readFasta', fastaFile.readFasta(), countRecords=True):
 			cleanSeq = sequence.replace("None", "")
-			# validate incoming sequence
-			assert translateSeq.validateDNA(cleanSeq), """Invalid DNA sequence"""
 			print(">{}".format(header))
-			aaSeq = " " 
-			# translate valid sequences only
-			for position in range(start, len(cleanSeq)-2, 3):
-				codon = cleanSeq[position: position + 3]
-				protein = translateSeq.translateCodon(codon)
-				aaSeq += protein
-			
-			print(aaSeq.replace("-", "") + "\n")
-			
-def main():
+			# translate the whole sequence at once, ambiguous codons become X
+			with profiler.stage('translate'):
+				aaSeq = translateSeq.cachedTranslation(engine, cleanSeq, start)
+			profiler.count('aminoAcids', len(aaSeq))
+			with profiler.stage('writeFasta'):
+				print(aaSeq.replace("-", "") + "\n")
+
+	def cachedFrames(engine, sequence):
+		"""Translate the six frames of a sequence, reading and storing them in the cache when translations are cached"""
+		cache = orfCache.translationCache()
+		if cache is None:
+			return engine.translateFrames(sequence)
+		key = cache.key('sixFrame', sequence, table=engine.table, stopSymbol=engine.stopSymbol, unknown=engine.unknown)
+		proteins = cache.getText(key)
+		if proteins is not None:
+			return list(zip((1, 2, 3, -1, -2, -3), proteins.split('\n')))
+		frames = engine.translateFrames(sequence)
+		cache.putText(key, '\n'.join(aaSeq for frame, aaSeq in frames))
+		return frames
+
+	def sixFrameTranslator(table=1, outFile=sys.stdout):
+		"""Translate the six frames of every record in one pass and stream them as fasta.
+		Headers are tagged with the frame, stops are kept as '-' so frames stay aligned"""
+
+		engine = translateSeq.getEngine(table)
+		fastaFile = FastAreader()
+		for header, sequence in profiler.iterate('readFasta', fastaFile.readFasta(), countRecords=True):
+			cleanSeq = sequence.replace("None", "")
+			with profiler.stage('translate'):
+				frames = translateSeq.cachedFrames(engine, cleanSeq)
+			with profiler.stage('writeFasta'):
+				for frame, aaSeq in frames:
+					outFile.write(">{} frame {:+d}\n{}\n".format(header, frame, aaSeq))
+
+class CommandLine():
+	"""
+	Handle the command line, usage and help requests.
+	All arguments received from the commandline using .add_argument will be
+	avalable within the .args attribute of object instantiated from CommandLine.
+	"""
+
+	def __init__(self, inOpts=None):
+		"""Implements a parser to interpret the command line argv string using argparse."""
+		import argparse
+		self.parser = argparse.ArgumentParser(
+			description='seqTranslator.py - translates DNA and RNA fasta sequences to proteins',
+			add_help=True,  # default is True
+			prefix_chars='-',
+			usage='%(prog)s [options] -option1[default] <input >output'
+			)
+		self.parser.add_argument('-t', '--table', type=int, default=1, action='store',
+								 help='NCBI genetic code used for translation')
+		self.parser.add_argument('-f', '--frame', type=int, choices=range(0, 3), default=0, action='store',
+								 help='offset of the first codon')
+		self.parser.add_argument('-6', '--six-frame', dest='sixFrame', action='store_true', default=False,
+								 help='translate the three forward and three reverse frames of every record')
+		addProfileOption(self.parser)
+		orfCache.addCacheOptions(self.parser, translations=True)
+		if inOpts is None:
+			self.args = self.parser.parse_args()
+		else:
+			self.args = self.parser.parse_args(inOpts)
+
+def main(inCL=None):
 	"""Call functions and return putative proteins from ORFs"""
-	aminoSeq = translateSeq()
-	print(aminoSeq.translator())
+	myCommandLine = CommandLine(inCL)
+	if myCommandLine.args.profile:
+		profiler.enable('seqTranslator.py')
+	orfCache.configureFromArgs(myCommandLine.args)
+	if myCommandLine.args.sixFrame:
+		translateSeq.sixFrameTranslator(table=myCommandLine.args.table)
+	else:
+		translateSeq.translator(start=myCommandLine.args.frame, table=myCommandLine.args.table)
+	profiler.writeReport(myCommandLine.args.profile)
 
 if __name__ == "__main__":
     main()
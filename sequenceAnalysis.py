@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: sequenceAnalysis.py
+#   Required module: bgzfReader
+#   Purpose: shared FastA readers used by every script of the project. FastAreader reads
+#            records sequentially from a file or stdin, FastAindex builds a samtools faidx
+#            compatible .fai index and memory-maps the file to return a record or a
+#            chrom:start-end slice without reading the rest of the file. Both read gzip and
+#            bgzip compressed files: FastAreader inflates BGZF blocks in parallel and
+#            FastAindex reads bgzip files through their .gzi block index.
+#   Condition(s): Regions use the same coordinates as the ORF headers written by fastaFinder.py
+#                 (bedtools style: 0-based start, exclusive end), e.g. NC_045512.2:266-13483
+#
+#################################################################################################
+
+import io
+import mmap
+import os
+
+import bgzfReader
+
+'''
+In this class, we define objects to read FastaA files inside the sequenceAnalysis program.
+'''
+class FastAreader:
+    '''
+    Define objects to read FastA files.
+
+    instantiation:
+    thisReader = FastAreader ('testTiny.fa')
+    usage:
+    for head, seq in thisReader.readFasta():
+        print (head,seq)
+    '''
+    def __init__ (self, fname='', threads=bgzfReader.defaultThreads):
+        '''contructor: saves attribute fname and the number of BGZF decompression threads'''
+        self.fname = fname
+        self.threads = threads
+
+    def doOpen (self):
+        ''' Handle file opens, allowing STDIN and gzip or bgzip compressed input.'''
+        return bgzfReader.openText(self.fname, self.threads)
+
+    def readFasta (self):
+        ''' Read an entire FastA record and return the sequence header/sequence'''
+        header = ''
+        sequence = []
+
+        with self.doOpen() as fileH:
+
+            # skip to first fasta header
+            line = fileH.readline()
+            while line and not line.startswith('>') :
+                line = fileH.readline()
+            if not line:
+                return
+            header = line[1:].rstrip()
+
+            for line in fileH:
+                if line.startswith ('>'):
+                    yield header, ''.join(sequence)
+                    header = line[1:].rstrip()
+                    sequence = []
+                else :
+                    # collect the lines and join them once per record
+                    sequence.append(''.join(line.split()).upper())
+
+        yield header, ''.join(sequence)
+
+'''
+In this class, we index FastA files and read records or regions from them in constant time.
+'''
+class FastAindex:
+    '''
+    Index a FastA file the way samtools faidx does and read records or slices through a
+    memory map. The index is saved next to the file as <fname>.fai with the columns
+    name, length, offset, linebases and linewidth, and is reused while it is newer than
+    the FastA file. A bgzip compressed file is indexed in uncompressed offsets, as samtools
+    does, and read through its .gzi block index instead of a memory map.
+
+    instantiation:
+    thisIndex = FastAindex('SARSCoV2.fa')
+    usage:
+    seq = thisIndex.fetch('NC_045512.2', 265, 13483)
+    seq = thisIndex.fetchRegion('NC_045512.2:265-13483')
+    '''
+    def __init__(self, fname, indexName=None):
+        '''contructor: saves the file names and loads or builds the index'''
+        self.fname = fname
+        self.indexName = indexName if indexName is not None else fname + '.fai'
+        self.index = {} # name -> (length, offset, linebases, linewidth)
+        self.fileH = None
+        self.data = None
+        self.compression = bgzfReader.fileCompression(fname)
+        if self.compression == 'gzip':
+            raise ValueError('{} is gzip compressed, compress it with bgzip to index it'.format(fname))
+        if self.isIndexCurrent():
+            self.loadIndex()
+        else:
+            self.buildIndex()
+            self.saveIndex()
+
+    def isIndexCurrent(self):
+        '''Return True if an index file exists and is not older than the FastA file'''
+        return os.path.exists(self.indexName) and os.path.getmtime(self.indexName) >= os.path.getmtime(self.fname)
+
+    def buildIndex(self):
+        '''
+        Scan the file once and record, for every record, its length, the byte offset of its
+        first base and its line layout. All lines but the last of a record must have the same
+        length, as required by the .fai format. The last line of the file may end without a
+        newline.
+        '''
+        self.index = {}
+        name = None
+        length = offset = lineBases = lineWidth = 0
+        lastLine = False # True once a short line was seen in the current record
+        position = 0
+        with self.openLines() as fileH:
+            for line in fileH:
+                lineStart = position
+                position += len(line)
+                if line.startswith(b'>'):
+                    if name is not None:
+                        self.index[name] = (length, offset, lineBases, lineWidth)
+                    fields = line[1:].split()
+                    name = fields[0].decode() if fields else ''
+                    length = lineBases = lineWidth = 0
+                    offset = position
+                    lastLine = False
+                    continue
+                if name is None:
+                    continue
+                bases = len(line.rstrip(b'\r\n'))
+                if bases == 0:
+                    lastLine = True
+                    continue
+                # only the last line of the file can end without a newline
+                ended = line.endswith(b'\n')
+                if lineBases == 0:
+                    lineBases, lineWidth = bases, len(line) if ended else bases + 1
+                elif lastLine or bases > lineBases or (bases == lineBases and ended and len(line) != lineWidth):
+                    raise ValueError('Different line length in record {} of {} at byte {}'.format(name, self.fname, lineStart))
+                if bases < lineBases:
+                    lastLine = True
+                length += bases
+        if name is not None:
+            self.index[name] = (length, offset, lineBases, lineWidth)
+        return self.index
+
+    def openLines(self):
+        '''Return a binary file object of the uncompressed FastA file'''
+        if self.compression == 'bgzf':
+            return io.BufferedReader(bgzfReader.BGZFstream(open(self.fname, 'rb')), buffer_size=bgzfReader.blockSize)
+        return open(self.fname, 'rb')
+
+    def saveIndex(self):
+        '''Write the index in samtools .fai format'''
+        with open(self.indexName, 'w') as fileH:
+            for name, (length, offset, lineBases, lineWidth) in self.index.items():
+                fileH.write('{}\t{}\t{}\t{}\t{}\n'.format(name, length, offset, lineBases, lineWidth))
+
+    def loadIndex(self):
+        '''Read a samtools .fai index'''
+        self.index = {}
+        with open(self.indexName) as fileH:
+            for line in fileH:
+                columns = line.rstrip('\n').split('\t')
+                if len(columns) >= 5:
+                    self.index[columns[0]] = tuple(int(column) for column in columns[1:5])
+        return self.index
+
+    def doOpen(self):
+        '''Memory-map the FastA file on first use, bgzip files are read by block'''
+        if self.data is None and self.compression == 'bgzf':
+            self.data = bgzfReader.BGZFreader(self.fname)
+        elif self.data is None:
+            self.fileH = open(self.fname, 'rb')
+            if os.path.getsize(self.fname) == 0:
+                self.data = b''
+            else:
+                self.data = mmap.mmap(self.fileH.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.data
+
+    def close(self):
+        '''Release the memory map and the file handle'''
+        if self.data is not None and not isinstance(self.data, bytes):
+            self.data.close()
+        if self.fileH is not None:
+            self.fileH.close()
+        self.data = self.fileH = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def names(self):
+        '''Return the record names in file order'''
+        return list(self.index)
+
+    def length(self, name):
+        '''Return the length of a record'''
+        return self.index[name][0]
+
+    def fetch(self, name, start=0, end=None):
+        '''
+        Return the sequence of a record between start (0-based) and end (exclusive).
+        Only the bytes holding the slice are read from the memory map.
+        '''
+        length, offset, lineBases, lineWidth = self.index[name]
+        end = length if end is None else min(end, length)
+        start = max(start, 0)
+        if start >= end:
+            return ''
+        data = self.doOpen()
+        # byte positions of the first base and of the byte after the last base
+        firstByte = offset + (start // lineBases) * lineWidth + start % lineBases
+        lastByte = offset + ((end - 1) // lineBases) * lineWidth + (end - 1) % lineBases + 1
+        chunk = data[firstByte:lastByte]
+        if lineWidth != lineBases:
+            chunk = chunk.replace(b'\n', b'').replace(b'\r', b'')
+        return chunk.decode().upper()
+
+    def fetchRegion(self, region):
+        '''
+        Return the sequence of a region given as name, name:start-end or name:start-
+        using the bedtools coordinates of the ORF headers (0-based start, exclusive end).
+        '''
+        if region in self.index:
+            return self.fetch(region)
+        name, _, interval = region.rpartition(':')
+        start, _, end = interval.partition('-')
+        return self.fetch(name, int(start.replace(',', '')), int(end.replace(',', '')) if end else None)
+
+    def readFasta(self):
+        '''Yield the header/sequence of every record, like FastAreader.readFasta'''
+        for name in self.index:
+            yield name, self.fetch(name)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: substitutionMatrix.py
+#   Required module: numpy
+#   Purpose: BLOSUM62 and nucleotide substitution scores with the sequence encodings shared
+#            by the protein k-mer index and the aligners. Residues are encoded once into uint8
+#            codes so a score lookup is a NumPy fancy index, blosum62[codes1, codes2], for a
+#            whole row, diagonal or batch at a time.
+#   Condition(s): Protein codes follow the NCBI matrix order ARNDCQEGHILKMFPSTWYVBZX*, any
+#                 other character (U, O, J, '-', ...) is encoded as X. Nucleotide codes are
+#                 ACGTN, U is encoded as T and any other character as N. Lower case letters
+#                 are encoded as upper case.
+#
+#################################################################################################
+
+import numpy as np
+
+blosum62Text = '''
+   A  R  N  D  C  Q  E  G  H  I  L  K  M  F  P  S  T  W  Y  V  B  Z  X  *
+A  4 -1 -2 -2  0 -1 -1  0 -2 -1 -1 -1 -1 -2 -1  1  0 -3 -2  0 -2 -1  0 -4
+R -1  5  0 -2 -3  1  0 -2  0 -3 -2  2 -1 -3 -2 -1 -1 -3 -2 -3 -1  0 -1 -4
+N -2  0  6  1 -3  0  0  0  1 -3 -3  0 -2 -3 -2  1  0 -4 -2 -3  3  0 -1 -4
+D -2 -2  1  6 -3  0  2 -1 -1 -3 -4 -1 -3 -3 -1  0 -1 -4 -3 -3  4  1 -1 -4
+C  0 -3 -3 -3  9 -3 -4 -3 -3 -1 -1 -3 -1 -2 -3 -1 -1 -2 -2 -1 -3 -3 -2 -4
+Q -1  1  0  0 -3  5  2 -2  0 -3 -2  1  0 -3 -1  0 -1 -2 -1 -2  0  3 -1 -4
+E -1  0  0  2 -4  2  5 -2  0 -3 -3  1 -2 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+G  0 -2  0 -1 -3 -2 -2  6 -2 -4 -4 -2 -3 -3 -2  0 -2 -2 -3 -3 -1 -2 -1 -4
+H -2  0  1 -1 -3  0  0 -2  8 -3 -3 -1 -2 -1 -2 -1 -2 -2  2 -3  0  0 -1 -4
+I -1 -3 -3 -3 -1 -3 -3 -4 -3  4  2 -3  1  0 -3 -2 -1 -3 -1  3 -3 -3 -1 -4
+L -1 -2 -3 -4 -1 -2 -3 -4 -3  2  4 -2  2  0 -3 -2 -1 -2 -1  1 -4 -3 -1 -4
+K -1  2  0 -1 -3  1  1 -2 -1 -3 -2  5 -1 -3 -1  0 -1 -3 -2 -2  0  1 -1 -4
+M -1 -1 -2 -3 -1  0 -2 -3 -2  1  2 -1  5  0 -2 -1 -1 -1 -1  1 -3 -1 -1 -4
+F -2 -3 -3 -3 -2 -3 -3 -3 -1  0  0 -3  0  6 -4 -2 -2  1  3 -1 -3 -3 -1 -4
+P -1 -2 -2 -1 -3 -1 -1 -2 -2 -3 -3 -1 -2 -4  7 -1 -1 -4 -3 -2 -2 -1 -2 -4
+S  1 -1  1  0 -1  0  0  0 -1 -2 -2  0 -1 -2 -1  4  1 -3 -2 -2  0  0  0 -4
+T  0 -1  0 -1 -1 -1 -1 -2 -2 -1 -1 -1 -1 -2 -1  1  5 -2 -2  0 -1 -1  0 -4
+W -3 -3 -4 -4 -2 -2 -3 -2 -2 -3 -2 -3 -1  1 -4 -3 -2 11  2 -3 -4 -3 -2 -4
+Y -2 -2 -2 -3 -2 -1 -2 -3  2 -1 -1 -2 -1  3 -3 -2 -2  2  7 -1 -3 -2 -1 -4
+V  0 -3 -3 -3 -1 -2 -2 -3 -3  3  1 -2  1 -1 -2 -2  0 -3 -1  4 -3 -2 -1 -4
+B -2 -1  3  4 -3  0  1 -1  0 -3 -4  0 -3 -3 -2  0 -1 -4 -3 -3  4  1 -1 -4
+Z -1  0  0  1 -3  3  4 -2  0 -3 -3  1 -1 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+X  0 -1 -1 -1 -2 -1 -1 -1 -1 -1 -1 -1 -1 -1 -2  0  0 -2 -1 -1 -1 -1 -1 -4
+* -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4  1
+'''
+
+
+def parseMatrix(text):
+    '''Return the alphabet and the int16 score matrix of an NCBI format substitution matrix'''
+    lines = [line.split() for line in text.strip('\n').split('\n') if line.strip() and not line.startswith('#')]
+    alphabet = ''.join(lines[0])
+    matrix = np.array([[int(score) for score in line[1:]] for line in lines[1:]], dtype=np.int16)
+    return alphabet, matrix
+
+
+alphabet, blosum62 = parseMatrix(blosum62Text)
+# number of standard amino acids, the first codes of the alphabet
+aminoAcidCount = 20
+unknownCode = alphabet.index('X')
+
+# residue code table, anything outside the alphabet is X
+proteinCode = np.full(256, unknownCode, dtype=np.uint8)
+for code, residue in enumerate(alphabet):
+    proteinCode[ord(residue)] = code
+    proteinCode[ord(residue.lower())] = code
+
+
+def encodeProtein(sequence):
+    '''Encode a protein string (or bytes) into a uint8 array of matrix codes'''
+    if isinstance(sequence, np.ndarray):
+        return sequence
+    if isinstance(sequence, str):
+        sequence = sequence.encode('ascii', 'replace')
+    return proteinCode[np.frombuffer(sequence, dtype=np.uint8)]
+
+
+def decodeProtein(codes):
+    '''Return the string of an encoded protein'''
+    return np.frombuffer(alphabet.encode('ascii'), dtype=np.uint8)[codes].tobytes().decode('ascii')
+
+
+nucleotideAlphabet = 'ACGTN'
+nucleotideCode = np.full(256, nucleotideAlphabet.index('N'), dtype=np.uint8)
+for code, base in enumerate(nucleotideAlphabet):
+    nucleotideCode[ord(base)] = code
+    nucleotideCode[ord(base.lower())] = code
+nucleotideCode[ord('U')] = nucleotideCode[ord('u')] = nucleotideAlphabet.index('T')
+
+
+def nucleotideMatrix(match=2, mismatch=-3):
+    '''Return the int16 score matrix of the nucleotide codes, N scoring 0 against anything'''
+    matrix = np.where(np.eye(len(nucleotideAlphabet), dtype=bool), match, mismatch).astype(np.int16)
+    matrix[-1, :] = matrix[:, -1] = 0
+    return matrix
+
+
+def encodeNucleotide(sequence):
+    '''Encode a nucleotide string (or bytes) into a uint8 array of ACGTN codes'''
+    if isinstance(sequence, np.ndarray):
+        return sequence
+    if isinstance(sequence, str):
+        sequence = sequence.encode('ascii', 'replace')
+    return nucleotideCode[np.frombuffer(sequence, dtype=np.uint8)]
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+#################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: syntheticGenomes.py
+#   Executable: python syntheticGenomes.py -l 29903 > synthetic.fa
+#               python syntheticGenomes.py -l 29903 -n 100000 -d 0.001 > syntheticCohort.fa
+#
+#   Required module: numpy
+#   Purpose: seeded synthetic genomes and cohorts for benchmarking the pipeline scripts. A
+#            genome is drawn with a SARS-CoV-2 like base composition and planted ORFs, and a
+#            cohort is a set of mutated copies of it (substitutions, short insertions and
+#            deletions), from one 30 kb record up to multi-MB records or 100k records.
+#   Condition(s): The same seed always gives the same sequences, so results of different
+#                 commits are measured on identical inputs.
+#
+#################################################################################################
+
+import sys
+
+import numpy as np
+
+bases = np.frombuffer(b'ACGT', dtype=np.uint8)
+# base composition of NC_045512.2 (A, C, G, T)
+sarsComposition = (0.299, 0.184, 0.196, 0.321)
+startCodon = np.frombuffer(b'ATG', dtype=np.uint8)
+stopCodons = [np.frombuffer(codon, dtype=np.uint8) for codon in (b'TAA', b'TAG', b'TGA')]
+
+
+def randomGenome(length, seed=0, composition=sarsComposition, orfCount=None, orfLength=(300, 4000)):
+    '''
+    Return a random genome of the given length as a string. orfCount ORFs (one every 3 kb
+    by default) of orfLength bases are planted on both strands, so ORF finding, naming and
+    translation see realistic work.
+    '''
+    rng = np.random.default_rng(seed)
+    genome = rng.choice(bases, size=length, p=composition)
+    orfCount = length // 3000 if orfCount is None else orfCount
+    for _ in range(orfCount):
+        codons = int(rng.integers(orfLength[0], orfLength[1])) // 3
+        size = 3 * (codons + 2)
+        if size >= length:
+            continue
+        start = int(rng.integers(0, length - size))
+        body = rng.choice(bases, size=(codons, 3), p=composition)
+        # remove in-frame stops from the body of the ORF
+        for stop in stopCodons:
+            isStop = (body == stop).all(axis=1)
+            body[isStop, 2] = ord('C')
+        orf = np.concatenate((startCodon, body.ravel(), stopCodons[int(rng.integers(0, 3))]))
+        if rng.random() < 0.5:
+            orf = reverseComplement(orf)
+        genome[start:start + size] = orf
+    return genome.tobytes().decode('ascii')
+
+
+def reverseComplement(codes):
+    '''Return the reverse complement of an uint8 ACGT array'''
+    table = np.arange(256, dtype=np.uint8)
+    table[list(b'ACGT')] = list(b'TGCA')
+    return table[codes[::-1]]
+
+
+def mutateGenome(genome, rng, substitutionRate=0.001, indelRate=0.0001, maxIndel=9):
+    '''
+    Return a mutated copy of a genome string: substitutions at substitutionRate and
+    insertions or deletions of 1 to maxIndel bases at indelRate per base.
+    '''
+    codes = np.frombuffer(genome.encode('ascii'), dtype=np.uint8).copy()
+    length = len(codes)
+    positions = np.flatnonzero(rng.random(length) < substitutionRate)
+    # shift every chosen base to one of the three other bases
+    shifts = rng.integers(1, 4, size=len(positions))
+    indices = np.searchsorted(bases, codes[positions])
+    codes[positions] = bases[(indices + shifts) % 4]
+    indels = np.sort(rng.choice(length, size=rng.binomial(length, indelRate), replace=False))
+    if not len(indels):
+        return codes.tobytes().decode('ascii')
+    pieces = []
+    previous = 0
+    for position in indels:
+        if position < previous:
+            continue
+        size = int(rng.integers(1, maxIndel + 1))
+        pieces.append(codes[previous:position])
+        if rng.random() < 0.5:
+            pieces.append(rng.choice(bases, size=size))
+            previous = position
+        else:
+            previous = min(position + size, length)
+    pieces.append(codes[previous:])
+    return np.concatenate(pieces).tobytes().decode('ascii')
+
+
+def cohort(count, length=29903, seed=0, substitutionRate=0.001, indelRate=0.0001, prefix='sample'):
+    '''
+    Yield count (header, sequence) records: mutated copies of one seeded genome of the
+    given length, the first record being the unmutated reference.
+    '''
+    rng = np.random.default_rng(seed + 1)
+    genome = randomGenome(length, seed)
+    for index in range(count):
+        sequence = genome if index == 0 else mutateGenome(genome, rng, substitutionRate, indelRate)
+        yield '{}{} synthetic length={}'.format(prefix, index, len(sequence)), sequence
+
+
+def writeFasta(records, outFile=sys.stdout, lineWidth=60):
+    '''Write (header, sequence) records as fasta with lineWidth bases per line'''
+    for header, sequence in records:
+        outFile.write('>{}\n'.format(header))
+        for start in range(0, len(sequence), lineWidth):
+            outFile.write(sequence[start:start + lineWidth] + '\n')
+
+
+class CommandLine():
+    '''
+    Handle the command line, usage and help requests.
+    All arguments received from the commandline using .add_argument will be
+    avalable within the .args attribute of object instantiated from CommandLine.
+    '''
+
+    def __init__(self, inOpts=None):
+        '''
+        Implements a parser to interpret the command line argv string using argparse.
+        '''
+
+        import argparse
+        self.parser = argparse.ArgumentParser(
+            description='syntheticGenomes.py - writes seeded synthetic genomes and cohorts as fasta',
+            add_help=True,  # default is True
+            prefix_chars='-',
+            usage='%(prog)s [options] -option1[default] >output'
+            )
+        self.parser.add_argument('-l', '--length', type=int, default=29903, action='store',
+                                 help='genome length')
+        self.parser.add_argument('-n', '--records', type=int, default=1, action='store',
+                                 help='number of records, mutated copies of the first one')
+        self.parser.add_argument('-s', '--seed', type=int, default=0, action='store',
+                                 help='random seed')
+        self.parser.add_argument('-d', '--divergence', type=float, default=0.001, action='store',
+                                 help='substitution rate of the cohort records')
+        self.parser.add_argument('-i', '--indelRate', type=float, default=0.0001, action='store',
+                                 help='insertion and deletion rate of the cohort records')
+        if inOpts is None:
+            self.args = self.parser.parse_args()
+        else:
+            self.args = self.parser.parse_args(inOpts)
+
+
+def main(inCL=None):
+    '''
+    Write a synthetic genome or cohort in stdout
+    '''
+    myCommandLine = CommandLine(inCL)
+    args = myCommandLine.args
+    writeFasta(cohort(args.records, args.length, args.seed, args.divergence, args.indelRate), sys.stdout)
+
+if __name__ == "__main__":
+    main()
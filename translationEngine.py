@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+#####################################################################################################
+#
+#   Author: Carlos Arevalo (caeareva)
+#
+#   File: translationEngine.py
+#   Required module: numpy, orfEngine, packedSequence
+#   Purpose: table-driven translation of DNA and RNA sequences. Each NCBI genetic code is
+#            precompiled once into a 65-entry lookup table indexed by the orfEngine codon index,
+#            so a whole ORF, or a batch of ORFs, is translated with a single array lookup.
+#   Condition(s): codons holding N or any ambiguity code translate to X
+#
+#####################################################################################################
+
+import numpy as np
+
+import orfEngine
+from packedSequence import PackedSequence
+
+# NCBI genetic codes, amino acids and start codons listed in TCAG order (TTT, TTC, TTA, TTG, TCT, ...)
+geneticCodes = {
+    1: ('FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+        '---M------**--*----M---------------M----------------------------'),
+    2: ('FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSS**VVVVAAAADDEEGGGG',
+        '----------**--------------------MMMM----------**---M------------'),
+    3: ('FFLLSSSSYY**CCWWTTTTPPPPHHQQRRRRIIMMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+        '----------**----------------------MM---------------M------------'),
+    4: ('FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+        '--MM------**-------M------------MMMM---------------M------------'),
+    5: ('FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSSSSVVVVAAAADDEEGGGG',
+        '---M------**--------------------MMMM---------------M------------'),
+    6: ('FFLLSSSSYYQQCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+        '--------------*--------------------M----------------------------'),
+    9: ('FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNNKSSSSVVVVAAAADDEEGGGG',
+        '----------**-----------------------M---------------M------------'),
+    10: ('FFLLSSSSYY**CCCWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '----------**-----------------------M----------------------------'),
+    11: ('FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '---M------**--*----M------------MMMM---------------M------------'),
+    12: ('FFLLSSSSYY**CC*WLLLSPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '----------**--*----M---------------M----------------------------'),
+    13: ('FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSSGGVVVVAAAADDEEGGGG',
+         '---M------**----------------------MM---------------M------------'),
+    14: ('FFLLSSSSYYY*CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNNKSSSSVVVVAAAADDEEGGGG',
+         '-----------*-----------------------M----------------------------'),
+    16: ('FFLLSSSSYY*LCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '----------*---*--------------------M----------------------------'),
+    21: ('FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNNKSSSSVVVVAAAADDEEGGGG',
+         '----------**-----------------------M---------------M------------'),
+    22: ('FFLLSS*SYY*LCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '------*---*---*--------------------M----------------------------'),
+    23: ('FF*LSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '--*-------**--*-----------------M--M---------------M------------'),
+    24: ('FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSSKVVVVAAAADDEEGGGG',
+         '---M------**-------M---------------M---------------M------------'),
+    25: ('FFLLSSSSYY**CCGWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+         '---M------**-----------------------M---------------M------------'),
+}
+
+# nucleotide codes used for translation: the orfEngine codes, with U read as T
+rnaBaseCode = orfEngine.baseCode.copy()
+rnaBaseCode[ord('U')] = rnaBaseCode[ord('u')] = rnaBaseCode[ord('T')]
+
+
+def codonList():
+    '''Return the 64 codons in NCBI (TCAG) order'''
+    return [first + second + third for first in 'TCAG' for second in 'TCAG' for third in 'TCAG']
+
+
+def codonNumber(codon):
+    '''Return the orfEngine codon index (A=0, C=1, G=2, T=3) of a three letter codon'''
+    first, second, third = (int(rnaBaseCode[ord(base)]) for base in codon)
+    return (first << 4) | (second << 2) | third
+
+
+def startCodons(table=1):
+    '''Return the start codons (initiation codons) of an NCBI genetic code'''
+    aminoAcids, starts = geneticCodes[table]
+    return [codon for codon, start in zip(codonList(), starts) if start == 'M']
+
+
+def stopCodons(table=1):
+    '''Return the stop codons of an NCBI genetic code'''
+    aminoAcids, starts = geneticCodes[table]
+    return [codon for codon, aminoAcid in zip(codonList(), aminoAcids) if aminoAcid == '*']
+
+
+def encodeSequence(seq):
+    '''Encode a DNA or RNA string, bytes or PackedSequence into orfEngine nucleotide codes'''
+    if isinstance(seq, PackedSequence):
+        return seq.codes()
+    if isinstance(seq, str):
+        seq = seq.encode('ascii', 'replace')
+    return rnaBaseCode[np.frombuffer(seq, dtype=np.uint8)]
+
+
+class TranslationEngine():
+    '''
+    Translate whole sequences with a precompiled lookup table. The table has one byte per
+    codon index (64 codons plus the invalid codon index), so translation is a single
+    fancy-indexing operation over the codon indices of the frame.
+
+    instantiation:
+    engine = TranslationEngine(table=1, stopSymbol='-')
+    usage:
+    protein = engine.translate('ATGGCACTTTAA')
+    proteins = engine.translateBatch(['ATGGCA', 'ATGTAA'])
+    '''
+
+    def __init__(self, table=1, stopSymbol='*', unknown='X'):
+        '''Compile the lookup table of an NCBI genetic code'''
+        if table not in geneticCodes:
+            raise ValueError('Unknown genetic code {}, known codes: {}'.format(
+                table, ', '.join(str(code) for code in sorted(geneticCodes))))
+        self.table = table
+        self.stopSymbol = stopSymbol
+        self.unknown = unknown
+        aminoAcids, starts = geneticCodes[table]
+        self.lookup = np.full(orfEngine.invalidCodon + 1, ord(unknown), dtype=np.uint8)
+        for codon, aminoAcid in zip(codonList(), aminoAcids):
+            self.lookup[codonNumber(codon)] = ord(stopSymbol if aminoAcid == '*' else aminoAcid)
+
+    def translateCodon(self, codon):
+        '''Translate a single codon into a one letter amino acid'''
+        if len(codon) != 3:
+            return chr(self.lookup[orfEngine.invalidCodon])
+        codes = encodeSequence(codon)
+        return chr(self.lookup[orfEngine.codonIndices(codes)[0]])
+
+    def translateCodes(self, codes, start=0):
+        '''Translate encoded nucleotides from start, reading full codons only'''
+        codons = orfEngine.codonIndices(codes)[start::3]
+        return self.lookup[codons].tobytes().decode('ascii')
+
+    def translate(self, seq, start=0):
+        '''Translate a DNA or RNA sequence (str, bytes, PackedSequence or encoded array) from start'''
+        codes = seq if isinstance(seq, np.ndarray) else encodeSequence(seq)
+        return self.translateCodes(codes, start)
+
+    def translateBatch(self, seqs, start=0):
+        '''
+        Translate a batch of sequences in one vectorized call. Sequences are encoded into one
+        concatenated array and the codon positions of every sequence are gathered at once.
+        '''
+        seqs = [seq if isinstance(seq, (bytes, bytearray)) else seq.toBytes() if isinstance(seq, PackedSequence)
+                else seq.encode('ascii', 'replace') for seq in seqs]
+        if not seqs:
+            return []
+        lengths = np.array([len(seq) for seq in seqs], dtype=np.int64)
+        offsets = np.zeros(len(seqs), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        codes = rnaBaseCode[np.frombuffer(b''.join(seqs), dtype=np.uint8)]
+        # number of full codons of every sequence from the start offset
+        counts = np.maximum(lengths - start, 0) // 3
+        firstCodon = np.repeat(offsets + start, counts)
+        codonOrder = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        positions = firstCodon + 3 * codonOrder
+        codons = orfEngine.codonIndices(codes)[positions] if len(positions) else np.empty(0, dtype=np.uint8)
+        protein = self.lookup[codons].tobytes().decode('ascii')
+        bounds = np.concatenate(([0], np.cumsum(counts))).tolist()
+        return [protein[bounds[index]:bounds[index + 1]] for index in range(len(seqs))]
+
+    def translateFrames(self, seq):
+        '''
+        Translate the three forward (+1, +2, +3) and three reverse complement (-1, -2, -3)
+        frames of a sequence in one pass. The sequence is encoded once, each strand gets its
+        codon indices and lookup once, and the frames are strided views of that lookup.
+        Return a list of (frame, protein) tuples.
+        '''
+        codes = seq if isinstance(seq, np.ndarray) else encodeSequence(seq)
+        frames = []
+        for strand, strandCodes in ((1, codes), (-1, orfEngine.reverseCodes(codes))):
+            residues = self.lookup[orfEngine.codonIndices(strandCodes)]
+            for offset in range(3):
+                frames.append((strand * (offset + 1), residues[offset::3].tobytes().decode('ascii')))
+        return frames